@@ -4,7 +4,7 @@ if os.getenv("USE_EVENTLET", "false").lower() == "true":
     import eventlet
     eventlet.monkey_patch()
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from routes.consultation_routes import consultation_bp
@@ -26,7 +26,10 @@ from routes.department_routes import department_bp  # <-- new import
 from routes.semester_routes import semester_routes  # new import for semester endpoints
 from routes.enrollment_routes import enrollment_bp  # new import for enrollment endpoints
 from routes.homestudent_routes import homestudent_routes_bp #
-from services.scheduler_service import initialize_scheduler, check_appointments_1h, check_appointments_24h
+from services.scheduler_service import initialize_scheduler, check_appointments_1h, check_appointments_24h, get_scheduler_metrics
+from services import metrics_service
+from services.notification_dispatcher import drain as drain_notifications
+from services.transcription_jobs import recover_jobs
 from routes.reminder_routes import reminder_bp
 from routes.comparative_analysis_routes import comparative_bp  
 from routes.polycon_analysis_routes import polycon_analysis_bp # new import for comparative analysis
@@ -35,6 +38,8 @@ import atexit
 import threading
 import time
 
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() == "true"
+
 def create_app():
     app = Flask(__name__)
     CORS(app, resources={
@@ -46,12 +51,14 @@ def create_app():
     })
 
     socketio = init_socket(app)  # Initialize socket with app
+    atexit.register(drain_notifications)  # Emit queued notifications before exiting
 
     # Register blueprints
     app.register_blueprint(user_bp, url_prefix='/user')  # <-- new registration
     app.register_blueprint(booking_bp, url_prefix='/bookings')  # Remove the /bookings prefix
     app.register_blueprint(search_bp, url_prefix='/search')  # NEW registration for search endpoints
     app.register_blueprint(reminder_bp, url_prefix='/reminder')  # Register reminder routes
+    app.register_blueprint(notification_bp)  # Notification inbox (/notifications)
 
     @app.route('/')
     def home():
@@ -60,6 +67,7 @@ def create_app():
 
     # Register the consultation routes as a blueprint
     app.register_blueprint(consultation_bp, url_prefix='/consultation')
+    threading.Thread(target=recover_jobs, daemon=True).start()  # Resume transcription jobs left by a restart
 
     # Register the account management routes as a blueprint
     app.register_blueprint(acc_management_bp, url_prefix='/account')
@@ -90,49 +98,61 @@ def create_app():
                        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
     logger = logging.getLogger("app")
 
-    try:
-        # Initialize the scheduler
-        logger.info("Initializing appointment reminder scheduler...")
-        scheduler = initialize_scheduler()
-        logger.info("Scheduler initialized successfully")
+    # Reminder jobs can run in a dedicated process instead (see scheduler_worker.py),
+    # which is required when several web workers serve the app.
+    scheduler = None
+    if RUN_SCHEDULER:
+        try:
+            # Initialize the scheduler
+            logger.info("Initializing appointment reminder scheduler...")
+            scheduler = initialize_scheduler()
+            logger.info("Scheduler initialized successfully")
         
-        # Register a function to stop the scheduler when the app exits
-        atexit.register(lambda: scheduler.shutdown(wait=False))
+            # Register a function to stop the scheduler when the app exits
+            atexit.register(lambda: scheduler.shutdown(wait=False))
         
-        # Run an initial check to make sure everything is working
-        logger.info("Running initial check for upcoming appointments...")
-        threading.Thread(target=check_appointments_1h).start()
+            # Run an initial check to make sure everything is working
+            logger.info("Running initial check for upcoming appointments...")
+            threading.Thread(target=check_appointments_1h).start()
         
-        # Add a health check thread to keep the scheduler alive
-        def scheduler_health_check():
-            while True:
-                # Log scheduler status every 5 minutes
-                time.sleep(300)  # 5 minutes
-                if not scheduler.running:
-                    logger.error("Scheduler stopped running! Attempting to restart...")
-                    initialize_scheduler()
-                else:
-                    logger.info("Scheduler health check: Running normally")
+            # Add a health check thread to keep the scheduler alive
+            def scheduler_health_check():
+                while True:
+                    # Log scheduler status every 5 minutes
+                    time.sleep(300)  # 5 minutes
+                    if not scheduler.running:
+                        logger.error("Scheduler stopped running! Attempting to restart...")
+                        initialize_scheduler()
+                    else:
+                        logger.info("Scheduler health check: Running normally")
                     
-                # Check how many jobs are scheduled
-                jobs = scheduler.get_jobs()
-                logger.info(f"Active scheduled jobs: {len(jobs)}")
-                for job in jobs:
-                    logger.info(f"Job: {job.id}, Next run: {job.next_run_time}")
+                    # Check how many jobs are scheduled
+                    jobs = scheduler.get_jobs()
+                    logger.info(f"Active scheduled jobs: {len(jobs)}")
+                    for job in jobs:
+                        logger.info(f"Job: {job.id}, Next run: {job.next_run_time}")
         
-        # Start the health check thread
-        health_check_thread = threading.Thread(target=scheduler_health_check, daemon=True)
-        health_check_thread.start()
-        logger.info("Scheduler health check thread started")
+            # Start the health check thread
+            health_check_thread = threading.Thread(target=scheduler_health_check, daemon=True)
+            health_check_thread.start()
+            logger.info("Scheduler health check thread started")
         
-    except Exception as e:
-        logger.error(f"Error initializing scheduler: {str(e)}")
-        # Don't let scheduler issues prevent app from starting
+        except Exception as e:
+            logger.error(f"Error initializing scheduler: {str(e)}")
+            # Don't let scheduler issues prevent app from starting
 
     # Add a scheduler status endpoint
     @app.route('/scheduler/status', methods=['GET'])
     def scheduler_status():
         try:
+            if scheduler is None:
+                return jsonify({
+                    'running': False,
+                    'jobs': [],
+                    'message': 'Scheduler is disabled in this process (RUN_SCHEDULER=false)',
+                    'server_time': datetime.datetime.now().isoformat()
+                }), 200
+
             is_running = scheduler.running
             jobs = scheduler.get_jobs()
             job_info = []
@@ -148,6 +168,7 @@ def create_app():
             return jsonify({
                 'running': is_running,
                 'jobs': job_info,
+                'metrics': get_scheduler_metrics(),
                 'server_time': datetime.datetime.now().isoformat()
             }), 200
         except Exception as e:
@@ -155,8 +176,15 @@ def create_app():
                 'error': f"Error checking scheduler status: {str(e)}"
             }), 500
 
+    # Prometheus-style metrics endpoint (scheduler, notifications, pipelines)
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if request.args.get('format') == 'json':
+            return jsonify(metrics_service.snapshot()), 200
+        return Response(metrics_service.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
     # Initialize the scheduler for appointment reminders
-    if not app.config.get('TESTING', False):
+    if RUN_SCHEDULER and not app.config.get('TESTING', False):
         initialize_scheduler()
         app.logger.info("Appointment reminder scheduler initialized")
     
@@ -164,14 +192,6 @@ def create_app():
 
 app = create_app()
 
-@socketio.on('connect')
-def handle_connect():
-    print('Client connected')
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    print('Client disconnected')
-
 if __name__ == '__main__':
     # Enable WebSocket support
     socketio.run(app, debug=True, port=5001, allow_unsafe_werkzeug=True)
@@ -0,0 +1,64 @@
+"""
+Micro-benchmarks for utils.schedule_parser.
+
+Compares the per-parse cost of the shared parser (cold and memoized)
+against the previous scheduler chain, which in practice always ended in
+an inline `from dateutil import parser` + `parser.parse` call.
+
+Run from backend-python/:
+    python -m benchmarks.bench_schedule_parser
+"""
+import datetime
+import timeit
+
+from utils import schedule_parser
+
+try:
+    from dateutil import parser as dateutil_parser
+except ImportError:
+    dateutil_parser = None
+
+NUMBER = 20000
+
+SAMPLES = {
+    "canonical": "2025-03-10T06:00:00Z",
+    "canonical_fraction": "2025-03-10T06:00:00.250000Z",
+    "offset": "2025-03-10T14:00:00+08:00",
+    "naive_minutes": "2025-03-10T14:00",
+    "free_form": "March 10, 2025 2:00 PM",  # needs dateutil
+}
+
+
+def legacy_parse(value):
+    """The effective pre-refactor path of parse_booking_time."""
+    from dateutil import parser
+    parsed = parser.parse(value)
+    if not parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def per_call_us(stmt):
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def main():
+    print(f"{'sample':<20} {'legacy':>10} {'uncached':>10} {'shared':>10}   (us/parse)")
+    for name, value in SAMPLES.items():
+        legacy = per_call_us(lambda: legacy_parse(value)) if dateutil_parser else float("nan")
+
+        def uncached():
+            schedule_parser._fallback_parse.cache_clear()
+            schedule_parser.parse_schedule(value)
+        cold = per_call_us(uncached)
+
+        schedule_parser.parse_schedule(value)  # warm the memo
+        shared = per_call_us(lambda: schedule_parser.parse_schedule(value))
+
+        print(f"{name:<20} {legacy:>10.2f} {cold:>10.2f} {shared:>10.2f}")
+
+    print(f"\nfallback cache: {schedule_parser.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
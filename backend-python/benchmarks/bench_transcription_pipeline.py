@@ -0,0 +1,190 @@
+"""
+Load test for the transcription pipeline behind /consultation/transcribe.
+
+Posts synthetic recordings at a fixed concurrency, polls each job until it
+finishes and reports end-to-end latency, overall throughput and the time
+spent in every pipeline stage (from the job result's "timings").
+
+By default the consultation blueprint runs in-process with every external
+provider replaced by its local stand-in (LOCAL_PROVIDERS=all, see
+services/local_providers.py); set LOCAL_<NAME>_LATENCY and
+LOCAL_<NAME>_ERROR_RATE to shape them. ffmpeg is still required. With --url
+the requests go to a running backend instead, which must be started with
+the providers it should use.
+
+Run from backend-python/:
+    python -m benchmarks.bench_transcription_pipeline --requests 20 --concurrency 4
+    LOCAL_LLM_LATENCY=3 python -m benchmarks.bench_transcription_pipeline --notes
+"""
+import os
+import io
+import json
+import time
+import wave
+import argparse
+import tempfile
+import statistics
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_RATE = 16000
+NOTES = "Discussed the project draft; follow up on the data set next week."
+TERMINAL_STATUSES = ("done", "failed")
+
+
+# High bytes of 16-bit samples, folded so the noise stays around -18 dBFS:
+# quieter than speech but above the silence threshold
+_QUIET = bytes(value & 0x0F if value < 0x80 else value | 0xF0 for value in range(256))
+
+
+def synthetic_wav(seconds):
+    """16kHz mono WAV of random noise; no two hit the transcription cache."""
+    frames = bytearray(os.urandom(int(seconds * SAMPLE_RATE) * 2))
+    frames[1::2] = bytes(frames[1::2]).translate(_QUIET)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(SAMPLE_RATE)
+        target.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+class InProcessClient:
+    """Consultation blueprint on a Flask test client, with local providers."""
+
+    def __init__(self):
+        os.environ.setdefault("LOCAL_PROVIDERS", "all")
+        # Keep benchmark results out of the real caches
+        cache_dir = tempfile.mkdtemp(prefix="bench-transcription-")
+        os.environ.setdefault("TRANSCRIPTION_CACHE_PATH", os.path.join(cache_dir, "transcriptions.sqlite3"))
+        os.environ.setdefault("LLM_CACHE_PATH", os.path.join(cache_dir, "llm.sqlite3"))
+        from flask import Flask
+        from routes.consultation_routes import consultation_bp
+        from services import transcription_jobs
+
+        app = Flask(__name__)
+        app.register_blueprint(consultation_bp, url_prefix='/consultation')
+        self._app = app
+        self.workers = transcription_jobs.TRANSCRIPTION_WORKERS
+
+    def post(self, path, body, content_type):
+        response = self._app.test_client().post(path, data=body, content_type=content_type)
+        return response.status_code, response.get_json()
+
+    def get(self, path):
+        response = self._app.test_client().get(path)
+        return response.status_code, response.get_json()
+
+
+class HttpClient:
+    """A running backend at base_url."""
+
+    def __init__(self, base_url, workers):
+        self._base_url = base_url.rstrip('/')
+        self.workers = workers
+
+    def _send(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b"null")
+
+    def post(self, path, body, content_type):
+        request = urllib.request.Request(self._base_url + path, data=body, method='POST',
+                                         headers={'Content-Type': content_type})
+        return self._send(request)
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self._base_url + path))
+
+
+def run_one(client, args):
+    """Submit one recording and wait for its job; returns a record of what happened."""
+    audio = synthetic_wav(args.seconds)
+    query = {'speaker_count': args.speakers, 'duration': args.seconds}
+    if args.notes:
+        query['notes'] = NOTES
+    started = time.monotonic()
+    status, body = client.post(f"/consultation/transcribe?{urllib.parse.urlencode(query)}", audio, 'audio/wav')
+    submitted = time.monotonic() - started
+    if status != 202:
+        return {'ok': False, 'error': f"HTTP {status}: {(body or {}).get('error')}", 'submit': submitted}
+
+    job_id = body['job_id']
+    while True:
+        time.sleep(args.poll)
+        status, job = client.get(f"/consultation/transcribe/{job_id}")
+        if status != 200:
+            return {'ok': False, 'error': f"HTTP {status} polling job", 'submit': submitted}
+        if job['status'] in TERMINAL_STATUSES:
+            break
+    record = {'ok': job['status'] == 'done', 'submit': submitted, 'latency': time.monotonic() - started}
+    if record['ok']:
+        record['timings'] = job['result'].get('timings', {})
+    else:
+        record['error'] = job.get('error')
+    return record
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def report(records, wall, args, workers):
+    done = [record for record in records if record['ok']]
+    print(f"{len(records)} requests, concurrency {args.concurrency}, {args.seconds:.0f}s of audio each, "
+          f"{workers} transcription workers")
+    print(f"completed {len(done)}, failed {len(records) - len(done)} in {wall:.1f}s: "
+          f"{len(done) / wall:.2f} jobs/s, {len(done) * args.seconds / wall:.1f}s of audio per second")
+    for error, count in Counter(record['error'] for record in records if not record['ok']).most_common(5):
+        print(f"  {count} x {error}")
+    if not done:
+        return
+
+    submit = [record['submit'] for record in records]
+    latency = [record['latency'] for record in done]
+    print(f"submit   p50 {percentile(submit, 0.5):7.3f}s  p95 {percentile(submit, 0.95):7.3f}s")
+    print(f"job      p50 {percentile(latency, 0.5):7.3f}s  p95 {percentile(latency, 0.95):7.3f}s")
+
+    stages = defaultdict(list)
+    for record in done:
+        for stage, seconds in record['timings'].items():
+            stages[stage].append(seconds)
+    # jobs/s is what the stage alone could sustain on every worker, so the
+    # lowest figure marks the bottleneck (stages in side threads overlap)
+    print(f"\n{'stage':<16} {'jobs':>5} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8} {'jobs/s':>8}")
+    for stage, values in sorted(stages.items(), key=lambda item: item[0] == 'total'):
+        mean = statistics.mean(values)
+        capacity = workers / mean if mean else float('inf')
+        print(f"{stage:<16} {len(values):>5} {mean:>8.3f} {percentile(values, 0.5):>8.3f} "
+              f"{percentile(values, 0.95):>8.3f} {max(values):>8.3f} {capacity:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('--requests', type=int, default=20, help="recordings to submit")
+    parser.add_argument('--concurrency', type=int, default=4, help="recordings in flight at once")
+    parser.add_argument('--seconds', type=float, default=60, help="length of each recording")
+    parser.add_argument('--speakers', type=int, default=2, help="speaker_count sent with each recording")
+    parser.add_argument('--notes', action='store_true', help="send session notes, so jobs also summarize")
+    parser.add_argument('--poll', type=float, default=0.2, help="seconds between job status checks")
+    parser.add_argument('--url', help="base URL of a running backend, e.g. http://localhost:5000")
+    parser.add_argument('--workers', type=int, default=int(os.getenv("TRANSCRIPTION_WORKERS", "2")),
+                        help="TRANSCRIPTION_WORKERS of the backend at --url")
+    args = parser.parse_args()
+
+    client = HttpClient(args.url, args.workers) if args.url else InProcessClient()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        records = list(pool.map(lambda _: run_one(client, args), range(args.requests)))
+    report(records, time.monotonic() - started, args, client.workers)
+
+
+if __name__ == "__main__":
+    main()
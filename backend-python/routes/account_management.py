@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from services.firebase_service import db, register_user, login_user, auth_pyrebase
+from services.socket_service import issue_socket_token
 from google.cloud import firestore
 import bcrypt
 
@@ -169,10 +170,12 @@ def login():
         # Retrieve user details from Firestore
         user_ref = db.collection('user').where('email', '==', email).stream()
         user_data = None
+        user_doc_id = None
         teacher_id = None  # Variable to store teacher ID
 
         for doc in user_ref:
             user_data = doc.to_dict()
+            user_doc_id = doc.id
             if user_data.get('role') == 'faculty':  # Fetch teacher ID if faculty
                 teacher_id = user_data.get('ID')  # Get the teacher ID from Firestore
             break  # Get only the first matched document
@@ -190,7 +193,8 @@ def login():
             "firstName": user_data.get('firstName', ''),
             "lastName": user_data.get('lastName', ''),
             "studentId": user_data.get('ID') if user_data.get('role') == 'student' else None,
-            "teacherId": teacher_id if user_data.get('role') == 'faculty' else None  # Send teacher ID if faculty
+            "teacherId": teacher_id if user_data.get('role') == 'faculty' else None,  # Send teacher ID if faculty
+            "socketToken": issue_socket_token(user_doc_id, user_data.get('role'))  # Joins the user's notification rooms
         }), 200
 
     except Exception as e:
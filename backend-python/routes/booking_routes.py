@@ -4,8 +4,10 @@ from flask import Blueprint, request, jsonify
 from google.cloud import firestore
 from services.firebase_service import db
 from utils.firestore_utils import batch_fetch_documents
-from services.socket_service import socketio
-from datetime import datetime, timezone
+from utils.schedule_parser import normalize_schedule
+from services.socket_service import booking_rooms
+from services.notification_dispatcher import dispatch_to_rooms
+from services.notification_service import send_notification
 
 booking_bp = Blueprint('booking_routes', __name__)
 
@@ -67,15 +69,12 @@ def format_student_names(student_refs):
 
 # NEW: Helper function to convert schedule to ISO UTC format
 def convert_schedule_to_iso(schedule):
-    try:
-        dt = datetime.fromisoformat(schedule)
-    except Exception as e:
-        print(f"Error parsing schedule: {str(e)}")
+    # Naive schedules from the booking forms are in the server's local time
+    normalized = normalize_schedule(schedule, naive_as_local=True)
+    if normalized is None:
+        print(f"Error parsing schedule: {schedule}")
         return schedule  # Return original value if parsing fails
-    if dt.tzinfo is None:
-        dt = dt.astimezone()  # Treat naive as local
-    dt_utc = dt.astimezone(timezone.utc)
-    return dt_utc.isoformat().replace("+00:00", "Z")
+    return normalized
 
 @booking_bp.route('/get_teachers', methods=['GET'])
 def get_teachers():
@@ -371,13 +370,13 @@ def create_booking():
             teacher_user = db.collection('user').document(teacher_id).get().to_dict()
             notification_payload['targetEmail'] = teacher_user.get('email')
             notification_payload['targetTeacherId'] = teacher_id
-            socketio.emit('notification', notification_payload)
+            send_notification(notification_payload, recipient_id=teacher_id)
             
             # Also notify the requesting student
             student_notification = notification_payload.copy()
             student_notification['targetEmail'] = user_data.get('email')
             student_notification['targetStudentId'] = creator_id
-            socketio.emit('notification', student_notification)
+            send_notification(student_notification, recipient_id=creator_id)
         else:
             # If teacher created it, notify all students
             for student_id in student_ids:
@@ -387,21 +386,21 @@ def create_booking():
                     student_notification = notification_payload.copy()
                     student_notification['targetEmail'] = student_data.get('email')
                     student_notification['targetStudentId'] = student_id
-                    socketio.emit('notification', student_notification)
+                    send_notification(student_notification, recipient_id=student_id)
             
             # Also send a notification to the teacher who created it
             teacher_notification = notification_payload.copy()
             teacher_notification['targetEmail'] = user_data.get('email')
             teacher_notification['targetTeacherId'] = teacher_id
-            socketio.emit('notification', teacher_notification)
+            send_notification(teacher_notification, recipient_id=teacher_id)
 
         # Emit booking_updated event for realtime appointment updates.
-        socketio.emit('booking_updated', {
+        dispatch_to_rooms('booking_updated', {
             'action': 'create',
             'bookingID': new_booking_id,
             'teacherID': teacher_id,
             'studentIDs': student_ids
-        })
+        }, booking_rooms(teacher_id, student_ids))
 
         # FIXED: Don't include the booking_data in the response since it contains DocumentReference objects
         # Instead, use plain strings
@@ -467,12 +466,12 @@ def confirm_booking():
         })
 
         # General booking update event - separate from notification
-        socketio.emit('booking_updated', {
+        dispatch_to_rooms('booking_updated', {
             'action': 'confirm',
             'bookingID': booking_id,
             'teacherID': teacher_id,
             'studentIDs': student_ids
-        })
+        }, booking_rooms(teacher_id, student_ids))
 
         # Format student names for display
         students_display = format_student_names(student_refs)
@@ -492,7 +491,7 @@ def confirm_booking():
             teacher_notification = notification_payload.copy()
             teacher_notification['targetEmail'] = teacher_data.get('email')
             teacher_notification['targetTeacherId'] = teacher_id
-            socketio.emit('notification', teacher_notification)
+            send_notification(teacher_notification, recipient_id=teacher_id)
 
         # Send targeted notifications to each student
         for student_ref in student_refs:
@@ -505,7 +504,7 @@ def confirm_booking():
                     student_notification = notification_payload.copy()
                     student_notification['targetEmail'] = student_email
                     student_notification['targetStudentId'] = student_id
-                    socketio.emit('notification', student_notification)
+                    send_notification(student_notification, recipient_id=student_id)
 
         _cache.clear()
         return jsonify({"message": "Booking confirmed successfully"}), 200
@@ -556,12 +555,12 @@ def cancel_booking():
         })
 
         # General booking update event
-        socketio.emit('booking_updated', {
+        dispatch_to_rooms('booking_updated', {
             'action': 'cancel',
             'bookingID': booking_id,
             'teacherID': teacher_id,
             'studentIDs': student_ids
-        })
+        }, booking_rooms(teacher_id, student_ids))
 
         # Format student names for display
         students_display = format_student_names(student_refs)
@@ -581,7 +580,7 @@ def cancel_booking():
             teacher_notification = notification_payload.copy()
             teacher_notification['targetEmail'] = teacher_data.get('email')
             teacher_notification['targetTeacherId'] = teacher_id
-            socketio.emit('notification', teacher_notification)
+            send_notification(teacher_notification, recipient_id=teacher_id)
 
         # Send targeted notifications to each student
         for student_ref in student_refs:
@@ -594,7 +593,7 @@ def cancel_booking():
                     student_notification = notification_payload.copy()
                     student_notification['targetEmail'] = student_email
                     student_notification['targetStudentId'] = student_id
-                    socketio.emit('notification', student_notification)
+                    send_notification(student_notification, recipient_id=student_id)
 
         _cache.clear()
         return jsonify({"message": "Booking canceled successfully"}), 200
@@ -1,17 +1,17 @@
-from flask import Blueprint, request, jsonify
-from services.google_storage import upload_audio
-from services.google_gemini import generate_summary
-from services.google_gemini import identify_roles_in_transcription
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from services.google_gemini import generate_summary, stream_summary, analyze_consultation
+from services import role_classifier
 from services.firebase_service import db, store_consultation_details
-import os
-import tempfile
-from services.audio_conversion_service import convert_audio
 from google.cloud.firestore_v1 import DocumentReference, SERVER_TIMESTAMP
 from cachetools import TTLCache  # NEW import for caching
 from google.cloud import firestore  # NEW import for query ordering
-from services.socket_service import socketio  # Add this import at the top
-from services.assemblyai_service import transcribe_audio_with_assemblyai
+from services.socket_service import booking_rooms
+from services.notification_dispatcher import dispatch_to_rooms
 from services.consultation_quality_service import calculate_consultation_quality
+from services.transcription_jobs import create_job, get_job
+from services.audio_conversion_service import convert_stream, ConversionBusy
+from services.chunked_upload import init_upload, get_upload, put_chunk, finalize_upload, UploadError
 
 consultation_bp = Blueprint('consultation', __name__)
 
@@ -45,6 +45,14 @@ def parse_department(dept):
     except Exception as e:
         return 'Unknown Department'
 
+def conversion_busy_response(e):
+    """429 telling the client when to retry a request that needs audio conversion."""
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+def server_sent_event(event, data):
+    """One text/event-stream message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @consultation_bp.route('/identify_roles', methods=['POST'])
 def identify_roles():
     try:
@@ -54,7 +62,7 @@ def identify_roles():
         if not transcription:
             return jsonify({"error": "Transcription is required"}), 400
 
-        role_identified_transcription = identify_roles_in_transcription(transcription)
+        role_identified_transcription = role_classifier.identify_roles(transcription)
         return jsonify({"role_identified_transcription": role_identified_transcription})
 
     except Exception as e:
@@ -62,49 +70,109 @@ def identify_roles():
     
 @consultation_bp.route('/transcribe', methods=['POST'])
 def transcribe():
+    """
+    Queue a recording for transcription
+    
+    The audio is either the raw request body (any audio Content-Type, with the
+    parameters in the query string) or a multipart 'audio' file (parameters as
+    form fields). Either way it is piped through ffmpeg as it arrives.
+    
+    Parameters: speaker_count, duration (seconds, optional),
+    userID (optional; receives 'transcription_job' socket events),
+    notes (optional; the job result then includes the session summary)
+    
+    Returns 202 with {"job_id", "status"}; poll GET /transcribe/<job_id>.
+    """
     try:
-        if 'audio' not in request.files:
-            return jsonify({"error": "Audio file is required"}), 400
+        if request.files:
+            if 'audio' not in request.files:
+                return jsonify({"error": "Audio file is required"}), 400
+            stream, params = request.files['audio'].stream, request.form
+        else:
+            if not request.content_length:
+                return jsonify({"error": "Audio file is required"}), 400
+            stream, params = request.stream, request.args
 
-        audio_file = request.files['audio']
-        speaker_count = int(request.form.get('speaker_count', 1))
+        speaker_count = int(params.get('speaker_count', 1))
+        duration = float(params.get('duration', 0)) if 'duration' in params else None
 
-        # Save the raw audio file to a temporary directory
-        temp_dir = tempfile.gettempdir()
-        raw_path = os.path.join(temp_dir, audio_file.filename)
-        audio_file.save(raw_path)
+        converted_path = convert_stream(stream)
+        job_id = create_job(converted_path, speaker_count, duration, params.get('userID'),
+                            converted=True, notes=params.get('notes'))
 
-        # Convert the raw audio file and get the path of the converted file
-        converted_path = convert_audio(raw_path)
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except ConversionBusy as e:
+        return conversion_busy_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Upload the converted file to Google Cloud Storage and get the public URL
-        audio_url, _ = upload_audio(converted_path)
+@consultation_bp.route('/transcribe/<job_id>', methods=['GET'])
+def transcription_status(job_id):
+    """Status, stage and progress of a transcription job; 'result' once it is done."""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Transcribe the audio using AssemblyAI
-        transcription_data = transcribe_audio_with_assemblyai(converted_path, speaker_count)
-        
-        # Calculate consultation quality
-        duration = float(request.form.get('duration', 0)) if 'duration' in request.form else None
-        quality_score, quality_metrics = calculate_consultation_quality(
-            transcription_data["raw_sentiment_analysis"],
-            transcription_data["transcription_text"],
-            duration
-        )
 
-        # Clean up temporary files
-        os.remove(raw_path)
-        os.remove(converted_path)
+@consultation_bp.route('/uploads', methods=['POST'])
+def start_upload():
+    """
+    Start a resumable chunked upload of a recording
+    Example payload:
+    {
+        "speaker_count": 3,
+        "duration": 1800,          // optional, seconds
+        "userID": "user123",       // optional, receives 'transcription_job' events
+        "notes": "Concern: ..."    // optional, the job result then includes the summary
+    }
+    Then PUT /uploads/<upload_id>/chunks/<n> for n = 0, 1, ... (raw bytes) and
+    POST /uploads/<upload_id>/finalize. After a failure, GET /uploads/<upload_id>
+    and continue from next_chunk.
+    """
+    try:
+        data = request.json or {}
+        duration = data.get('duration')
+        status = init_upload(int(data.get('speaker_count', 1)),
+                             float(duration) if duration is not None else None,
+                             data.get('userID'), data.get('notes'))
+        return jsonify(status), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Process the transcription with Gemini to identify roles
-        processed_transcription = identify_roles_in_transcription(transcription_data["full_text"])
+@consultation_bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify(get_upload(upload_id)), 200
+    except UploadError as e:
+        return jsonify({"error": str(e), **e.details}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({
-            "audioUrl": audio_url,
-            "transcription": processed_transcription,
-            "quality_score": quality_score,
-            "quality_metrics": quality_metrics,
-            "raw_sentiment_analysis": transcription_data["raw_sentiment_analysis"]
-        })
+@consultation_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    try:
+        return jsonify(put_chunk(upload_id, index, request.stream, request.content_length)), 200
+    except UploadError as e:
+        return jsonify({"error": str(e), **e.details}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@consultation_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Assemble the upload and queue it for transcription; returns 202 with the job ID."""
+    try:
+        wav_path, meta = finalize_upload(upload_id)
+        job_id = create_job(wav_path, meta['speaker_count'], meta.get('duration'),
+                            meta.get('user_id'), converted=True, notes=meta.get('notes'))
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except ConversionBusy as e:
+        return conversion_busy_response(e)
+    except UploadError as e:
+        return jsonify({"error": str(e), **e.details}), e.status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -149,6 +217,58 @@ def summarize():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@consultation_bp.route('/summarize/stream', methods=['POST'])
+def summarize_stream():
+    """
+    Same as /summarize, but streamed as server-sent events while Gemini writes:
+    "delta" events carry {"text": ...} pieces, then a "done" event carries
+    {"summary": ...} with the full text, or an "error" event {"error": ...}.
+    """
+    data = request.json or {}
+    transcription = data.get('transcription')
+    notes = data.get('notes')
+
+    if not transcription or not notes:
+        return jsonify({"error": "Transcription and notes are required"}), 400
+
+    def events():
+        pieces = []
+        try:
+            for piece in stream_summary(f"{transcription} {notes}"):
+                pieces.append(piece)
+                yield server_sent_event('delta', {"text": piece})
+            yield server_sent_event('done', {"summary": "".join(pieces).strip()})
+        except Exception as e:
+            yield server_sent_event('error', {"error": str(e)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@consultation_bp.route('/analyze', methods=['POST'])
+def analyze():
+    """
+    Role labels, summary and sentiment of a transcript in one Gemini request
+    Example payload:
+    {
+        "transcription": "Speaker A: ...",
+        "notes": "Concern: ..."    // optional
+    }
+    Afterwards /identify_roles for the same transcription, and /summarize for
+    the returned role_identified_transcription with the same notes, are
+    answered from this result.
+    """
+    try:
+        data = request.json
+        transcription = data.get('transcription')
+        notes = data.get('notes') or ""
+
+        if not transcription:
+            return jsonify({"error": "Transcription is required"}), 400
+
+        return jsonify(analyze_consultation(transcription, notes))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @consultation_bp.route('/store_consultation', methods=['POST'])
 def store_consultation():
     try:
@@ -233,12 +353,14 @@ def store_consultation():
                     booking_data = booking_doc.to_dict()
                     booking_ref.delete()
                     print(f"✅ Booking {booking_id} deleted successfully")
-                    socketio.emit('booking_updated', {
+                    teacher_id = booking_data.get('teacherID').id if booking_data.get('teacherID') else None
+                    student_ids = [ref.id for ref in booking_data.get('studentID', [])]
+                    dispatch_to_rooms('booking_updated', {
                         'action': 'delete',
                         'bookingID': booking_id,
-                        'teacherID': booking_data.get('teacherID').id if booking_data.get('teacherID') else None,
-                        'studentIDs': [ref.id for ref in booking_data.get('studentID', [])]
-                    })
+                        'teacherID': teacher_id,
+                        'studentIDs': student_ids
+                    }, booking_rooms(teacher_id, student_ids))
             except Exception as del_err:
                 print(f"❌ Failed to delete booking {booking_id}: {del_err}")
                 
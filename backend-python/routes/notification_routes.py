@@ -1,20 +1,119 @@
 from flask import Blueprint, request, jsonify
 from services.firebase_service import db
+from services.notification_service import save_notification, sanitize_for_socket
 from google.cloud import firestore
 
 notification_bp = Blueprint('notification_routes', __name__)
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
 @notification_bp.route('/notifications', methods=['GET'])
 def get_notifications():
+    """
+    Page through one user's inbox, newest first.
+
+    Query parameters:
+    - userID: recipient user ID (required)
+    - limit: page size (default 20, max 100)
+    - cursor: next_cursor from the previous page
+    """
     try:
-        # Fetch notifications from Firestore (stored in "notifications" collection)
-        notifications_ref = db.collection('notifications').order_by("created_at", direction=firestore.Query.DESCENDING).stream()
+        user_id = request.args.get('userID')
+        if not user_id:
+            return jsonify({"error": "userID is required"}), 400
+
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+
+        # Served by the (recipient_id ASC, created_at DESC) composite index
+        query = db.collection('notifications') \
+                  .where('recipient_id', '==', user_id) \
+                  .order_by('created_at', direction=firestore.Query.DESCENDING)
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_doc = db.collection('notifications').document(cursor).get()
+            if not cursor_doc.exists or cursor_doc.get('recipient_id') != user_id:
+                return jsonify({"error": "Invalid cursor"}), 400
+            query = query.start_after(cursor_doc)
+
         notifications = []
-        for doc in notifications_ref:
-            n = doc.to_dict()
+        for doc in query.limit(limit).stream():
+            n = sanitize_for_socket(doc.to_dict())
             n['id'] = doc.id
             notifications.append(n)
-        return jsonify(notifications), 200
+
+        next_cursor = notifications[-1]['id'] if len(notifications) == limit else None
+        return jsonify({"notifications": notifications, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@notification_bp.route('/notifications/unread_count', methods=['GET'])
+def get_unread_count():
+    """Unread count from the per-user counter document (one read)."""
+    try:
+        user_id = request.args.get('userID')
+        if not user_id:
+            return jsonify({"error": "userID is required"}), 400
+
+        counter_doc = db.collection('notification_counters').document(user_id).get()
+        unread = counter_doc.to_dict().get('unread', 0) if counter_doc.exists else 0
+        return jsonify({"unread": max(unread, 0)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@notification_bp.route('/notifications/mark_read', methods=['POST'])
+def mark_read():
+    """
+    Mark notifications as read
+    Example payload:
+    {
+        "userID": "user123",
+        "ids": ["notifId1", "notifId2"]   // or "all": true
+    }
+    """
+    try:
+        data = request.json or {}
+        user_id = data.get('userID')
+        if not user_id:
+            return jsonify({"error": "userID is required"}), 400
+
+        notifications_ref = db.collection('notifications')
+        if data.get('all'):
+            docs = notifications_ref.where('recipient_id', '==', user_id) \
+                                    .where('read', '==', False).stream()
+        else:
+            ids = data.get('ids') or []
+            if not isinstance(ids, list):
+                return jsonify({"error": "ids must be a list"}), 400
+            docs = db.get_all([notifications_ref.document(i) for i in ids]) if ids else []
+
+        batch = db.batch()
+        marked = 0
+        for doc in docs:
+            if not doc.exists:
+                continue
+            doc_data = doc.to_dict()
+            if doc_data.get('recipient_id') != user_id or doc_data.get('read'):
+                continue
+            batch.update(doc.reference, {'read': True})
+            marked += 1
+            # Firestore batches are limited to 500 writes
+            if marked % 450 == 0:
+                batch.commit()
+                batch = db.batch()
+
+        counter_ref = db.collection('notification_counters').document(user_id)
+        if data.get('all'):
+            batch.set(counter_ref, {'unread': 0}, merge=True)
+        elif marked:
+            batch.set(counter_ref, {'unread': firestore.Increment(-marked)}, merge=True)
+        batch.commit()
+
+        return jsonify({"marked": marked}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -22,9 +121,12 @@ def get_notifications():
 def create_notification():
     try:
         data = request.json
-        # Expected fields: message, type, userEmail, etc.
-        data["created_at"] = firestore.SERVER_TIMESTAMP
-        db.collection('notifications').add(data)
-        return jsonify({"message": "Notification created successfully."}), 201
+        # Expected fields: message, type, recipient_id (or targetTeacherId/targetStudentId), etc.
+        if not (data.get('recipient_id') or data.get('targetTeacherId') or data.get('targetStudentId')):
+            return jsonify({"error": "recipient_id is required"}), 400
+        notification_id = save_notification(data)
+        if not notification_id:
+            return jsonify({"error": "Failed to save notification"}), 500
+        return jsonify({"message": "Notification created successfully.", "id": notification_id}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -268,7 +268,7 @@ def get_scheduler_status():
     """
     try:
         from apscheduler.schedulers.background import BackgroundScheduler
-        from services.scheduler_service import initialize_scheduler, get_scheduler_info
+        from services.scheduler_service import initialize_scheduler, get_scheduler_info, get_scheduler_metrics
         import threading
         import datetime  # Local import to ensure it's available
         
@@ -287,6 +287,7 @@ def get_scheduler_status():
             "scheduler_status": "running" if scheduler_running else "stopped",
             "server_time": current_time,
             "scheduler_info": scheduler_info,
+            "metrics": get_scheduler_metrics(),
             "check_performed": True,
             "threads": all_threads
         }), 200
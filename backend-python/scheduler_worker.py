@@ -0,0 +1,42 @@
+"""
+Standalone appointment reminder scheduler.
+
+Use this when the app runs on several web workers: start the workers with
+RUN_SCHEDULER=false and run exactly one instance of this process, e.g.
+
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python scheduler_worker.py
+
+Reminders are emitted through the Socket.IO message queue, so they reach
+clients connected to any web worker.
+"""
+import logging
+import signal
+import threading
+
+from services.socket_service import SOCKETIO_MESSAGE_QUEUE
+from services.scheduler_service import initialize_scheduler, check_appointments_1h
+from services.notification_dispatcher import drain
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+logger = logging.getLogger("scheduler_worker")
+
+
+def main():
+    if not SOCKETIO_MESSAGE_QUEUE:
+        logger.warning("SOCKETIO_MESSAGE_QUEUE is not set; reminders from this process will not reach any client")
+
+    scheduler = initialize_scheduler()
+    check_appointments_1h()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+
+    logger.info("Shutting down scheduler")
+    scheduler.shutdown(wait=False)
+    drain()
+
+
+if __name__ == '__main__':
+    main()
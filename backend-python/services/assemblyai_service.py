@@ -1,10 +1,11 @@
 import assemblyai as aai
 import os
+from services import local_providers
 
 # Set AssemblyAI API key from environment variable
 aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
 
-def transcribe_audio_with_assemblyai(file_path, speaker_count):
+def _transcribe_with_assemblyai(file_path, speaker_count):
     """Transcribes an audio file using AssemblyAI with speaker diarization and sentiment analysis enabled."""
 
     # Configure transcription settings with speaker diarization and sentiment analysis enabled
@@ -23,19 +24,10 @@ def transcribe_audio_with_assemblyai(file_path, speaker_count):
     for utterance in transcript.utterances:
         transcription_result += f"Speaker {utterance.speaker}: {utterance.text}\n"
 
-    # Format sentiment analysis results as text
-    sentiment_text = "\nSentiment Analysis:\n"
-    for sentiment_result in transcript.sentiment_analysis:
-        sentiment_text += f"Text: {sentiment_result.text}\n"
-        sentiment_text += f"Sentiment: {sentiment_result.sentiment}\n"
-        sentiment_text += f"Confidence: {sentiment_result.confidence}\n"
-        sentiment_text += f"Timestamp: {sentiment_result.start} - {sentiment_result.end}\n\n"
-    
-    # Return both formatted text and raw sentiment analysis data
+    # Sentiment stays structured; only the speaker-labelled utterances are
+    # ever sent on to the language model
     return {
         "transcription_text": transcription_result,
-        "sentiment_text": sentiment_text,
-        "full_text": transcription_result + sentiment_text,
         "raw_sentiment_analysis": [
             {
                 "text": result.text,
@@ -46,4 +38,10 @@ def transcribe_audio_with_assemblyai(file_path, speaker_count):
             }
             for result in transcript.sentiment_analysis
         ]
-    }
\ No newline at end of file
+    }
+
+# LOCAL_PROVIDERS=transcription swaps in the offline stand-in
+if local_providers.uses_local("transcription"):
+    transcribe_audio_with_assemblyai = local_providers.transcribe_audio
+else:
+    transcribe_audio_with_assemblyai = _transcribe_with_assemblyai
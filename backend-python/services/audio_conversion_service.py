@@ -1,17 +1,322 @@
-from pydub import AudioSegment
 import os
+import time
 import uuid
+import tempfile
+import threading
+import subprocess
+from services import metrics_service
 
 UPLOAD_FOLDER = "uploads/"
 CONVERTED_FOLDER = "converted/"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CONVERTED_FOLDER, exist_ok=True)
 
-def convert_audio(input_path):
-    # Generate a unique filename for the converted file
-    output_path = os.path.join("converted", f"converted_{uuid.uuid4().hex}.wav")
-    audio = AudioSegment.from_file(input_path)
-    # Convert to 16kHz, mono, 16-bit (sample_width=2 means 16-bit)
-    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-    audio.export(output_path, format="wav")
-    return output_path
\ No newline at end of file
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# Bytes copied from the request into ffmpeg per read
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Format of the archival copy stored in GCS for playback: "opus" (Ogg Opus at
+# AUDIO_ARCHIVE_BITRATE), "flac" (lossless) or "wav" (store the 16-bit PCM
+# transcription file itself). The WAV is only kept while it is transcribed.
+AUDIO_ARCHIVE_FORMAT = os.getenv("AUDIO_ARCHIVE_FORMAT", "opus").lower()
+AUDIO_ARCHIVE_BITRATE = os.getenv("AUDIO_ARCHIVE_BITRATE", "24k")
+
+# format -> (file extension, content type, ffmpeg encoder arguments)
+ARCHIVE_FORMATS = {
+    "opus": (".ogg", "audio/ogg", ["-c:a", "libopus", "-b:a", AUDIO_ARCHIVE_BITRATE, "-application", "voip"]),
+    "flac": (".flac", "audio/flac", ["-c:a", "flac", "-compression_level", "8"]),
+    "wav": (".wav", "audio/wav", None),
+}
+if AUDIO_ARCHIVE_FORMAT not in ARCHIVE_FORMATS:
+    raise ValueError(f"AUDIO_ARCHIVE_FORMAT must be one of {', '.join(ARCHIVE_FORMATS)}")
+
+# Conversions run as ffmpeg child processes, at most AUDIO_CONVERSION_WORKERS at
+# a time. Up to AUDIO_CONVERSION_QUEUE more wait (at most
+# AUDIO_CONVERSION_MAX_WAIT seconds) for a free slot; beyond that requests are
+# turned away with ConversionBusy so the route can answer 429.
+AUDIO_CONVERSION_WORKERS = max(int(os.getenv("AUDIO_CONVERSION_WORKERS", str(os.cpu_count() or 2))), 1)
+AUDIO_CONVERSION_QUEUE = int(os.getenv("AUDIO_CONVERSION_QUEUE", "8"))
+AUDIO_CONVERSION_MAX_WAIT = float(os.getenv("AUDIO_CONVERSION_MAX_WAIT", "30"))
+AUDIO_CONVERSION_RETRY_AFTER = int(os.getenv("AUDIO_CONVERSION_RETRY_AFTER", "10"))
+
+metrics_service.describe("audio_conversion_queue_wait_seconds", "Time conversions waited for an ffmpeg slot")
+metrics_service.describe("audio_conversion_seconds", "Time from starting ffmpeg to a finished WAV file")
+metrics_service.describe("audio_conversion_rejected_total", "Conversions turned away because every slot and queue place was taken")
+metrics_service.describe("audio_conversion_active", "ffmpeg conversions currently running")
+
+_slots = threading.BoundedSemaphore(AUDIO_CONVERSION_WORKERS)
+_state_lock = threading.Lock()
+_waiting = 0
+_active = 0
+
+class ConversionBusy(Exception):
+    """Every conversion slot is taken and the wait queue is full."""
+
+    def __init__(self, retry_after=AUDIO_CONVERSION_RETRY_AFTER):
+        super().__init__("Audio conversion is busy, retry later")
+        self.retry_after = retry_after
+
+def _acquire_slot(block=True, bounded=True):
+    """
+    Take a conversion slot
+
+    Args:
+        block (bool): Wait for a slot; otherwise return False right away
+        bounded (bool): Respect the queue limit and maximum wait (request
+            threads); background jobs pass False and wait as long as it takes
+
+    Returns:
+        bool: True once a slot is held, False if block=False and none was free
+
+    Raises:
+        ConversionBusy: bounded and the queue is full or the wait timed out
+    """
+    global _waiting, _active
+    if not block:
+        if not _slots.acquire(blocking=False):
+            return False
+    else:
+        if _slots.acquire(blocking=False):
+            metrics_service.observe("audio_conversion_queue_wait_seconds", 0.0)
+        else:
+            with _state_lock:
+                if bounded and _waiting >= AUDIO_CONVERSION_QUEUE:
+                    metrics_service.inc("audio_conversion_rejected_total")
+                    raise ConversionBusy()
+                _waiting += 1
+            started = time.monotonic()
+            try:
+                acquired = _slots.acquire(timeout=AUDIO_CONVERSION_MAX_WAIT if bounded else None)
+            finally:
+                with _state_lock:
+                    _waiting -= 1
+            metrics_service.observe("audio_conversion_queue_wait_seconds", time.monotonic() - started)
+            if not acquired:
+                metrics_service.inc("audio_conversion_rejected_total")
+                raise ConversionBusy()
+    with _state_lock:
+        _active += 1
+        metrics_service.set_gauge("audio_conversion_active", _active)
+    return True
+
+def _release_slot():
+    global _active
+    with _state_lock:
+        _active -= 1
+        metrics_service.set_gauge("audio_conversion_active", _active)
+    _slots.release()
+
+def _ffmpeg_command(source, output_path, pcm_output=False):
+    # 16kHz, mono, 16-bit PCM WAV; optionally the same samples as raw PCM on stdout
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", source,
+               "-ac", "1", "-ar", "16000", "-sample_fmt", "s16", "-f", "wav", "-y", output_path]
+    if pcm_output:
+        command += ["-ac", "1", "-ar", "16000", "-f", "s16le", "pipe:1"]
+    return command
+
+def _new_output_path():
+    return os.path.join(CONVERTED_FOLDER, f"converted_{uuid.uuid4().hex}.wav")
+
+class StreamConverter:
+    """
+    An ffmpeg process fed incrementally, writing a uniquely named WAV spool file.
+
+    Call write() with encoded audio as it arrives and finish() once it is all
+    in; abort() discards the conversion. A converter made by start() holds a
+    conversion slot until then.
+
+    With pcm_output the decoded 16kHz mono s16le samples are also readable
+    from `pcm` as they are produced; the caller must keep reading it.
+    """
+
+    def __init__(self, holds_slot=False, pcm_output=False):
+        self.output_path = _new_output_path()
+        self._holds_slot = holds_slot
+        self._started = time.monotonic()
+        try:
+            self._stderr = tempfile.TemporaryFile()
+            self._process = subprocess.Popen(_ffmpeg_command("pipe:0", self.output_path, pcm_output),
+                                             stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE if pcm_output else subprocess.DEVNULL,
+                                             stderr=self._stderr)
+        except Exception:
+            self._release()
+            raise
+        self.pcm = self._process.stdout
+        self._broken = False
+
+    @classmethod
+    def start(cls, block=True):
+        """
+        Take a conversion slot and start ffmpeg
+
+        Returns:
+            StreamConverter: or None when block=False and no slot is free
+
+        Raises:
+            ConversionBusy: block=True and the conversion queue is full
+        """
+        if not _acquire_slot(block=block):
+            return None
+        return cls(holds_slot=True)
+
+    def write(self, data):
+        if self._broken:
+            return
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError:
+            self._broken = True  # ffmpeg exited early; finish() reports why
+
+    def finish(self):
+        """Wait for ffmpeg and return the WAV path; raises RuntimeError if it failed."""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        self._release()
+        try:
+            if returncode != 0:
+                self._stderr.seek(0)
+                _remove_quietly(self.output_path)
+                raise RuntimeError(f"ffmpeg failed ({returncode}): {self._stderr.read().decode(errors='replace').strip()}")
+        finally:
+            self._stderr.close()
+        metrics_service.observe("audio_conversion_seconds", time.monotonic() - self._started)
+        return self.output_path
+
+    def abort(self):
+        self._process.kill()
+        self._process.wait()
+        self._release()
+        self._stderr.close()
+        _remove_quietly(self.output_path)
+
+    def _release(self):
+        if self._holds_slot:
+            self._holds_slot = False
+            _release_slot()
+
+def convert_stream(stream):
+    """
+    Pipe an audio stream through ffmpeg into a uniquely named WAV spool file.
+
+    The stream is copied in STREAM_CHUNK_SIZE pieces, so memory use does not
+    grow with the length of the recording.
+
+    Args:
+        stream: File-like object with the encoded audio (e.g. the request body)
+
+    Returns:
+        str: Path of the converted 16kHz mono WAV file
+
+    Raises:
+        ConversionBusy: no conversion slot is available
+    """
+    converter = StreamConverter.start()
+    try:
+        while True:
+            data = stream.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            converter.write(data)
+    except BaseException:
+        # Client disconnect mid-upload: free the slot and stop ffmpeg
+        converter.abort()
+        raise
+    return converter.finish()
+
+def convert_audio(input_path, bounded=True):
+    """
+    Convert an audio file on disk to a 16kHz mono WAV file and return its path.
+
+    Args:
+        input_path (str): Encoded audio file
+        bounded (bool): Give up with ConversionBusy when the conversion queue
+            is full (request threads); False waits for a slot (background jobs)
+    """
+    _acquire_slot(bounded=bounded)
+    output_path = _new_output_path()
+    started = time.monotonic()
+    try:
+        result = subprocess.run(_ffmpeg_command(input_path, output_path), stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        _release_slot()
+    metrics_service.observe("audio_conversion_seconds", time.monotonic() - started)
+    if result.returncode != 0:
+        _remove_quietly(output_path)
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    return output_path
+
+def encode_archive(wav_path, archive_format=None):
+    """
+    Encode the archival copy of a converted recording.
+
+    Args:
+        wav_path (str): 16kHz mono WAV produced by the conversion
+        archive_format (str): Key of ARCHIVE_FORMATS; defaults to AUDIO_ARCHIVE_FORMAT
+
+    Returns:
+        tuple: (path, content_type). For "wav" the path is wav_path itself;
+            otherwise it is a new file the caller removes.
+    """
+    extension, content_type, codec_args = ARCHIVE_FORMATS[archive_format or AUDIO_ARCHIVE_FORMAT]
+    if codec_args is None:
+        return wav_path, content_type
+
+    output_path = os.path.splitext(wav_path)[0] + extension
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", wav_path,
+               *codec_args, "-y", output_path]
+    # Archival encodes run inside transcription jobs, so they wait for a slot
+    _acquire_slot(bounded=False)
+    started = time.monotonic()
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        _release_slot()
+    metrics_service.observe("audio_conversion_seconds", time.monotonic() - started)
+    if result.returncode != 0:
+        _remove_quietly(output_path)
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    return output_path, content_type
+
+def detect_silences(wav_path, threshold_db, min_seconds):
+    """
+    Find silent stretches with ffmpeg's silencedetect (an energy detector).
+
+    Args:
+        wav_path (str): Converted recording
+        threshold_db (float): Level below which audio counts as silence
+        min_seconds (float): Shortest silence reported
+
+    Returns:
+        list: (start, end) pairs in seconds; end is None for a silence that
+            runs to the end of the file
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-nostats", "-i", wav_path,
+               "-af", f"silencedetect=noise={threshold_db}dB:d={min_seconds}", "-f", "null", "-"]
+    _acquire_slot(bounded=False)
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        _release_slot()
+    output = result.stderr.decode(errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {output.strip()}")
+
+    silences = []
+    for line in output.splitlines():
+        if "silence_start:" in line:
+            silences.append([float(line.split("silence_start:")[1].split()[0]), None])
+        elif "silence_end:" in line and silences:
+            silences[-1][1] = float(line.split("silence_end:")[1].split()[0])
+    return [tuple(silence) for silence in silences]
+
+def _remove_quietly(path):
+    if os.path.exists(path):
+        os.remove(path)
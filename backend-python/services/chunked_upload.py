@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from services.audio_conversion_service import StreamConverter, convert_audio, UPLOAD_FOLDER, STREAM_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Largest accepted chunk, and how long an unfinished upload is kept
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_TTL = int(os.getenv("UPLOAD_TTL", str(24 * 3600)))
+
+# A live ffmpeg feed holds a conversion slot; give it up after this many idle
+# seconds (the part file is converted at finalize instead). A background
+# sweeper checks every UPLOAD_LIVE_IDLE / 2 seconds, and also removes expired
+# uploads then.
+UPLOAD_LIVE_IDLE = int(os.getenv("UPLOAD_LIVE_IDLE", "300"))
+
+# Chunks must arrive in order. Each one is appended to uploads/<id>.part, which
+# is what makes an upload resumable, and is also fed to a live ffmpeg process
+# so conversion keeps pace with the upload. If that process is missing at
+# finalize (restart, chunks served by another worker, or no conversion slot
+# was free when the upload started), the part file is converted instead.
+
+# upload_id -> {'converter': StreamConverter, 'next_chunk': int, 'last_used': float}
+_live = {}
+# upload_id -> lock serializing its chunks within this process
+_locks = {}
+_locks_guard = threading.Lock()
+_sweeper_started = False
+
+class UploadError(Exception):
+    """Client-side problem with an upload request; carries the HTTP status."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+def _meta_path(upload_id):
+    return os.path.join(UPLOAD_FOLDER, f"{upload_id}.json")
+
+def _part_path(upload_id):
+    return os.path.join(UPLOAD_FOLDER, f"{upload_id}.part")
+
+def _lock(upload_id):
+    with _locks_guard:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+def _load(upload_id):
+    try:
+        uuid.UUID(upload_id)
+        with open(_meta_path(upload_id)) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        raise UploadError("Upload not found", 404)
+
+def _save(upload_id, meta):
+    tmp_path = _meta_path(upload_id) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _meta_path(upload_id))
+
+def _public(upload_id, meta):
+    return {
+        'upload_id': upload_id,
+        'next_chunk': meta['next_chunk'],
+        'bytes': meta['bytes'],
+        'finalized': meta.get('finalized', False),
+    }
+
+def init_upload(speaker_count=1, duration=None, user_id=None, notes=None):
+    """
+    Start a chunked upload
+
+    Returns:
+        dict: {'upload_id', 'next_chunk', 'bytes', 'finalized', 'max_chunk_bytes'}
+    """
+    _ensure_sweeper()
+    upload_id = str(uuid.uuid4())
+    meta = {
+        'speaker_count': speaker_count,
+        'duration': duration,
+        'user_id': user_id,
+        'notes': notes,
+        'next_chunk': 0,
+        'bytes': 0,
+        'created_at': time.time(),
+    }
+    open(_part_path(upload_id), 'wb').close()
+    _save(upload_id, meta)
+    status = _public(upload_id, meta)
+    status['max_chunk_bytes'] = UPLOAD_MAX_CHUNK_BYTES
+    return status
+
+def get_upload(upload_id):
+    """Where an upload stands, so a client can resume from next_chunk."""
+    return _public(upload_id, _load(upload_id))
+
+def put_chunk(upload_id, index, stream, content_length):
+    """
+    Append chunk `index` of an upload
+
+    Re-sending an already stored chunk is accepted and ignored, so a client
+    may retry any chunk whose response it did not see.
+
+    Raises:
+        UploadError: unknown upload, chunk out of order or too large
+    """
+    if content_length is None or content_length > UPLOAD_MAX_CHUNK_BYTES:
+        raise UploadError(f"Chunks must declare a Content-Length of at most {UPLOAD_MAX_CHUNK_BYTES} bytes", 413)
+    _ensure_sweeper()
+
+    with _lock(upload_id):
+        meta = _load(upload_id)
+        if meta.get('finalized'):
+            raise UploadError("Upload already finalized", 409, **_public(upload_id, meta))
+        if index < meta['next_chunk']:
+            return _public(upload_id, meta)
+        if index > meta['next_chunk']:
+            raise UploadError(f"Expected chunk {meta['next_chunk']}", 409, **_public(upload_id, meta))
+
+        live = _live_converter(upload_id, meta)
+        written = 0
+        try:
+            with open(_part_path(upload_id), 'r+b') as part:
+                # Drop anything a failed earlier attempt at this chunk left behind
+                part.truncate(meta['bytes'])
+                part.seek(meta['bytes'])
+                while written < content_length:
+                    data = stream.read(min(STREAM_CHUNK_SIZE, content_length - written))
+                    if not data:
+                        break
+                    part.write(data)
+                    if live:
+                        live['converter'].write(data)
+                    written += len(data)
+        except BaseException:
+            # Client disconnect (Werkzeug raises rather than returning b'')
+            # or a failed write; ffmpeg may have seen part of the chunk
+            _discard_live(upload_id)
+            raise
+
+        if written != content_length:
+            # Connection dropped mid-chunk; ffmpeg has already seen part of it
+            _discard_live(upload_id)
+            raise UploadError("Chunk body ended early", 400, **_public(upload_id, meta))
+
+        meta['next_chunk'] += 1
+        meta['bytes'] += written
+        _save(upload_id, meta)
+        if live:
+            live['next_chunk'] = meta['next_chunk']
+            live['last_used'] = time.monotonic()
+        return _public(upload_id, meta)
+
+def finalize_upload(upload_id):
+    """
+    Finish an upload and return the path of its converted WAV file
+
+    Returns:
+        tuple: (wav_path, meta) where meta holds speaker_count, duration, user_id, notes
+
+    Raises:
+        ConversionBusy: the part file needs converting and no slot is available
+    """
+    with _lock(upload_id):
+        meta = _load(upload_id)
+        if meta.get('finalized'):
+            raise UploadError("Upload already finalized", 409, **_public(upload_id, meta))
+        if meta['bytes'] == 0:
+            raise UploadError("No audio uploaded", 400, **_public(upload_id, meta))
+
+        live = _live.pop(upload_id, None)
+        if live and live['next_chunk'] == meta['next_chunk']:
+            wav_path = live['converter'].finish()
+        else:
+            if live:
+                live['converter'].abort()
+            wav_path = convert_audio(_part_path(upload_id))
+
+        meta['finalized'] = True
+        _save(upload_id, meta)
+        _remove_files(upload_id, keep_meta=True)
+        return wav_path, meta
+
+def _live_converter(upload_id, meta):
+    """The live ffmpeg feed for this upload, if it has seen every stored chunk."""
+    live = _live.get(upload_id)
+    if live and live['next_chunk'] != meta['next_chunk']:
+        # Another process stored chunks this one never fed to ffmpeg
+        _discard_live(upload_id)
+        live = None
+    if live is None and meta['next_chunk'] == 0:
+        converter = StreamConverter.start(block=False)
+        if converter:
+            live = _live[upload_id] = {'converter': converter, 'next_chunk': 0,
+                                       'last_used': time.monotonic()}
+    return live
+
+def _discard_idle_live():
+    cutoff = time.monotonic() - UPLOAD_LIVE_IDLE
+    for upload_id, live in list(_live.items()):
+        if live['last_used'] < cutoff:
+            with _lock(upload_id):
+                if _live.get(upload_id) is live:
+                    _discard_live(upload_id)
+
+def _ensure_sweeper():
+    global _sweeper_started
+    with _locks_guard:
+        if _sweeper_started:
+            return
+        _sweeper_started = True
+    threading.Thread(target=_sweep_loop, name="chunked-upload-sweeper", daemon=True).start()
+
+def _sweep_loop():
+    while True:
+        time.sleep(max(UPLOAD_LIVE_IDLE / 2, 1))
+        try:
+            _discard_idle_live()
+            cleanup_expired_uploads()
+        except Exception as e:
+            logger.error(f"Sweeping chunked uploads failed: {str(e)}")
+
+def _discard_live(upload_id):
+    live = _live.pop(upload_id, None)
+    if live:
+        live['converter'].abort()
+
+def _remove_files(upload_id, keep_meta=False):
+    paths = [_part_path(upload_id)] + ([] if keep_meta else [_meta_path(upload_id)])
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def cleanup_expired_uploads():
+    """Delete uploads (finished or not) older than UPLOAD_TTL."""
+    cutoff = time.time() - UPLOAD_TTL
+    for name in os.listdir(UPLOAD_FOLDER):
+        if not name.endswith('.json'):
+            continue
+        upload_id = name[:-len('.json')]
+        try:
+            if os.path.getmtime(os.path.join(UPLOAD_FOLDER, name)) >= cutoff:
+                continue
+            with _lock(upload_id):
+                _discard_live(upload_id)
+                _remove_files(upload_id)
+            with _locks_guard:
+                _locks.pop(upload_id, None)
+        except OSError as e:
+            logger.warning(f"Could not clean up upload {upload_id}: {str(e)}")
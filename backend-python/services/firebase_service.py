@@ -3,22 +3,28 @@ from firebase_admin import credentials, firestore, auth
 import pyrebase
 import os
 from dotenv import load_dotenv
+from services import local_providers
 
 # Load environment variables
 load_dotenv()
 
 firebase_creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-if not firebase_creds_path:
-    raise ValueError("Firebase credentials are not set in .env file.")
+if local_providers.uses_local("firestore"):
+    # In-memory stand-in (LOCAL_PROVIDERS=firestore); Firebase Auth calls
+    # still need the real project
+    db = local_providers.LocalFirestore()
+else:
+    if not firebase_creds_path:
+        raise ValueError("Firebase credentials are not set in .env file.")
 
-# Ensure Firebase Admin is initialized only once
-if not firebase_admin._apps:
-    cred = credentials.Certificate(firebase_creds_path)
-    firebase_admin.initialize_app(cred)
+    # Ensure Firebase Admin is initialized only once
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(firebase_creds_path)
+        firebase_admin.initialize_app(cred)
 
-# Get Firestore client
-db = firestore.client()
+    # Get Firestore client
+    db = firestore.client()
 
 # Pyrebase configuration
 firebase_config = {
@@ -1,14 +1,53 @@
 import os
+import re
+import json
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
+from services import llm_cache, metrics_service, local_providers
+from utils.transcript_parser import split_turns, format_turns, chunk_turns, role_labels
+
+logger = logging.getLogger(__name__)
 
 # Configure the API key correctly
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
-# Initialize the model
-model = genai.GenerativeModel(model_name="gemini-2.0-flash-lite-preview-02-05")
+# Initialize the model (LOCAL_PROVIDERS=llm answers with canned text instead)
+MODEL_NAME = "gemini-2.0-flash-lite-preview-02-05"
+if local_providers.uses_local("llm"):
+    model = local_providers.LocalGenerativeModel(model_name=MODEL_NAME)
+else:
+    model = genai.GenerativeModel(model_name=MODEL_NAME)
 
-def generate_summary(text):
-    prompt = (
+# Bump a version whenever its prompt wording changes, so cached responses to
+# the old prompt are no longer served
+SUMMARY_PROMPT_VERSION = 1
+ROLES_PROMPT_VERSION = 1
+SPEAKER_ROLES_PROMPT_VERSION = 1
+ANALYSIS_PROMPT_VERSION = 1
+SENTIMENT_PROMPT_VERSION = 1
+
+SENTIMENTS = ("POSITIVE", "NEGATIVE", "NEUTRAL")
+
+# Diarized transcripts longer than ROLES_CHUNK_CHARS are split on speaker
+# turns into chunks (overlapping by ROLES_CHUNK_OVERLAP_TURNS turns). Each
+# chunk only asks which speaker is the teacher; the votes are merged and the
+# labels applied locally, so every chunk is a small prompt with a short answer.
+ROLES_CHUNK_CHARS = int(os.getenv("ROLES_CHUNK_CHARS", "12000"))
+ROLES_CHUNK_OVERLAP_TURNS = int(os.getenv("ROLES_CHUNK_OVERLAP_TURNS", "2"))
+ROLES_CHUNK_WORKERS = max(int(os.getenv("ROLES_CHUNK_WORKERS", "8")), 1)
+
+metrics_service.describe("summary_first_token_seconds", "Time from a streamed summary request to its first text from Gemini")
+
+_roles_executor = ThreadPoolExecutor(max_workers=ROLES_CHUNK_WORKERS, thread_name_prefix="gemini-roles")
+
+# "A: Teacher", "Speaker B - student", ...
+_SPEAKER_ROLE_RE = re.compile(r"^\s*(?:Speaker\s+)?([A-Za-z0-9]+)\s*[:=-]\s*(Teacher|Student)", re.IGNORECASE | re.MULTILINE)
+
+def _summary_prompt(text):
+    return (
         "Please read the following conversation transcript carefully. "
         "Generate a concise summary that captures the key points discussed during the session. "
         "At the end of the summary, on a new line, state the overall sentiment of the session "
@@ -17,14 +56,66 @@ def generate_summary(text):
         "Conversation Transcript:\n"
         f"{text}"
     )
-    
+
+def generate_summary(text):
+    prompt = _summary_prompt(text)
+
+    cache_key = llm_cache.make_key("summary", SUMMARY_PROMPT_VERSION, MODEL_NAME, text)
+    cached = llm_cache.get(cache_key, "summary")
+    if cached is not None:
+        return cached
+
     try:
         response = model.generate_content(prompt)
-        return response.text.strip()
+        summary = response.text.strip()
     except Exception as e:
         return f"Error generating summary: {str(e)}"
+    llm_cache.put(cache_key, summary)
+    return summary
+
+def stream_summary(text):
+    """
+    Generate the same summary as generate_summary, yielding text as the
+    model produces it
+
+    A cached summary is yielded in one piece. Once the stream completes the
+    full text is cached, so generate_summary(text) is answered from it.
+
+    Yields:
+        str: Successive pieces of the summary
+
+    Raises:
+        Exception: the request failed (unlike generate_summary, which
+            returns an error string)
+    """
+    cache_key = llm_cache.make_key("summary", SUMMARY_PROMPT_VERSION, MODEL_NAME, text)
+    cached = llm_cache.get(cache_key, "summary")
+    if cached is not None:
+        yield cached
+        return
+
+    started = time.monotonic()
+    pieces = []
+    for chunk in model.generate_content(_summary_prompt(text), stream=True):
+        if not pieces:
+            metrics_service.observe("summary_first_token_seconds", time.monotonic() - started)
+        pieces.append(chunk.text)
+        yield chunk.text
+    llm_cache.put(cache_key, "".join(pieces).strip())
 
 def identify_roles_in_transcription(transcription):
+    cache_key = llm_cache.make_key("identify_roles", ROLES_PROMPT_VERSION, MODEL_NAME, transcription)
+    cached = llm_cache.get(cache_key, "identify_roles")
+    if cached is not None:
+        return cached
+
+    preamble, turns = split_turns(transcription)
+    if len(turns) > 1 and sum(len(text) for _, text in turns) > ROLES_CHUNK_CHARS:
+        annotated = _identify_roles_chunked(preamble, turns)
+        if not annotated.startswith("Error identifying roles"):
+            llm_cache.put(cache_key, annotated)
+        return annotated
+
     prompt = (
         "You are provided with a transcript of a conversation between a teacher and one or more students. "
         "Your task is to analyze the transcript and annotate each sentence with the correct role label. "
@@ -43,6 +134,201 @@ def identify_roles_in_transcription(transcription):
 
     try:
         response = model.generate_content(prompt)
-        return response.text.strip()  # Return the formatted role-annotated conversation
+        annotated = response.text.strip()  # The formatted role-annotated conversation
     except Exception as e:
         return f"Error identifying roles: {str(e)}"
+    llm_cache.put(cache_key, annotated)
+    return annotated
+
+def _identify_roles_chunked(preamble, turns):
+    """
+    Role-label a long diarized transcript chunk by chunk.
+
+    Chunks are classified concurrently on the roles pool. Each speaker gets
+    the votes of every chunk it speaks in, weighted by how much it says
+    there; the speaker with the strongest teacher vote is the teacher and the
+    rest are students, numbered in order of first appearance.
+    """
+    chunks = chunk_turns(turns, ROLES_CHUNK_CHARS, ROLES_CHUNK_OVERLAP_TURNS)
+    futures = [_roles_executor.submit(_classify_speakers, chunk) for chunk in chunks]
+
+    teacher_votes = defaultdict(float)
+    answered = 0
+    for chunk, future in zip(chunks, futures):
+        try:
+            roles = future.result()
+        except Exception as e:
+            logger.warning(f"Role identification failed for one transcript chunk: {str(e)}")
+            continue
+        answered += 1
+        spoken = defaultdict(int)
+        for speaker, text in chunk:
+            spoken[speaker] += len(text)
+        for speaker, role in roles.items():
+            if speaker in spoken:
+                teacher_votes[speaker] += spoken[speaker] if role == 'teacher' else -spoken[speaker]
+    if not answered:
+        return "Error identifying roles: no transcript chunk could be labelled"
+
+    speakers = list(dict.fromkeys(speaker for speaker, _ in turns))
+    teacher = max(speakers, key=lambda speaker: teacher_votes[speaker])
+    annotated = format_turns(turns, role_labels(turns, teacher))
+    return f"{preamble}\n{annotated}" if preamble else annotated
+
+def _classify_speakers(chunk):
+    """Ask which diarized speakers in one chunk are teachers; returns {speaker: 'teacher'|'student'}."""
+    excerpt = format_turns(chunk)
+    if len(excerpt) > ROLES_CHUNK_CHARS:
+        excerpt = excerpt[:ROLES_CHUNK_CHARS]
+    cache_key = llm_cache.make_key("speaker_roles", SPEAKER_ROLES_PROMPT_VERSION, MODEL_NAME, excerpt)
+    answer = llm_cache.get(cache_key, "speaker_roles")
+    if answer is None:
+        prompt = (
+            "The following is an excerpt from a transcript of a conversation between a teacher and one "
+            "or more students. Speakers are labelled by the transcription service (Speaker A, Speaker B, ...). "
+            "For each speaker label in the excerpt, say whether that speaker is the Teacher or a Student. "
+            "Answer with one line per speaker and nothing else, in the form:\n"
+            "A: Teacher\n"
+            "B: Student\n\n"
+            "Excerpt:\n"
+            f"{excerpt}"
+        )
+        answer = model.generate_content(prompt).text.strip()
+        roles = {speaker: role.lower() for speaker, role in _SPEAKER_ROLE_RE.findall(answer)}
+        if roles:
+            llm_cache.put(cache_key, answer)
+        return roles
+    return {speaker: role.lower() for speaker, role in _SPEAKER_ROLE_RE.findall(answer)}
+
+def analyze_consultation(transcription, notes=""):
+    """
+    Role labels, summary and overall sentiment of a session in one request.
+
+    Asks for a JSON response. For a diarized transcript the model only maps
+    speaker labels to roles (applied locally, as in the chunked path), so
+    the answer stays short however long the session is; other text is
+    annotated by the model. The result also seeds the caches of
+    identify_roles_in_transcription(transcription) and of
+    generate_summary(f"{role_identified_transcription} {notes}"), so the
+    separate endpoints answer from it.
+
+    Args:
+        transcription (str): Transcript, ideally with "Speaker X:" lines
+        notes (str): Session notes to take into account in the summary
+
+    Returns:
+        dict: role_identified_transcription, summary (summary text followed
+            by the sentiment on its own line, as generate_summary returns it)
+            and sentiment (POSITIVE, NEGATIVE or NEUTRAL)
+
+    Raises:
+        Exception: the request failed or the response was not usable
+    """
+    text = f"{transcription}\n\nNotes:\n{notes}" if notes else transcription
+    cache_key = llm_cache.make_key("analysis", ANALYSIS_PROMPT_VERSION, MODEL_NAME, text)
+    cached = llm_cache.get(cache_key, "analysis")
+    if cached is not None:
+        return cached
+
+    preamble, turns = split_turns(transcription)
+    diarized = len(turns) > 1
+    if diarized:
+        roles_instruction = (
+            '"speaker_roles": an object mapping each speaker label in the transcript (A, B, ...) '
+            'to either "Teacher" or "Student"; exactly one speaker is the teacher'
+        )
+    else:
+        roles_instruction = (
+            '"role_identified_transcription": the transcript with each sentence on its own line, prefixed '
+            'with "Teacher:" or "Student:" (use "Student 1:", "Student 2:", ... if there are several students)'
+        )
+    prompt = (
+        "You are provided with a transcript of a conversation between a teacher and one or more students"
+        + (", followed by the teacher's notes on the session" if notes else "") + ". "
+        "Respond with a JSON object with these keys:\n"
+        f"- {roles_instruction}\n"
+        '- "summary": a concise summary of the key points discussed during the session, without the word "Summary:"\n'
+        '- "sentiment": the overall sentiment of the session, one of "POSITIVE", "NEGATIVE" or "NEUTRAL"\n\n'
+        "Transcript:\n"
+        f"{text}"
+    )
+
+    response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+    answer = json.loads(response.text)
+    sentiment = str(answer.get("sentiment", "")).strip().upper()
+    summary = str(answer.get("summary", "")).strip()
+    if sentiment not in SENTIMENTS or not summary:
+        raise ValueError("Analysis response is missing the summary or sentiment")
+
+    if diarized:
+        roles = {str(speaker).replace("Speaker", "").strip(): str(role).strip().lower()
+                 for speaker, role in (answer.get("speaker_roles") or {}).items()}
+        teachers = [speaker for speaker, _ in turns if roles.get(speaker) == "teacher"]
+        if not teachers:
+            raise ValueError("Analysis response does not name a teacher")
+        annotated = format_turns(turns, role_labels(turns, teachers[0]))
+        annotated = f"{preamble}\n{annotated}" if preamble else annotated
+    else:
+        annotated = str(answer.get("role_identified_transcription", "")).strip()
+        if not annotated:
+            raise ValueError("Analysis response is missing the role-identified transcription")
+
+    result = {
+        "role_identified_transcription": annotated,
+        "summary": f"{summary}\n{sentiment}",
+        "sentiment": sentiment,
+    }
+    llm_cache.put(cache_key, result)
+    llm_cache.put(llm_cache.make_key("identify_roles", ROLES_PROMPT_VERSION, MODEL_NAME, transcription), annotated)
+    if notes:
+        llm_cache.put(llm_cache.make_key("summary", SUMMARY_PROMPT_VERSION, MODEL_NAME, f"{annotated} {notes}"),
+                      result["summary"])
+    return result
+
+def classify_sentiments(sentences):
+    """
+    Sentiment of each sentence, for transcripts whose provider supplies none
+    (live transcription)
+
+    Args:
+        sentences (list): Sentence texts
+
+    Returns:
+        list: One {"sentiment", "confidence"} per sentence, sentiment being
+            POSITIVE, NEGATIVE or NEUTRAL (NEUTRAL with confidence 0 where
+            the model gave no usable answer)
+
+    Raises:
+        Exception: the request failed
+    """
+    if not sentences:
+        return []
+    numbered = "\n".join(f"{number}. {sentence}" for number, sentence in enumerate(sentences, start=1))
+    cache_key = llm_cache.make_key("sentiment", SENTIMENT_PROMPT_VERSION, MODEL_NAME, numbered)
+    answer = llm_cache.get(cache_key, "sentiment")
+    if answer is None:
+        prompt = (
+            "Classify the sentiment of each numbered sentence from a conversation between a teacher and "
+            "students. Respond with a JSON array holding one object per sentence, in order, with the keys "
+            '"sentiment" (one of "POSITIVE", "NEGATIVE" or "NEUTRAL") and "confidence" (a number from 0 to 1).\n\n'
+            "Sentences:\n"
+            f"{numbered}"
+        )
+        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        answer = json.loads(response.text)
+        if not isinstance(answer, list) or len(answer) != len(sentences):
+            raise ValueError("Sentiment response does not match the sentences")
+        llm_cache.put(cache_key, answer)
+
+    results = []
+    for item in answer:
+        item = item if isinstance(item, dict) else {}
+        sentiment = str(item.get("sentiment", "")).strip().upper()
+        try:
+            confidence = min(max(float(item.get("confidence", 0)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if sentiment not in SENTIMENTS:
+            sentiment, confidence = "NEUTRAL", 0.0
+        results.append({"sentiment": sentiment, "confidence": confidence})
+    return results
@@ -1,7 +1,8 @@
 from google.cloud import speech
 import os
+from services import local_providers
 
-def transcribe_audio(gcs_uri):
+def _transcribe_with_google(gcs_uri):
     client = speech.SpeechClient.from_service_account_json(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
 
     audio = speech.RecognitionAudio(uri=gcs_uri)
@@ -12,3 +13,9 @@ def transcribe_audio(gcs_uri):
     
     response = client.recognize(config=config, audio=audio)
     return " ".join(result.alternatives[0].transcript for result in response.results)
+
+# LOCAL_PROVIDERS=speech swaps in the offline stand-in
+if local_providers.uses_local("speech"):
+    transcribe_audio = local_providers.transcribe_gcs
+else:
+    transcribe_audio = _transcribe_with_google
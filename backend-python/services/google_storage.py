@@ -2,6 +2,7 @@ import os
 from google.cloud import storage
 from dotenv import load_dotenv
 import uuid
+from services import local_providers
 
 # Load environment variables
 load_dotenv()
@@ -10,27 +11,35 @@ load_dotenv()
 gcp_credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 gcp_bucket_name = os.getenv("GCP_BUCKET_NAME")
 
-if not gcp_credentials_path or not gcp_bucket_name:
-    raise ValueError("Google Cloud credentials or bucket name not set properly in .env file.")
+# LOCAL_PROVIDERS=storage needs neither; uploads are then simulated
+if local_providers.uses_local("storage"):
+    storage_client = None
+else:
+    if not gcp_credentials_path or not gcp_bucket_name:
+        raise ValueError("Google Cloud credentials or bucket name not set properly in .env file.")
 
-# Set Google Cloud credentials
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = gcp_credentials_path
+    # Set Google Cloud credentials
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = gcp_credentials_path
 
-# Initialize Google Cloud Storage client
-storage_client = storage.Client()
+    # Initialize Google Cloud Storage client
+    storage_client = storage.Client()
 
-def upload_audio(file_path):
-    """Uploads an audio file to Google Cloud Storage and returns the public URL."""
+def _upload_audio_to_gcs(file_path, content_type=None):
+    """Uploads an audio file to Google Cloud Storage and returns the public URL.
+
+    The object keeps the file's extension (e.g. audio/<uuid>.ogg).
+    """
 
     # Generate a unique session ID for the file
     session_id = str(uuid.uuid4())
-    blob_name = f"audio/{session_id}.wav"
+    extension = os.path.splitext(file_path)[1] or ".wav"
+    blob_name = f"audio/{session_id}{extension}"
 
     bucket = storage_client.bucket(gcp_bucket_name)
     blob = bucket.blob(blob_name)
 
     # Upload the audio file
-    blob.upload_from_filename(file_path)
+    blob.upload_from_filename(file_path, content_type=content_type)
 
     # Make the file publicly accessible
     blob.make_public()
@@ -39,7 +48,7 @@ def upload_audio(file_path):
 
     return blob.public_url, session_id
 
-def upload_profile_picture(file_path):
+def _upload_profile_picture_to_gcs(file_path):
     """Uploads a profile picture to the 'profile_pictures' folder in Google Cloud Storage."""
     unique_id = uuid.uuid4().hex  # Unique id for file name
     blob_name = f"profile_pictures/{unique_id}.png"
@@ -49,3 +58,10 @@ def upload_profile_picture(file_path):
     blob.make_public()
     print(f"Profile picture uploaded to {blob.public_url}")
     return blob.public_url
+
+if local_providers.uses_local("storage"):
+    upload_audio = local_providers.upload_audio
+    upload_profile_picture = local_providers.upload_profile_picture
+else:
+    upload_audio = _upload_audio_to_gcs
+    upload_profile_picture = _upload_profile_picture_to_gcs
@@ -0,0 +1,432 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import request
+from assemblyai.streaming.v3 import StreamingClient, StreamingClientOptions, StreamingParameters, StreamingEvents
+from services.socket_service import socketio, connected_users, user_room
+from services.audio_conversion_service import StreamConverter
+from services.google_gemini import classify_sentiments
+from services.transcription_jobs import create_job
+from services import metrics_service
+
+logger = logging.getLogger(__name__)
+
+# Provider fed the session audio as it is recorded: "assemblyai" (streaming
+# API) or "local", a deterministic stand-in for tests and development that
+# needs no network access
+LIVE_TRANSCRIPTION_PROVIDER = os.getenv("LIVE_TRANSCRIPTION_PROVIDER", "assemblyai").lower()
+# Concurrent live sessions per process; each runs an ffmpeg decoder and a
+# provider connection for as long as the consultation lasts
+LIVE_TRANSCRIPTION_MAX_SESSIONS = int(os.getenv("LIVE_TRANSCRIPTION_MAX_SESSIONS", "8"))
+# Sessions that receive no audio for this many seconds are dropped (checked
+# every LIVE_TRANSCRIPTION_IDLE / 2 seconds); sessions of a disconnected
+# socket are dropped straight away
+LIVE_TRANSCRIPTION_IDLE = int(os.getenv("LIVE_TRANSCRIPTION_IDLE", "120"))
+LIVE_MAX_CHUNK_BYTES = int(os.getenv("LIVE_MAX_CHUNK_BYTES", str(1024 * 1024)))
+# Finished turns are sent for sentiment scoring in batches of this size while
+# the session runs, so only the last batch is left at the end
+LIVE_SENTIMENT_BATCH = int(os.getenv("LIVE_SENTIMENT_BATCH", "10"))
+# Audio the local stand-in turns into one transcript turn
+LOCAL_STANDIN_TURN_SECONDS = float(os.getenv("LOCAL_STANDIN_TURN_SECONDS", "5"))
+
+# Decoded audio: 16kHz mono 16-bit PCM
+PCM_BYTES_PER_SECOND = 16000 * 2
+# PCM bytes sent to the provider per read (100 ms)
+PCM_READ_BYTES = PCM_BYTES_PER_SECOND // 10
+
+metrics_service.describe("live_transcription_sessions", "Live transcription sessions in progress")
+metrics_service.describe("live_transcription_sessions_total", "Live transcription sessions, by outcome")
+metrics_service.describe("live_transcription_tail_seconds", "Time from the end of a live session to its transcription job")
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# Sessions being started: counted against the limit while they connect
+_starting = 0
+_sweeper_started = False
+_sentiment_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="live-sentiment")
+
+class AssemblyAIStream:
+    """AssemblyAI streaming session fed 16kHz mono PCM."""
+
+    def __init__(self, speaker_count, on_turn):
+        self._on_turn = on_turn
+        self._client = StreamingClient(StreamingClientOptions(api_key=os.getenv("ASSEMBLYAI_API_KEY")))
+        self._client.on(StreamingEvents.Turn, self._handle_turn)
+        self._client.connect(StreamingParameters(
+            sample_rate=16000,
+            format_turns=True,
+            speaker_labels=speaker_count > 1,
+            max_speakers=speaker_count if speaker_count > 1 else None,
+        ))
+
+    def _handle_turn(self, client, event):
+        if not event.transcript:
+            return
+        start = event.words[0].start if event.words else None
+        end = event.words[-1].end if event.words else None
+        # With format_turns a finished turn arrives twice; keep the formatted one
+        final = event.end_of_turn and event.turn_is_formatted
+        self._on_turn(event.speaker_label or "A", event.transcript, start, end, final)
+
+    def send(self, pcm):
+        self._client.stream(pcm)
+
+    def close(self):
+        """Flush the remaining audio and wait for the last turns."""
+        self._client.disconnect(terminate=True)
+
+class LocalStandInStream:
+    """
+    Stand-in provider: one turn per LOCAL_STANDIN_TURN_SECONDS of audio,
+    speakers taking turns in order. Same interface as AssemblyAIStream.
+    """
+
+    def __init__(self, speaker_count, on_turn):
+        self._on_turn = on_turn
+        self._speakers = [chr(ord("A") + i) for i in range(max(speaker_count, 1))]
+        self._turn_bytes = int(LOCAL_STANDIN_TURN_SECONDS * PCM_BYTES_PER_SECOND)
+        self._received = 0
+        self._emitted = 0
+        self._turns = 0
+
+    def send(self, pcm):
+        self._received += len(pcm)
+        while self._received - self._emitted >= self._turn_bytes:
+            self._emit(self._emitted + self._turn_bytes)
+
+    def close(self):
+        if self._received > self._emitted:
+            self._emit(self._received)
+
+    def _emit(self, until):
+        start_ms = self._emitted * 1000 // PCM_BYTES_PER_SECOND
+        end_ms = until * 1000 // PCM_BYTES_PER_SECOND
+        speaker = self._speakers[self._turns % len(self._speakers)]
+        self._turns += 1
+        self._emitted = until
+        self._on_turn(speaker, f"Turn {self._turns} ({(end_ms - start_ms) / 1000:.1f} seconds of audio).",
+                      start_ms, end_ms, True)
+
+def _standin_sentiments(sentences):
+    return [{"sentiment": "NEUTRAL", "confidence": 1.0} for _ in sentences]
+
+# name -> (stream class, sentiment scorer)
+PROVIDERS = {
+    "assemblyai": (AssemblyAIStream, classify_sentiments),
+    "local": (LocalStandInStream, _standin_sentiments),
+}
+if LIVE_TRANSCRIPTION_PROVIDER not in PROVIDERS:
+    raise ValueError(f"LIVE_TRANSCRIPTION_PROVIDER must be one of {', '.join(PROVIDERS)}")
+
+class LiveSession:
+    """
+    One recording transcribed while it is made.
+
+    Encoded audio chunks from the browser go into an ffmpeg process that
+    writes the session WAV and, at the same time, decoded PCM for the
+    provider. Finished turns are collected with their timestamps and scored
+    for sentiment in batches.
+    """
+
+    def __init__(self, user_id, speaker_count, sid=None):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.speaker_count = speaker_count
+        self.sid = sid
+        self.next_seq = 0
+        self.last_used = time.monotonic()
+        # lock guards next_seq and closed and is never held during I/O;
+        # write_lock keeps chunk writes to ffmpeg in order
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.closed = False
+        # Why the provider stopped, once it has; the recording is then
+        # transcribed from the WAV after the session ends
+        self.failed = None
+        self._turns = []        # (speaker, text, start_ms, end_ms)
+        self._sentiments = []   # aligned with _turns; None until scored
+        self._scored = 0
+        self._futures = []
+        self._turns_lock = threading.Lock()
+
+        stream_class, self._score_sentiments = PROVIDERS[LIVE_TRANSCRIPTION_PROVIDER]
+        self._provider = stream_class(speaker_count, self._on_turn)
+        try:
+            self._converter = StreamConverter(pcm_output=True)
+        except Exception:
+            self._provider.close()
+            raise
+        self._reader = threading.Thread(target=self._pump_pcm, name=f"live-{self.id[:8]}", daemon=True)
+        self._reader.start()
+
+    def _pump_pcm(self):
+        fd = self._converter.pcm.fileno()
+        try:
+            while True:
+                # os.read (cooperative under eventlet) returns whatever is ready
+                pcm = os.read(fd, PCM_READ_BYTES)
+                if not pcm:
+                    break
+                if self.failed:
+                    # Keep draining: ffmpeg blocks on a full pipe and would
+                    # stop taking audio, and the WAV is still needed
+                    continue
+                try:
+                    self._provider.send(pcm)
+                except Exception as e:
+                    logger.error(f"Live session {self.id} stopped feeding the provider: {str(e)}")
+                    self.failed = str(e)
+        except OSError as e:
+            logger.error(f"Live session {self.id}: reading decoded audio failed: {str(e)}")
+
+    def _on_turn(self, speaker, text, start, end, final):
+        socketio.emit('live_transcript', {'session_id': self.id, 'speaker': speaker,
+                                          'text': text, 'final': final}, to=user_room(self.user_id))
+        if not final:
+            return
+        with self._turns_lock:
+            self._turns.append((speaker, text, start, end))
+            self._sentiments.append(None)
+            pending = len(self._turns) - self._scored
+        if pending >= LIVE_SENTIMENT_BATCH:
+            self._score_pending()
+
+    def _score_pending(self):
+        with self._turns_lock:
+            first, self._scored = self._scored, len(self._turns)
+            texts = [turn[1] for turn in self._turns[first:]]
+        if texts:
+            self._futures.append(_sentiment_executor.submit(self._score, first, texts))
+
+    def _score(self, first, texts):
+        try:
+            results = self._score_sentiments(texts)
+        except Exception as e:
+            logger.warning(f"Live session {self.id}: sentiment scoring failed: {str(e)}")
+            return
+        with self._turns_lock:
+            self._sentiments[first:first + len(results)] = results
+
+    def write(self, data):
+        """Feed a chunk to ffmpeg; callers hold write_lock."""
+        self._converter.write(data)
+        self.last_used = time.monotonic()
+
+    def finish(self):
+        """
+        Finish the tail: flush ffmpeg and the provider and score the last turns
+
+        Returns:
+            tuple: (wav_path, transcription_data) with transcription_text and
+                raw_sentiment_analysis in the shape the batch service returns;
+                transcription_data is None when the provider failed
+        """
+        with self.write_lock:
+            wav_path = self._converter.finish()
+        self._reader.join()
+        try:
+            self._provider.close()
+        except Exception as e:
+            self.failed = self.failed or str(e)
+        if self.failed:
+            logger.warning(f"Live session {self.id}: provider failed ({self.failed}); "
+                           "transcribing the recording instead")
+            return wav_path, None
+        self._score_pending()
+        wait(self._futures)
+
+        # Retry, in one request, any batch whose scoring failed
+        missing = [i for i, sentiment in enumerate(self._sentiments) if sentiment is None]
+        if missing:
+            try:
+                for i, result in zip(missing, self._score_sentiments([self._turns[i][1] for i in missing])):
+                    self._sentiments[i] = result
+            except Exception as e:
+                logger.warning(f"Live session {self.id}: {len(missing)} turns left without sentiment: {str(e)}")
+
+        transcription_text = "".join(f"Speaker {speaker}: {text}\n" for speaker, text, _, _ in self._turns)
+        sentiment_analysis = [
+            {"text": text, "sentiment": sentiment["sentiment"], "confidence": sentiment["confidence"],
+             "start": start, "end": end}
+            for (_, text, start, end), sentiment in zip(self._turns, self._sentiments) if sentiment
+        ]
+        return wav_path, {"transcription_text": transcription_text, "raw_sentiment_analysis": sentiment_analysis}
+
+    def abort(self):
+        self._converter.abort()
+        self._reader.join()
+        try:
+            self._provider.close()
+        except Exception as e:
+            logger.warning(f"Live session {self.id}: closing the provider failed: {str(e)}")
+
+def _set_session_gauge():
+    metrics_service.set_gauge("live_transcription_sessions", len(_sessions))
+
+def _session_for(data):
+    """The caller's live session named in a socket payload, or None."""
+    user = connected_users.get(request.sid)
+    session = _sessions.get((data or {}).get('session_id'))
+    if not user or not session or session.user_id != user['user_id']:
+        return None
+    return session
+
+def _take(session):
+    """
+    Remove a session from the registry and close it to further chunks
+
+    Returns:
+        bool: True for the one caller that removed it, which then finishes
+            or aborts it (outside any lock)
+    """
+    with session.lock:
+        with _sessions_lock:
+            if _sessions.get(session.id) is not session:
+                return False
+            del _sessions[session.id]
+        session.closed = True
+    _set_session_gauge()
+    return True
+
+def _discard_idle():
+    cutoff = time.monotonic() - LIVE_TRANSCRIPTION_IDLE
+    for session in list(_sessions.values()):
+        if session.last_used < cutoff and _take(session):
+            logger.info(f"Dropping idle live session {session.id}")
+            metrics_service.inc("live_transcription_sessions_total", outcome='idle')
+            session.abort()
+
+def discard_client_sessions(sid):
+    """Abort the live sessions started from a socket that has disconnected."""
+    for session in list(_sessions.values()):
+        if session.sid == sid and _take(session):
+            logger.info(f"Dropping live session {session.id} of a disconnected client")
+            metrics_service.inc("live_transcription_sessions_total", outcome='disconnected')
+            session.abort()
+
+def _ensure_sweeper():
+    global _sweeper_started
+    with _sessions_lock:
+        if _sweeper_started:
+            return
+        _sweeper_started = True
+    threading.Thread(target=_sweep_loop, name="live-transcription-sweeper", daemon=True).start()
+
+def _sweep_loop():
+    while True:
+        time.sleep(max(LIVE_TRANSCRIPTION_IDLE / 2, 1))
+        try:
+            _discard_idle()
+        except Exception as e:
+            logger.error(f"Sweeping idle live sessions failed: {str(e)}")
+
+def handle_live_start(data=None):
+    """
+    Socket handler: start transcribing a recording while it is made
+    Example payload: {"speaker_count": 3}
+    Acknowledged with {"session_id"} or {"error"}; on error the client
+    uploads the recording when it ends instead.
+    """
+    global _starting
+    user = connected_users.get(request.sid)
+    if not user:
+        return {'error': 'unauthorized'}
+    _ensure_sweeper()
+    try:
+        speaker_count = int((data or {}).get('speaker_count', 1))
+    except (TypeError, ValueError):
+        return {'error': 'speaker_count must be a number'}
+
+    # Reserve a slot under the lock, then connect to the provider outside it
+    with _sessions_lock:
+        if len(_sessions) + _starting >= LIVE_TRANSCRIPTION_MAX_SESSIONS:
+            metrics_service.inc("live_transcription_sessions_total", outcome='rejected')
+            return {'error': 'Live transcription is busy'}
+        _starting += 1
+    session = None
+    try:
+        session = LiveSession(user['user_id'], speaker_count, request.sid)
+    except Exception as e:
+        logger.error(f"Could not start live transcription: {str(e)}")
+        return {'error': str(e)}
+    finally:
+        with _sessions_lock:
+            _starting -= 1
+            if session:
+                _sessions[session.id] = session
+    _set_session_gauge()
+    return {'session_id': session.id}
+
+def handle_live_chunk(data=None):
+    """
+    Socket handler: the next piece of encoded audio
+    Example payload: {"session_id": "...", "seq": 0, "audio": <bytes>}
+    Chunks must arrive in order; acknowledged with {"next_seq"}, plus
+    {"error"} when the chunk was not accepted.
+    """
+    session = _session_for(data)
+    if not session:
+        return {'error': 'Live session not found'}
+    audio = data.get('audio')
+    if not isinstance(audio, (bytes, bytearray)) or len(audio) > LIVE_MAX_CHUNK_BYTES:
+        return {'error': f"audio must be binary and at most {LIVE_MAX_CHUNK_BYTES} bytes",
+                'next_seq': session.next_seq}
+    with session.lock:
+        if session.closed:
+            return {'error': 'Live session not found'}
+        seq = data.get('seq')
+        if seq != session.next_seq:
+            # Earlier chunks are already in; later ones mean one went missing
+            if isinstance(seq, int) and seq < session.next_seq:
+                return {'next_seq': session.next_seq}
+            return {'error': f"Expected chunk {session.next_seq}", 'next_seq': session.next_seq}
+        session.next_seq += 1
+        next_seq = session.next_seq
+        # Taken before the next chunk can pass the check above, so chunks
+        # reach ffmpeg in order; the write itself happens outside session.lock
+        session.write_lock.acquire()
+    try:
+        session.write(audio)
+    finally:
+        session.write_lock.release()
+    return {'next_seq': next_seq}
+
+def handle_live_stop(data=None):
+    """
+    Socket handler: the recording ended; queue its transcription job
+    Example payload: {"session_id": "...", "duration": 1800, "notes": "Concern: ..."}
+    Acknowledged with {"job_id"} (poll GET /consultation/transcribe/<job_id>)
+    or {"error"}.
+    """
+    session = _session_for(data)
+    if not session:
+        return {'error': 'Live session not found'}
+    started = time.monotonic()
+    if not _take(session):
+        return {'error': 'Live session not found'}
+    try:
+        wav_path, transcription_data = session.finish()
+        duration = data.get('duration')
+        # Without transcription_data (the provider failed) the job transcribes the WAV
+        job_id = create_job(wav_path, session.speaker_count,
+                            float(duration) if duration is not None else None,
+                            session.user_id, converted=True, notes=data.get('notes'),
+                            transcription_data=transcription_data)
+    except Exception as e:
+        logger.error(f"Live session {session.id} failed: {str(e)}", exc_info=True)
+        metrics_service.inc("live_transcription_sessions_total", outcome='failed')
+        return {'error': str(e)}
+    metrics_service.observe("live_transcription_tail_seconds", time.monotonic() - started)
+    metrics_service.inc("live_transcription_sessions_total",
+                        outcome='done' if transcription_data is not None else 'provider_failed')
+    return {'job_id': job_id}
+
+def handle_live_abort(data=None):
+    """Socket handler: discard a live session (the client fell back to uploading)."""
+    session = _session_for(data)
+    if session and _take(session):
+        metrics_service.inc("live_transcription_sessions_total", outcome='aborted')
+        session.abort()
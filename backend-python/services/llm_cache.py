@@ -0,0 +1,77 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from services import metrics_service
+from utils.disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Gemini responses keyed by prompt template, template version, model and a hash
+# of the input text. A small in-memory LRU answers repeats within this process;
+# the SQLite tier survives restarts and is shared by workers on the same host.
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm.sqlite3")
+
+metrics_service.describe("llm_cache_total", "LLM response cache lookups, by template and result")
+
+_disk = DiskCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+# key -> (stored_at, value), least recently used first
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+def make_key(template, version, model_name, text):
+    """
+    Cache key for one prompt
+
+    Args:
+        template (str): Prompt name, e.g. "summary"
+        version (int): Prompt template version; bump it when the wording changes
+        model_name (str): Model the prompt is sent to
+        text (str): Input text substituted into the template
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f"{template}:v{version}:{model_name}:{digest}"
+
+def get(key, template):
+    """
+    Cached response for a key, checking memory first and then disk
+
+    Returns:
+        str: Cached response text, or None on a miss
+    """
+    now = time.time()
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry and entry[0] >= now - LLM_CACHE_TTL:
+            _memory.move_to_end(key)
+            metrics_service.inc("llm_cache_total", template=template, result='memory_hit')
+            return entry[1]
+        if entry:
+            del _memory[key]
+
+    entry = _disk.get_entry(key)
+    if entry is None:
+        metrics_service.inc("llm_cache_total", template=template, result='miss')
+        return None
+    metrics_service.inc("llm_cache_total", template=template, result='disk_hit')
+    value, stored_at = entry
+    # Keep the disk entry's age, so the copy expires when the original does
+    _remember(key, value, stored_at)
+    return value
+
+def put(key, value):
+    """Store a response in both tiers."""
+    _remember(key, value, time.time())
+    _disk.set(key, value)
+
+def _remember(key, value, stored_at):
+    with _memory_lock:
+        _memory[key] = (stored_at, value)
+        _memory.move_to_end(key)
+        while len(_memory) > LLM_CACHE_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
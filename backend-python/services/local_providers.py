@@ -0,0 +1,372 @@
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import wave
+import zlib
+import random
+import datetime
+import threading
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from google.cloud.firestore_v1.transforms import Increment
+from utils.transcript_parser import split_turns, format_turns, role_labels
+
+# External providers listed here are replaced by the local stand-ins below,
+# e.g. LOCAL_PROVIDERS=transcription,llm or LOCAL_PROVIDERS=all. Names:
+# transcription (AssemblyAI), llm (Gemini), storage (GCS), speech (Google
+# Speech-to-Text) and firestore. The stand-ins need no credentials or network
+# and exist for benchmarks, load tests and offline development.
+PROVIDER_NAMES = ("transcription", "llm", "storage", "speech", "firestore")
+
+# Seconds each stand-in call takes, overridable per provider with
+# LOCAL_<NAME>_LATENCY, and the share of calls that fail
+# (LOCAL_<NAME>_ERROR_RATE, 0-1, defaulting to LOCAL_PROVIDER_ERROR_RATE)
+DEFAULT_LATENCY = {"transcription": 2.0, "llm": 1.0, "storage": 0.3, "speech": 2.0, "firestore": 0.02}
+LOCAL_PROVIDER_ERROR_RATE = float(os.getenv("LOCAL_PROVIDER_ERROR_RATE", "0"))
+# Latencies vary by up to this fraction either way
+LOCAL_PROVIDER_JITTER = float(os.getenv("LOCAL_PROVIDER_JITTER", "0.2"))
+# Transcription also takes this many seconds per second of audio
+LOCAL_TRANSCRIPTION_REALTIME_FACTOR = float(os.getenv("LOCAL_TRANSCRIPTION_REALTIME_FACTOR", "0.05"))
+# Audio covered by each turn of the canned transcript
+LOCAL_TRANSCRIPT_TURN_SECONDS = float(os.getenv("LOCAL_TRANSCRIPT_TURN_SECONDS", "6"))
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "http://localhost/local-storage")
+
+TEACHER_LINES = [
+    "Let's look at how your project is coming along.",
+    "What did you find hardest about the last assignment?",
+    "Can you walk me through your approach?",
+    "That is a good start, but the analysis needs more detail.",
+    "Have you checked the requirements for the final submission?",
+    "I would suggest narrowing the scope a little.",
+    "Do you have any questions about the grading?",
+    "Try to finish the draft before our next meeting.",
+]
+STUDENT_LINES = [
+    "I had trouble with the second part.",
+    "I think I understand it now, thank you.",
+    "I was not sure which data set to use.",
+    "We split the work between the group members.",
+    "Could I get an extension for the report?",
+    "The feedback from the last session really helped.",
+]
+SENTIMENTS = ("POSITIVE", "NEGATIVE", "NEUTRAL")
+SENTIMENT_WEIGHTS = (0.3, 0.1, 0.6)
+
+class LocalProviderError(RuntimeError):
+    """A simulated provider failure (see LOCAL_<NAME>_ERROR_RATE)."""
+
+def uses_local(provider):
+    """True when the named provider is replaced by its local stand-in."""
+    # Read on each call: services check this at import, some before .env is loaded
+    names = {name.strip().lower() for name in os.getenv("LOCAL_PROVIDERS", "").split(",")}
+    return "all" in names or provider in names
+
+def _setting(provider, suffix, default):
+    return float(os.getenv(f"LOCAL_{provider.upper()}_{suffix}", default))
+
+def simulate_call(provider, extra_seconds=0.0, share=1.0, can_fail=True):
+    """
+    Wait as long as a call to the provider would, failing at its error rate
+
+    Args:
+        provider (str): One of PROVIDER_NAMES
+        extra_seconds (float): Latency on top of the provider's base latency
+        share (float): Fraction of the latency to wait (streamed responses
+            spread it over their pieces)
+        can_fail (bool): Whether this wait may raise; False for all but the
+            first piece of a streamed response
+
+    Raises:
+        LocalProviderError: the call was picked to fail
+    """
+    latency = (_setting(provider, "LATENCY", DEFAULT_LATENCY[provider]) + extra_seconds) * share
+    if latency > 0:
+        time.sleep(latency * random.uniform(1 - LOCAL_PROVIDER_JITTER, 1 + LOCAL_PROVIDER_JITTER))
+    if can_fail and random.random() < _setting(provider, "ERROR_RATE", LOCAL_PROVIDER_ERROR_RATE):
+        raise LocalProviderError(f"Simulated {provider} failure")
+
+def _audio_seconds(file_path):
+    try:
+        with wave.open(file_path, 'rb') as audio:
+            return audio.getnframes() / audio.getframerate()
+    except (wave.Error, EOFError):
+        # Not a WAV: assume 16kHz mono 16-bit, as convert_audio writes
+        return os.path.getsize(file_path) / 32000
+
+def _seed(file_path):
+    """Same recording, same transcript; different recordings differ."""
+    with open(file_path, 'rb') as audio:
+        head = audio.read(1024 * 1024)
+    return zlib.crc32(head) ^ os.path.getsize(file_path)
+
+# Transcription (AssemblyAI)
+
+def transcribe_audio(file_path, speaker_count):
+    """
+    Canned stand-in for assemblyai_service.transcribe_audio_with_assemblyai
+
+    Speaker A is the teacher and speaks every other turn, the others taking
+    turns in between; every sentence gets a sentiment result timed within
+    its turn. Returns the same structure as the AssemblyAI service.
+    """
+    duration = _audio_seconds(file_path)
+    simulate_call("transcription", duration * LOCAL_TRANSCRIPTION_REALTIME_FACTOR)
+
+    rng = random.Random(_seed(file_path))
+    students = [chr(ord("B") + i) for i in range(max(speaker_count - 1, 1))]
+    turn_ms = int(LOCAL_TRANSCRIPT_TURN_SECONDS * 1000)
+    total_ms = int(duration * 1000)
+    lines = []
+    sentiments = []
+    for number, start in enumerate(range(0, max(total_ms, 1), turn_ms)):
+        end = min(start + turn_ms, max(total_ms, 1))
+        if number % 2 == 0:
+            speaker, sentences = "A", rng.sample(TEACHER_LINES, 2)
+        else:
+            speaker, sentences = students[(number // 2) % len(students)], [rng.choice(STUDENT_LINES)]
+        lines.append(f"Speaker {speaker}: {' '.join(sentences)}\n")
+        step = (end - start) // len(sentences)
+        for index, sentence in enumerate(sentences):
+            sentiments.append({
+                "text": sentence,
+                "sentiment": rng.choices(SENTIMENTS, SENTIMENT_WEIGHTS)[0],
+                "confidence": round(rng.uniform(0.6, 0.99), 2),
+                "start": start + index * step,
+                "end": start + (index + 1) * step,
+            })
+    return {"transcription_text": "".join(lines), "raw_sentiment_analysis": sentiments}
+
+# Speech-to-Text (Google)
+
+def transcribe_gcs(gcs_uri):
+    """Canned stand-in for google_speech.transcribe_audio."""
+    simulate_call("speech")
+    rng = random.Random(zlib.crc32(gcs_uri.encode('utf-8')))
+    return " ".join(rng.sample(TEACHER_LINES + STUDENT_LINES, 6))
+
+# Storage (GCS)
+
+def upload_audio(file_path, content_type=None):
+    """Stand-in for google_storage.upload_audio; nothing is stored."""
+    simulate_call("storage")
+    session_id = str(uuid.uuid4())
+    extension = os.path.splitext(file_path)[1] or ".wav"
+    return f"{LOCAL_STORAGE_URL}/audio/{session_id}{extension}", session_id
+
+def upload_profile_picture(file_path):
+    """Stand-in for google_storage.upload_profile_picture; nothing is stored."""
+    simulate_call("storage")
+    return f"{LOCAL_STORAGE_URL}/profile_pictures/{uuid.uuid4().hex}.png"
+
+# Gemini
+
+_TRANSCRIPT_RE = re.compile(r"(?:Transcript|Excerpt|Sentences):\n(.*?)(?:\n\nOutput format:|\Z)", re.DOTALL)
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+class LocalGenerativeModel:
+    """
+    Stand-in for google.generativeai.GenerativeModel
+
+    Recognises the prompts google_gemini sends and answers each in the
+    format it expects: the speaker who talks most is the teacher, summaries
+    and sentiments are canned.
+    """
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if not stream:
+            simulate_call("llm")
+            return _Response(self._answer(prompt))
+        return self._stream(self._answer(prompt))
+
+    def _stream(self, text):
+        simulate_call("llm", share=0.3)
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        for piece in pieces:
+            simulate_call("llm", share=0.7 / len(pieces), can_fail=False)
+            yield _Response(piece)
+
+    def _answer(self, prompt):
+        match = _TRANSCRIPT_RE.search(prompt)
+        text = (match.group(1) if match else prompt).split("\n\nNotes:\n")[0]
+        if "Sentences:\n" in prompt:
+            count = len(re.findall(r"^\d+\. ", text, re.MULTILINE))
+            rng = random.Random(zlib.crc32(text.encode('utf-8')))
+            return json.dumps([{"sentiment": rng.choices(SENTIMENTS, SENTIMENT_WEIGHTS)[0],
+                                "confidence": round(rng.uniform(0.6, 0.99), 2)} for _ in range(count)])
+
+        preamble, turns = split_turns(text)
+        teacher = self._teacher(turns)
+        if "Excerpt:\n" in prompt:
+            labels = role_labels(turns, teacher) if teacher else {}
+            return "\n".join(f"{speaker}: {'Teacher' if label == 'Teacher' else 'Student'}"
+                             for speaker, label in labels.items())
+        if "Respond with a JSON object" in prompt:
+            answer = {"summary": self._summary(text), "sentiment": "NEUTRAL"}
+            if "speaker_roles" in prompt:
+                answer["speaker_roles"] = {speaker: "Teacher" if speaker == teacher else "Student"
+                                           for speaker, _ in turns}
+            else:
+                answer["role_identified_transcription"] = self._annotate(preamble, turns, teacher)
+            return json.dumps(answer)
+        if "role label" in prompt:
+            return self._annotate(preamble, turns, teacher)
+        return f"{self._summary(text)}\nNEUTRAL"
+
+    @staticmethod
+    def _teacher(turns):
+        spoken = {}
+        for speaker, text in turns:
+            spoken[speaker] = spoken.get(speaker, 0) + len(text)
+        return max(spoken, key=spoken.get) if spoken else None
+
+    @staticmethod
+    def _annotate(preamble, turns, teacher):
+        if not turns:
+            return "\n".join(f"Teacher: {line}" for line in preamble.splitlines() if line.strip())
+        annotated = format_turns(turns, role_labels(turns, teacher))
+        return f"{preamble}\n{annotated}" if preamble else annotated
+
+    @staticmethod
+    def _summary(text):
+        exchanges = sum(1 for line in text.splitlines() if line.strip())
+        return (f"The teacher and students reviewed progress on the project over {exchanges} exchanges "
+                "and agreed on next steps for the final submission.")
+
+# Firestore
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class LocalFirestore:
+    """
+    In-memory stand-in for the Firestore client
+
+    Covers what the transcription job store uses: documents with
+    set/update/get/delete, SERVER_TIMESTAMP and Increment values, and
+    collection queries with where/order_by/limit/stream. Data lives in this
+    process only.
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return _LocalCollection(self, name)
+
+class _LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+class _LocalDocument:
+    def __init__(self, client, collection, document_id):
+        self._client = client
+        self._collection = collection
+        self.id = document_id
+        self.path = f"{collection}/{document_id}"
+
+    def _documents(self):
+        return self._client._collections.setdefault(self._collection, {})
+
+    def _apply(self, current, fields):
+        for key, value in fields.items():
+            if value is SERVER_TIMESTAMP:
+                value = _now()
+            elif isinstance(value, Increment):
+                value = (current.get(key) or 0) + value.value
+            else:
+                value = copy.deepcopy(value)
+            current[key] = value
+
+    def set(self, data, merge=False):
+        simulate_call("firestore")
+        with self._client._lock:
+            documents = self._documents()
+            current = documents.get(self.id, {}) if merge else {}
+            self._apply(current, data)
+            documents[self.id] = current
+
+    def update(self, fields):
+        simulate_call("firestore")
+        with self._client._lock:
+            current = self._documents().get(self.id)
+            if current is None:
+                raise KeyError(f"No document to update: {self.path}")
+            self._apply(current, fields)
+
+    def get(self):
+        simulate_call("firestore")
+        with self._client._lock:
+            data = self._documents().get(self.id)
+            return _LocalSnapshot(self, copy.deepcopy(data))
+
+    def delete(self):
+        simulate_call("firestore")
+        with self._client._lock:
+            self._documents().pop(self.id, None)
+
+_OPERATORS = {
+    "==": lambda value, target: value == target,
+    "!=": lambda value, target: value != target,
+    "<": lambda value, target: value is not None and value < target,
+    "<=": lambda value, target: value is not None and value <= target,
+    ">": lambda value, target: value is not None and value > target,
+    ">=": lambda value, target: value is not None and value >= target,
+    "in": lambda value, target: value in target,
+    "not-in": lambda value, target: value not in target,
+    "array_contains": lambda value, target: isinstance(value, list) and target in value,
+}
+
+class _LocalCollection:
+    def __init__(self, client, name, filters=(), order=None, limit_count=None):
+        self._client = client
+        self._name = name
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit_count
+
+    def document(self, document_id=None):
+        return _LocalDocument(self._client, self._name, document_id or uuid.uuid4().hex[:20])
+
+    def where(self, field, op, value):
+        return _LocalCollection(self._client, self._name, self._filters + [(field, _OPERATORS[op], value)],
+                                self._order, self._limit)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return _LocalCollection(self._client, self._name, self._filters, (field, direction == "DESCENDING"),
+                                self._limit)
+
+    def limit(self, count):
+        return _LocalCollection(self._client, self._name, self._filters, self._order, count)
+
+    def stream(self):
+        simulate_call("firestore")
+        with self._client._lock:
+            items = [(document_id, copy.deepcopy(data))
+                     for document_id, data in self._client._collections.get(self._name, {}).items()
+                     if all(test(data.get(field), target) for field, test, target in self._filters)]
+        if self._order:
+            field, descending = self._order
+            items.sort(key=lambda item: (item[1].get(field) is None, item[1].get(field)), reverse=descending)
+        for document_id, data in items[:self._limit]:
+            yield _LocalSnapshot(self.document(document_id), data)
+
+    def get(self):
+        return list(self.stream())
@@ -0,0 +1,97 @@
+import threading
+
+# Simple in-process metrics registry rendered on /metrics.
+# Metric names follow the Prometheus convention (snake_case, unit suffix).
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_summaries = {}
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, help_text):
+    """Register a one-line description that is emitted as # HELP."""
+    _help[name] = help_text
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to an absolute value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    """Record one observation (e.g. a duration) in a count/sum/max summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+
+def snapshot():
+    """Return all metrics as a JSON-serializable dict."""
+    def label_str(labels):
+        return ",".join(f"{k}={v}" for k, v in labels)
+
+    def flatten(store):
+        result = {}
+        for (name, labels), value in store.items():
+            result.setdefault(name, {})[label_str(labels) or "_"] = (
+                dict(value) if isinstance(value, dict) else value
+            )
+        return result
+
+    with _lock:
+        return {
+            "counters": flatten(_counters),
+            "gauges": flatten(_gauges),
+            "summaries": flatten(_summaries),
+        }
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format."""
+    def fmt_labels(labels, extra=None):
+        pairs = list(labels) + (extra or [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    lines = []
+    emitted = set()
+
+    def header(name, metric_type):
+        if name in emitted:
+            return
+        emitted.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+        for (name, labels), value in sorted(_gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+        for (name, labels), summary in sorted(_summaries.items()):
+            header(name, "summary")
+            lines.append(f"{name}_count{fmt_labels(labels)} {summary['count']}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {summary['sum']}")
+            lines.append(f"{name}_max{fmt_labels(labels)} {summary['max']}")
+
+    return "\n".join(lines) + "\n"
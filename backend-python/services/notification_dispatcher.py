@@ -0,0 +1,193 @@
+import os
+import time
+import queue
+import zlib
+import logging
+import threading
+from itertools import groupby
+from services.socket_service import socketio, user_room
+from services import metrics_service
+
+logger = logging.getLogger(__name__)
+
+# Events for the same room that arrive within this window are merged into one
+# batched emit. 0 disables coalescing (every event is emitted immediately).
+NOTIFICATION_COALESCE_MS = int(os.getenv("NOTIFICATION_COALESCE_MS", "300"))
+
+# Worker threads (green threads under eventlet) that own all notification work.
+# Each worker has its own bounded queue; jobs are sharded by room so every
+# room is handled by one worker, in submission order.
+NOTIFICATION_WORKERS = max(int(os.getenv("NOTIFICATION_WORKERS", "2")), 1)
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "1000"))
+
+metrics_service.describe("notification_queue_depth", "Jobs waiting in each dispatcher queue")
+metrics_service.describe("notification_dropped_total", "Jobs dropped because a dispatcher queue was full")
+metrics_service.describe("notification_job_failures_total", "Dispatcher jobs that raised")
+metrics_service.describe("notification_queue_wait_seconds", "Time jobs spent queued before a worker picked them up")
+metrics_service.describe("notification_emit_latency_seconds", "Time from buffering an event to emitting it")
+metrics_service.describe("notification_emitted_total", "Socket.IO emits performed by the dispatcher")
+
+# Copied onto a batch when every merged payload has the same value
+_SHARED_FIELDS = ('v', 'targetEmail', 'targetUserId', 'targetTeacherId', 'targetStudentId', 'targetRole')
+
+_queues = []
+_workers_lock = threading.Lock()
+
+# room -> list of (event, payload, buffered_at) in the order they were dispatched
+_buffers = {}
+_lock = threading.Lock()
+
+def _shard(key):
+    return zlib.crc32(key.encode('utf-8')) % NOTIFICATION_WORKERS
+
+def _ensure_workers():
+    """Start the worker threads on first use."""
+    if _queues:
+        return
+    with _workers_lock:
+        if _queues:
+            return
+        queues = [queue.Queue(maxsize=NOTIFICATION_QUEUE_SIZE) for _ in range(NOTIFICATION_WORKERS)]
+        for shard, q in enumerate(queues):
+            worker = threading.Thread(target=_worker_loop, args=(shard, q),
+                                      name=f"notification-dispatcher-{shard}", daemon=True)
+            worker.start()
+        _queues.extend(queues)
+
+def _worker_loop(shard, q):
+    while True:
+        enqueued_at, func, args = q.get()
+        metrics_service.set_gauge("notification_queue_depth", q.qsize(), shard=shard)
+        metrics_service.observe("notification_queue_wait_seconds", time.monotonic() - enqueued_at)
+        try:
+            func(*args)
+        except Exception as e:
+            metrics_service.inc("notification_job_failures_total")
+            logger.error(f"Notification job {getattr(func, '__name__', func)} failed: {str(e)}", exc_info=True)
+        finally:
+            q.task_done()
+
+def submit(key, func, *args, block=False):
+    """
+    Run func(*args) on the dispatcher worker that owns `key` (usually a room)
+
+    Producers never do notification I/O themselves; they only enqueue.
+
+    Returns:
+        bool: False if the job was dropped because the queue was full
+    """
+    _ensure_workers()
+    shard = _shard(key)
+    q = _queues[shard]
+    try:
+        q.put((time.monotonic(), func, args), block=block)
+    except queue.Full:
+        metrics_service.inc("notification_dropped_total", shard=shard)
+        logger.warning(f"Notification queue {shard} full; dropping {getattr(func, '__name__', func)} for {key}")
+        return False
+    metrics_service.set_gauge("notification_queue_depth", q.qsize(), shard=shard)
+    return True
+
+def dispatch_to_user(event, payload, user_id):
+    """Queue an event for every socket of a single user."""
+    if not user_id:
+        logger.warning(f"Dropping '{event}' event without a target user")
+        return False
+    return dispatch_to_rooms(event, payload, [user_room(user_id)])
+
+def dispatch_to_rooms(event, payload, rooms):
+    """Queue an event for each of the given rooms."""
+    queued = True
+    for room in dict.fromkeys(rooms or []):
+        queued = submit(room, buffer_event, room, event, payload) and queued
+    return queued
+
+def buffer_event(room, event, payload):
+    """Add an event to a room's coalescing buffer. Runs on the room's worker."""
+    with _lock:
+        buffer = _buffers.get(room)
+        first = buffer is None
+        if first:
+            buffer = _buffers[room] = []
+        buffer.append((event, payload, time.monotonic()))
+
+    if NOTIFICATION_COALESCE_MS <= 0:
+        flush(room)
+    elif first:
+        # The first event of a window schedules the flush. The flush itself is
+        # handed back to the room's worker, so that worker performs the emit
+        # after every job that was queued before it.
+        timer = threading.Timer(NOTIFICATION_COALESCE_MS / 1000.0,
+                                submit, args=(room, flush, room), kwargs={'block': True})
+        timer.daemon = True
+        timer.start()
+
+def flush(room):
+    """Emit everything buffered for a room, one emit per run of same-type events."""
+    with _lock:
+        buffer = _buffers.pop(room, None)
+    if buffer:
+        _emit_grouped(room, buffer)
+
+def _emit_grouped(room, buffer):
+    # Only consecutive events of the same type are merged, so the room still
+    # receives events in dispatch order
+    for event, run in groupby(buffer, key=lambda item: item[0]):
+        items = [(payload, buffered_at) for _, payload, buffered_at in run]
+        try:
+            socketio.emit(event, coalesce(event, [payload for payload, _ in items]), to=room)
+            now = time.monotonic()
+            for _, buffered_at in items:
+                metrics_service.observe("notification_emit_latency_seconds", now - buffered_at, event=event)
+            metrics_service.inc("notification_emitted_total", event=event)
+        except Exception as e:
+            logger.error(f"Error emitting '{event}' to {room}: {str(e)}")
+
+def drain(timeout=5.0):
+    """Wait (up to timeout seconds) for queued jobs, then emit pending buffers."""
+    deadline = time.monotonic() + timeout
+    for q in list(_queues):
+        while q.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+    with _lock:
+        rooms = list(_buffers)
+    for room in rooms:
+        flush(room)
+
+def coalesce(event, payloads):
+    """
+    Merge several payloads of one event type into a single payload
+
+    A single payload is passed through unchanged. Several payloads become
+    {'action': 'batch', 'count', 'bookingIDs', 'events', 'message'}, with
+    'events' in dispatch order. Target fields shared by every payload are
+    copied onto the batch so clients can still tell who it is for, and
+    'seq' is the highest sequence number in the batch.
+    """
+    if len(payloads) == 1:
+        return payloads[0]
+
+    booking_ids = list(dict.fromkeys(p.get('bookingID') for p in payloads if p.get('bookingID')))
+    if booking_ids:
+        noun = "booking" if len(booking_ids) == 1 else "bookings"
+        message = f"{len(booking_ids)} {noun} changed"
+    else:
+        message = f"{len(payloads)} new notifications"
+
+    batch = {
+        'action': 'batch',
+        'event': event,
+        'count': len(payloads),
+        'bookingIDs': booking_ids,
+        'events': payloads,
+        'message': message,
+        'timestamp': payloads[-1].get('timestamp'),
+    }
+    for field in _SHARED_FIELDS:
+        values = {p.get(field) for p in payloads}
+        if len(values) == 1 and None not in values:
+            batch[field] = values.pop()
+    seqs = [p['seq'] for p in payloads if p.get('seq') is not None]
+    if seqs:
+        batch['seq'] = max(seqs)
+    return batch
@@ -1,36 +1,114 @@
+import os
 import logging
-from flask_socketio import emit
+import threading
+from collections import deque
+from flask import request
+from services.notification_dispatcher import submit, buffer_event
+from services.socket_service import socketio, user_room, connected_users
+from services import metrics_service
 from services.firebase_service import db
 from google.cloud import firestore
 import datetime
 import pytz
+from utils.schedule_parser import normalize_schedule
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def send_notification(notification_data):
+# Store every sent notification in the recipient's inbox (notifications collection)
+PERSIST_NOTIFICATIONS = os.getenv("PERSIST_NOTIFICATIONS", "true").lower() == "true"
+
+# Every notification gets the next value of its recipient's sequence number
+# ('seq'). The newest NOTIFICATION_REPLAY_BUFFER payloads per user are kept in
+# memory so a reconnecting client can catch up on what it missed; older gaps
+# are read back from Firestore, up to NOTIFICATION_REPLAY_LIMIT notifications.
+NOTIFICATION_REPLAY_BUFFER = int(os.getenv("NOTIFICATION_REPLAY_BUFFER", "100"))
+NOTIFICATION_REPLAY_LIMIT = int(os.getenv("NOTIFICATION_REPLAY_LIMIT", "200"))
+
+metrics_service.describe("notification_replays_total", "Reconnect replays, by where the missed notifications came from")
+
+# user_id -> deque of sent payloads, oldest first
+_replay_buffers = {}
+# user_id -> last sequence number, only used when notifications are not persisted
+_local_seqs = {}
+_replay_lock = threading.Lock()
+
+# Compact payloads carry this in 'v'. They hold IDs and primitives only; clients
+# resolve names and other display data from their own booking cache.
+NOTIFICATION_SCHEMA_VERSION = 2
+
+def compact_notification(action, booking_id, **fields):
+    """
+    Build a compact notification payload
+    
+    Args:
+        action (str): Notification action, e.g. 'reminder_1h'
+        booking_id (str): ID of the booking the notification is about
+        **fields: Extra primitive fields (IDs, schedule, venue, target IDs);
+            empty values are left out
+    
+    Returns:
+        dict: Payload ready for send_notification
+    """
+    payload = {
+        'v': NOTIFICATION_SCHEMA_VERSION,
+        'action': action,
+        'bookingID': booking_id,
+        'timestamp': datetime.datetime.now(pytz.UTC).isoformat(),
+    }
+    payload.update({k: v for k, v in fields.items() if v not in (None, '', [])})
+    return payload
+
+def send_notification(notification_data, recipient_id=None):
+    """
+    Queue a notification for delivery via Socket.IO
+    
+    Safe to call from request handlers and scheduler threads alike: payload
+    enrichment, persistence and the emit all happen on a dispatcher worker.
+    
+    Args:
+        notification_data (dict): Data for the notification
+        recipient_id (str): User ID of the recipient; defaults to
+            targetTeacherId / targetStudentId from the payload
+    
+    Returns:
+        bool: True if the notification was queued
+    """
+    recipient_id = (recipient_id or notification_data.get('targetTeacherId')
+                    or notification_data.get('targetStudentId'))
+    if not recipient_id:
+        logger.warning(f"Dropping notification without a recipient: action={notification_data.get('action')}")
+        return False
+    
+    return submit(user_room(recipient_id), deliver_notification, dict(notification_data), recipient_id)
+
+def deliver_notification(notification_data, recipient_id):
     """
-    Send a notification via Socket.IO
+    Build, persist and emit a notification. Runs on a dispatcher worker.
     
     Args:
         notification_data (dict): Data for the notification
+        recipient_id (str): User ID of the recipient
     """
     try:
+        compact = notification_data.get('v') == NOTIFICATION_SCHEMA_VERSION
+        
         # Add a timestamp if not present - using an ISO string instead of SERVER_TIMESTAMP
         if 'timestamp' not in notification_data:
             notification_data['timestamp'] = datetime.datetime.now(pytz.UTC).isoformat()
             
         # NEW: Standardize schedule format so it is a proper ISO string ending with "Z"
         if 'schedule' in notification_data and isinstance(notification_data['schedule'], str):
-            try:
-                dt = datetime.datetime.fromisoformat(notification_data['schedule'].replace("Z", "+00:00"))
-                notification_data['schedule'] = dt.isoformat().replace("+00:00", "Z")
-            except Exception as e:
-                logger.warning(f"Failed to standardize schedule format: {notification_data['schedule']}, error: {str(e)}")
-        
-        # For reminder notifications, get additional data if needed
-        if notification_data['action'].startswith('reminder_') and 'bookingID' in notification_data and notification_data['bookingID'] != 'test-booking-123':
+            normalized = normalize_schedule(notification_data['schedule'])
+            if normalized:
+                notification_data['schedule'] = normalized
+            else:
+                logger.warning(f"Failed to standardize schedule format: {notification_data['schedule']}")
+        
+        # For legacy reminder notifications, get additional data if needed
+        # (compact payloads already carry the booking's schedule and venue)
+        if not compact and notification_data.get('action', '').startswith('reminder_') and 'bookingID' in notification_data and notification_data['bookingID'] != 'test-booking-123':
             # Only fetch booking data for real bookings, not test ones
             booking_data = get_booking_data(notification_data['bookingID'])
             
@@ -56,12 +134,21 @@ def send_notification(notification_data):
         if not notification_data.get('action'):
             logger.error("Missing required action in notification data")
             return
+        
+        # Persist first so the client receives the inbox ID (to mark it read)
+        # and the sequence number assigned with it
+        if PERSIST_NOTIFICATIONS:
+            notification_data['notificationId'] = save_notification(notification_data, recipient_id)
+        else:
+            notification_data['seq'] = _next_local_seq(recipient_id)
             
-        # Convert any non-serializable values before sending
-        sanitized_data = sanitize_for_socket(notification_data)
+        # Convert any non-serializable values before sending; compact payloads
+        # are built from primitives only
+        sanitized_data = notification_data if compact else sanitize_for_socket(notification_data)
+        _remember(recipient_id, sanitized_data)
         
-        # Emit the notification via Socket.IO
-        emit('notification', sanitized_data, namespace='/', broadcast=True)
+        # Hand the notification to the recipient room's coalescing buffer
+        buffer_event(user_room(recipient_id), 'notification', sanitized_data)
         
     except Exception as e:
         logger.error(f"Error sending notification: {str(e)}")
@@ -113,22 +200,149 @@ def get_booking_data(booking_id):
         logger.error(f"Error fetching booking data: {str(e)}")
         return None
         
-def save_notification(notification_data):
+def save_notification(notification_data, recipient_id=None):
     """
-    Save notification to database (optional)
+    Save notification to the recipient's inbox and bump their unread counter
+    
+    The notification gets the recipient's next sequence number, which is also
+    written to notification_data['seq'].
     
     Args:
         notification_data (dict): Notification data to save
+        recipient_id (str): User ID of the recipient; defaults to
+            targetTeacherId / targetStudentId from the payload
+    
+    Returns:
+        str: ID of the stored notification, or None if it was not stored
     """
     try:
+        recipient_id = (recipient_id or notification_data.get('recipient_id')
+                        or notification_data.get('targetTeacherId')
+                        or notification_data.get('targetStudentId'))
+        if not recipient_id:
+            logger.warning("Not saving notification without a recipient")
+            return None
+        
         # Create a copy to avoid modifying the original
         db_notification = notification_data.copy()
         
         # Remove socket.io specific fields
         db_notification.pop('forceNotification', None)
+        db_notification.pop('notificationId', None)
+        
+        db_notification['recipient_id'] = recipient_id
+        db_notification['read'] = False
+        db_notification['created_at'] = firestore.SERVER_TIMESTAMP
+        
+        # Write the notification and the counter together; the transaction
+        # keeps sequence numbers unique across processes
+        notification_ref = db.collection('notifications').document()
+        counter_ref = db.collection('notification_counters').document(recipient_id)
+        notification_data['seq'] = _store_with_seq(db.transaction(), counter_ref,
+                                                   notification_ref, db_notification)
         
-        # Add to Firestore
-        db.collection('notifications').add(db_notification)
+        return notification_ref.id
         
     except Exception as e:
         logger.error(f"Error saving notification: {str(e)}")
+        return None
+
+@firestore.transactional
+def _store_with_seq(transaction, counter_ref, notification_ref, db_notification):
+    counter = counter_ref.get(transaction=transaction)
+    seq = ((counter.to_dict() or {}).get('seq', 0) if counter.exists else 0) + 1
+    db_notification['seq'] = seq
+    transaction.set(notification_ref, db_notification)
+    transaction.set(counter_ref, {'seq': seq, 'unread': firestore.Increment(1)}, merge=True)
+    return seq
+
+def _next_local_seq(user_id):
+    with _replay_lock:
+        seq = _local_seqs[user_id] = _local_seqs.get(user_id, 0) + 1
+    return seq
+
+def _remember(user_id, payload):
+    """Keep a sent payload in the user's replay buffer."""
+    if payload.get('seq') is None or NOTIFICATION_REPLAY_BUFFER <= 0:
+        return
+    with _replay_lock:
+        buffer = _replay_buffers.get(user_id)
+        if buffer is None:
+            buffer = _replay_buffers[user_id] = deque(maxlen=NOTIFICATION_REPLAY_BUFFER)
+        buffer.append(payload)
+
+def _current_seq(user_id):
+    if not PERSIST_NOTIFICATIONS:
+        with _replay_lock:
+            return _local_seqs.get(user_id, 0)
+    counter_doc = db.collection('notification_counters').document(user_id).get()
+    return (counter_doc.to_dict() or {}).get('seq', 0) if counter_doc.exists else 0
+
+def get_missed_notifications(user_id, last_seq):
+    """
+    Notifications a user has not seen yet
+    
+    Served from the in-memory buffer when it holds the whole gap, otherwise
+    from Firestore.
+    
+    Args:
+        user_id (str): Recipient user ID
+        last_seq (int): Last sequence number the client has seen, or None for
+            a client that has never seen one
+    
+    Returns:
+        dict: {'events': payloads with seq > last_seq (oldest first),
+               'seq': latest sequence number,
+               'truncated': True if older missed notifications were left out}
+    """
+    latest = _current_seq(user_id)
+    if last_seq is None or latest <= last_seq:
+        return {'events': [], 'seq': latest, 'truncated': False}
+    
+    missing = latest - last_seq
+    with _replay_lock:
+        buffered = [p for p in _replay_buffers.get(user_id, ()) if last_seq < p['seq'] <= latest]
+    
+    if len(buffered) == missing or not PERSIST_NOTIFICATIONS:
+        source = 'memory'
+        events = buffered
+    else:
+        # This process did not send (or no longer holds) part of the gap
+        source = 'firestore'
+        docs = db.collection('notifications') \
+                 .where('recipient_id', '==', user_id) \
+                 .where('seq', '>', last_seq) \
+                 .order_by('seq', direction=firestore.Query.DESCENDING) \
+                 .limit(NOTIFICATION_REPLAY_LIMIT).stream()
+        events = []
+        for doc in docs:
+            n = sanitize_for_socket(doc.to_dict())
+            n['notificationId'] = doc.id
+            events.append(n)
+        events.reverse()
+    
+    events = events[-NOTIFICATION_REPLAY_LIMIT:]
+    metrics_service.inc("notification_replays_total", source=source)
+    return {'events': events, 'seq': latest, 'truncated': len(events) < missing}
+
+def _replay(sid, user_id, last_seq):
+    """Send a reconnecting socket what it missed. Runs on a dispatcher worker."""
+    try:
+        socketio.emit('notification_replay', get_missed_notifications(user_id, last_seq), to=sid)
+    except Exception as e:
+        logger.error(f"Error replaying notifications for {user_id}: {str(e)}")
+
+def handle_replay_request(data=None):
+    """
+    Socket handler: the client asks for the notifications it missed while
+    disconnected (registered in init_socket)
+    Example payload: {"lastSeq": 41}   // omitted/null on a client's first connect
+    """
+    user = connected_users.get(request.sid)
+    if not user:
+        return
+    last_seq = (data or {}).get('lastSeq')
+    if last_seq is not None and not isinstance(last_seq, int):
+        return
+    # Queued behind the user's pending deliveries so the buffer is up to date
+    submit(user_room(user['user_id']), _replay, request.sid, user['user_id'], last_seq)
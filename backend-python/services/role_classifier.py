@@ -0,0 +1,93 @@
+import os
+import re
+import logging
+from collections import defaultdict
+from services import metrics_service
+from services.google_gemini import identify_roles_in_transcription
+from utils.transcript_parser import split_turns, format_turns, role_labels
+
+logger = logging.getLogger(__name__)
+
+# Diarized transcripts are labelled locally when the teacher stands out
+# clearly enough; below this confidence (0-1) Gemini decides instead
+ROLE_HEURISTIC_MIN_CONFIDENCE = float(os.getenv("ROLE_HEURISTIC_MIN_CONFIDENCE", "0.5"))
+# Fewer turns than this is too little evidence to go on
+ROLE_HEURISTIC_MIN_TURNS = int(os.getenv("ROLE_HEURISTIC_MIN_TURNS", "6"))
+
+# Weights of each speaker's share of the talk time, of the questions asked
+# (per sentence spoken) and of opening the session; they sum to 1
+TALK_WEIGHT = 0.6
+QUESTION_WEIGHT = 0.2
+FIRST_SPEAKER_WEIGHT = 0.2
+
+_SENTENCE_END_RE = re.compile(r"[.!?]+")
+
+metrics_service.describe("role_identification_total", "Transcripts role-labelled, by method")
+
+def classify_speakers(turns):
+    """
+    Pick the teacher among diarized speakers from talk time, question
+    density and who speaks first.
+
+    Args:
+        turns (list): (speaker, text) pairs from split_turns
+
+    Returns:
+        tuple: (teacher, confidence) where confidence is the teacher's score
+            margin over the runner-up relative to its own score (0-1);
+            (None, 0.0) when there is not enough to go on
+    """
+    speakers = list(dict.fromkeys(speaker for speaker, _ in turns))
+    if len(speakers) < 2 or len(turns) < ROLE_HEURISTIC_MIN_TURNS:
+        return None, 0.0
+
+    talk = defaultdict(int)
+    sentences = defaultdict(int)
+    questions = defaultdict(int)
+    for speaker, text in turns:
+        talk[speaker] += len(text)
+        sentences[speaker] += max(len(_SENTENCE_END_RE.findall(text)), 1)
+        questions[speaker] += text.count("?")
+
+    total_talk = sum(talk.values()) or 1
+    density = {speaker: questions[speaker] / sentences[speaker] for speaker in speakers}
+    total_density = sum(density.values())
+
+    scores = {}
+    for speaker in speakers:
+        question_share = density[speaker] / total_density if total_density else 1 / len(speakers)
+        scores[speaker] = (TALK_WEIGHT * talk[speaker] / total_talk
+                           + QUESTION_WEIGHT * question_share
+                           + FIRST_SPEAKER_WEIGHT * (speaker == turns[0][0]))
+
+    ranked = sorted(speakers, key=scores.get, reverse=True)
+    best, runner_up = scores[ranked[0]], scores[ranked[1]]
+    return ranked[0], (best - runner_up) / best if best else 0.0
+
+def label_locally(transcription):
+    """
+    Role-label a transcript with the heuristic alone
+
+    Returns:
+        str: Transcript with "Teacher:" / "Student N:" prefixes, or None when
+            the classifier is not confident enough
+    """
+    preamble, turns = split_turns(transcription)
+    teacher, confidence = classify_speakers(turns)
+    if teacher is None or confidence < ROLE_HEURISTIC_MIN_CONFIDENCE:
+        logger.info(f"Role heuristic not confident ({confidence:.2f})")
+        metrics_service.inc("role_identification_total", method='llm')
+        return None
+    metrics_service.inc("role_identification_total", method='heuristic')
+    annotated = format_turns(turns, role_labels(turns, teacher))
+    return f"{preamble}\n{annotated}" if preamble else annotated
+
+def identify_roles(transcription):
+    """
+    Role-label a transcript, locally when the diarization is unambiguous
+    and with Gemini otherwise. The output format is the same either way.
+
+    Returns:
+        str: Transcript with "Teacher:" / "Student N:" prefixes
+    """
+    return label_locally(transcription) or identify_roles_in_transcription(transcription)
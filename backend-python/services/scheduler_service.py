@@ -1,17 +1,96 @@
 import logging
 import datetime
+import os
+import random
+import threading
+import time
 import pytz
 # Add the missing imports from APScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from google.cloud import firestore
 from services.firebase_service import db
-from services.notification_service import send_notification
+from services.notification_service import send_notification, compact_notification
+from services import metrics_service
+from utils.schedule_parser import parse_schedule
 
 # Configure logging with more detail
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
 logger = logging.getLogger("scheduler_service")
 
+# Fraction of bookings whose per-booking detail is logged (at DEBUG) on each run.
+# 0 disables per-booking logging entirely; 1 logs every booking.
+SCHEDULER_DEBUG_SAMPLE_RATE = float(os.getenv("SCHEDULER_DEBUG_SAMPLE_RATE", "0"))
+
+# Last-run statistics per job, exposed on /scheduler/status
+_job_stats = {}
+_job_stats_lock = threading.Lock()
+
+metrics_service.describe("scheduler_job_runs_total", "Completed reminder job runs")
+metrics_service.describe("scheduler_job_duration_seconds", "Wall time of reminder job runs")
+metrics_service.describe("scheduler_bookings_scanned_total", "Confirmed bookings scanned by reminder jobs")
+metrics_service.describe("scheduler_bookings_matched_total", "Bookings inside a reminder window")
+metrics_service.describe("scheduler_parse_failures_total", "Booking schedules that could not be parsed")
+metrics_service.describe("scheduler_reminders_sent_total", "Reminder notifications sent")
+metrics_service.describe("scheduler_lag_seconds", "Delay between a job's scheduled and actual start")
+
+def _sample_booking_detail():
+    """Decide whether per-booking detail should be logged for this booking."""
+    return (SCHEDULER_DEBUG_SAMPLE_RATE > 0
+            and logger.isEnabledFor(logging.DEBUG)
+            and random.random() < SCHEDULER_DEBUG_SAMPLE_RATE)
+
+def _new_run_stats():
+    return {
+        "started_at": datetime.datetime.now(pytz.UTC).isoformat(),
+        "_t0": time.monotonic(),
+        "bookings_scanned": 0,
+        "bookings_matched": 0,
+        "parse_failures": 0,
+        "reminders_sent": 0,
+        "errors": 0,
+    }
+
+def _record_job_run(job_id, run):
+    """Store the stats of a finished run and publish them as metrics."""
+    run["duration_seconds"] = round(time.monotonic() - run.pop("_t0"), 4)
+    run["finished_at"] = datetime.datetime.now(pytz.UTC).isoformat()
+
+    metrics_service.inc("scheduler_job_runs_total", job=job_id)
+    metrics_service.observe("scheduler_job_duration_seconds", run["duration_seconds"], job=job_id)
+    metrics_service.inc("scheduler_bookings_scanned_total", run["bookings_scanned"], job=job_id)
+    metrics_service.inc("scheduler_bookings_matched_total", run["bookings_matched"], job=job_id)
+    metrics_service.inc("scheduler_parse_failures_total", run["parse_failures"], job=job_id)
+    metrics_service.inc("scheduler_reminders_sent_total", run["reminders_sent"], job=job_id)
+
+    with _job_stats_lock:
+        stats = _job_stats.setdefault(job_id, {"runs": 0})
+        stats["runs"] += 1
+        stats["last_run"] = run
+
+    logger.info(f"{job_id} finished in {run['duration_seconds']}s: scanned={run['bookings_scanned']} "
+                f"matched={run['bookings_matched']} parse_failures={run['parse_failures']} "
+                f"reminders_sent={run['reminders_sent']} errors={run['errors']}")
+
+def _on_job_submitted(event):
+    """APScheduler listener recording how late a job was handed to the executor."""
+    if not event.scheduled_run_times:
+        return
+    lag = (datetime.datetime.now(pytz.UTC) - event.scheduled_run_times[0]).total_seconds()
+    lag = max(lag, 0.0)
+    metrics_service.observe("scheduler_lag_seconds", lag, job=event.job_id)
+    with _job_stats_lock:
+        _job_stats.setdefault(event.job_id, {"runs": 0})["last_lag_seconds"] = round(lag, 4)
+
+def get_scheduler_metrics():
+    """Return per-job statistics for the status endpoints."""
+    with _job_stats_lock:
+        return {
+            "debug_sample_rate": SCHEDULER_DEBUG_SAMPLE_RATE,
+            "jobs": {job_id: dict(stats) for job_id, stats in _job_stats.items()},
+        }
+
 # Add these helper functions to improve debugging
 
 def check_and_restart_scheduler():
@@ -75,6 +154,9 @@ def initialize_scheduler():
         replace_existing=True
     )
     
+    # Record scheduling lag for every job submission
+    scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+
     # Start the scheduler
     scheduler.start()
     logger.info("Appointment reminder scheduler started with jobs:")
@@ -86,6 +168,7 @@ def initialize_scheduler():
 def check_appointments_24h():
     """Check for appointments happening approximately 24 hours from now and send reminders"""
     logger.info("Checking for appointments scheduled in 24 hours...")
+    run = _new_run_stats()
     
     try:
         # Get current time in UTC
@@ -103,18 +186,13 @@ def check_appointments_24h():
         # Get all confirmed bookings and filter by time range in Python
         # (Firestore doesn't support inequality filters on multiple fields)
         bookings = list(query.stream())
-        bookings_sent = 0
-        notifications_sent = 0
+        run["bookings_scanned"] = len(bookings)
         
         for booking in bookings:
             try:
                 booking_data = booking.to_dict()
                 booking_id = booking.id
                 
-                # Skip if no schedule
-                if 'schedule' not in booking_data:
-                    continue
-                    
                 # Parse schedule datetime
                 schedule_str = booking_data.get('schedule')
                 
@@ -122,295 +200,149 @@ def check_appointments_24h():
                 if not schedule_str or not isinstance(schedule_str, str):
                     continue
                     
-                try:
-                    # Try to parse ISO format
-                    schedule_time = datetime.datetime.fromisoformat(schedule_str.replace('Z', '+00:00'))
-                    if not schedule_time.tzinfo:
-                        schedule_time = schedule_time.replace(tzinfo=pytz.UTC)
-                except ValueError:
-                    # If that fails, try a more general parser
-                    try:
-                        from dateutil import parser
-                        schedule_time = parser.parse(schedule_str)
-                        if not schedule_time.tzinfo:
-                            schedule_time = schedule_time.replace(tzinfo=pytz.UTC)
-                    except:
-                        logger.warning(f"Could not parse schedule time: {schedule_str}")
-                        continue
+                schedule_time = parse_booking_time(schedule_str)
+                if not schedule_time:
+                    run["parse_failures"] += 1
+                    logger.debug(f"Could not parse schedule time: {schedule_str}")
+                    continue
+                
+                if _sample_booking_detail():
+                    hours_from_now = (schedule_time - now).total_seconds() / 3600.0
+                    logger.debug(f"Booking {booking_id} scheduled for {schedule_time} ({hours_from_now:.2f}h from now)")
                 
                 # Skip if not in 24-hour window
                 if not (time_range_start <= schedule_time <= time_range_end):
                     continue
                     
                 # Process the booking for reminders
-                process_booking_reminder(booking_data, booking_id, "reminder_24h")
-                bookings_sent += 1
-                notifications_sent += 2  # Typically 2 notifications (student + teacher)
+                run["bookings_matched"] += 1
+                run["reminders_sent"] += process_booking_reminder(booking_data, booking_id, "reminder_24h")
                 
             except Exception as e:
+                run["errors"] += 1
                 logger.error(f"Error processing booking {booking.id} for 24h reminder: {str(e)}")
         
-        logger.info(f"24h reminder check complete. Processed {bookings_sent} bookings, sent {notifications_sent} notifications.")
-        
     except Exception as e:
+        run["errors"] += 1
         logger.error(f"Error in 24h reminder check: {str(e)}")
+    finally:
+        _record_job_run('check_appointments_24h', run)
 
 def parse_booking_time(schedule_str):
     """
     Parses booking time in various formats and always returns a UTC datetime
     """
-    if not schedule_str or not isinstance(schedule_str, str):
-        return None
-        
-    parsed_time = None
-    
-    try:
-        # Try ISO format with Z
-        if 'Z' in schedule_str:
-            parsed_time = datetime.fromisoformat(schedule_str.replace('Z', '+00:00'))
-            logger.debug(f"Parsed with 'Z': {parsed_time}")
-        # Try full ISO format with timezone info
-        elif ('+' in schedule_str or '-' in schedule_str) and 'T' in schedule_str:
-            parsed_time = datetime.fromisoformat(schedule_str)
-            logger.debug(f"Parsed ISO with timezone: {parsed_time}")
-        # Try abbreviated ISO format (YYYY-MM-DDTHH:MM)
-        elif 'T' in schedule_str and len(schedule_str) >= 16:
-            base_time = datetime.fromisoformat(schedule_str)
-            parsed_time = base_time.replace(tzinfo=pytz.UTC)
-            logger.debug(f"Parsed abbreviated ISO, assuming UTC: {parsed_time}")
-    except Exception as e:
-        logger.warning(f"Primary parsing failed for '{schedule_str}': {str(e)}")
-    
-    # Fallback: use dateutil parser if needed
-    if parsed_time is None:
-        try:
-            from dateutil import parser
-            parsed_time = parser.parse(schedule_str)
-            if not parsed_time.tzinfo:
-                parsed_time = parsed_time.replace(tzinfo=pytz.UTC)
-            logger.debug(f"Parsed using dateutil: {parsed_time}")
-        except Exception as e:
-            logger.warning(f"All parsing methods failed for '{schedule_str}': {str(e)}")
-            return None
-    
-    return parsed_time
+    return parse_schedule(schedule_str)
 
 def check_appointments_1h():
     """Check for appointments happening approximately 1 hour from now and send reminders"""
-    logger.info("Checking for appointments scheduled in 1 hour...")
+    run = _new_run_stats()
     
     try:
         # Get current time in UTC
         now_utc = datetime.datetime.now(pytz.UTC)
         
-        # Also get the current time in local timezone for logging clarity
+        # Local timezone, only used to make sampled debug output readable
         local_tz = pytz.timezone('Asia/Singapore')  # UTC+8 timezone
-        now_local = now_utc.astimezone(local_tz)
-        
-        logger.info(f"Current UTC time: {now_utc}")
-        logger.info(f"Current local time (UTC+8): {now_local}")
         
         # Calculate target time range with a WIDE window (±30 minutes around 1 hour from now)
         target_time_utc = now_utc + datetime.timedelta(hours=1)
         time_range_start = target_time_utc - datetime.timedelta(minutes=30)
         time_range_end = target_time_utc + datetime.timedelta(minutes=30)
         
-        # Log time ranges in both UTC and local time for clarity
-        logger.info(f"Looking for appointments between {time_range_start} and {time_range_end} (UTC)")
-        logger.info(f"Local time window: {time_range_start.astimezone(local_tz)} to {time_range_end.astimezone(local_tz)}")
+        logger.debug(f"Looking for appointments between {time_range_start} and {time_range_end} (UTC)")
         
         # Get all confirmed bookings
         bookings_ref = db.collection('bookings')
         query = bookings_ref.where('status', '==', 'confirmed')
         bookings = list(query.stream())
-        
-        logger.info(f"Found {len(bookings)} confirmed bookings total")
-        
-        # Log all bookings with their exact schedule for debugging
-        logger.info("All bookings with schedules:")
-        for idx, booking in enumerate(bookings):
-            booking_data = booking.to_dict()
-            schedule_str = booking_data.get('schedule', 'No schedule')
-            logger.info(f"  Booking #{idx+1} (ID: {booking.id}): schedule = {schedule_str}")
+        run["bookings_scanned"] = len(bookings)
         
         # Process each booking
         bookings_in_range = []
         
-        for idx, booking in enumerate(bookings):
+        for booking in bookings:
             booking_data = booking.to_dict()
             schedule_str = booking_data.get('schedule')
+            if not schedule_str:
+                continue
             
             # Use the new consistent parsing function
             parsed_time = parse_booking_time(schedule_str)
             
-            if parsed_time:
-                # Log both UTC and local time versions of the booking time
-                local_booking_time = parsed_time.astimezone(local_tz)
-                logger.info(f"Booking {booking.id} scheduled for: {parsed_time} (UTC) = {local_booking_time} (Local)")
-                
-                # Calculate hours from now in both UTC and local time for clarity
+            if not parsed_time:
+                run["parse_failures"] += 1
+                logger.debug(f"Could not parse schedule time for booking {booking.id}: {schedule_str}")
+                continue
+            
+            # Per-booking detail is sampled so a full scan does not cost O(n) log lines
+            if _sample_booking_detail():
                 hours_from_now_utc = (parsed_time - now_utc).total_seconds() / 3600.0
-                logger.info(f"  Hours from now (UTC): {hours_from_now_utc:.2f}")
-                
-                # Check if in range - using UTC for all comparisons
-                if time_range_start <= parsed_time <= time_range_end:
-                    logger.info(f"FOUND booking in 1h range: {booking.id}")
-                    bookings_in_range.append((booking.id, booking_data))
-                else:
-                    logger.info(f"Booking {booking.id} not in 1h range: {hours_from_now_utc:.2f} hours from now (UTC)")
-            else:
-                logger.warning(f"Could not parse schedule time for booking {booking.id}: {schedule_str}")
+                logger.debug(f"Booking {booking.id} scheduled for: {parsed_time} (UTC) = "
+                             f"{parsed_time.astimezone(local_tz)} (Local), {hours_from_now_utc:.2f}h from now")
+            
+            # Check if in range - using UTC for all comparisons
+            if time_range_start <= parsed_time <= time_range_end:
+                bookings_in_range.append((booking.id, booking_data))
         
-        logger.info(f"Found {len(bookings_in_range)} bookings in 1-hour reminder range")
+        run["bookings_matched"] = len(bookings_in_range)
         
         # Process bookings that match the time range
         for booking_id, booking_data in bookings_in_range:
             try:
-                process_booking_reminder(booking_data, booking_id, "reminder_1h")
+                run["reminders_sent"] += process_booking_reminder(booking_data, booking_id, "reminder_1h")
                 logger.info(f"Processed 1h reminder for booking {booking_id}")
             except Exception as e:
+                run["errors"] += 1
                 logger.error(f"Error processing booking {booking_id} for 1h reminder: {str(e)}")
     
     except Exception as e:
+        run["errors"] += 1
         logger.error(f"Error in 1h reminder check: {str(e)}")
+    finally:
+        _record_job_run('check_appointments_1h', run)
 
 def process_booking_reminder(booking_data, booking_id, reminder_type):
-    """Process a single booking for reminder notifications"""
+    """Process a single booking for reminder notifications.
+
+    Reminders use the compact payload schema: booking, teacher and student IDs
+    plus schedule and venue. Clients resolve names from their booking cache,
+    so no user documents are read here.
+
+    Returns the number of notifications that were sent.
+    """
+    sent = 0
     try:
-        # Get teacher reference and data
         teacher_ref = booking_data.get('teacherID')
         if not teacher_ref or not isinstance(teacher_ref, firestore.DocumentReference):
             logger.warning(f"Invalid teacher reference in booking {booking_id}: {teacher_ref}")
-            return
+            return sent
             
         logger.info(f"Processing {reminder_type} for booking {booking_id} with teacher ref {teacher_ref.path}")
-            
-        # Get teacher email and name
-        teacher_doc = db.collection('user').document(teacher_ref.id).get()
-        if not teacher_doc.exists:
-            logger.warning(f"Teacher {teacher_ref.id} not found")
-            return
-            
-        teacher_data = teacher_doc.to_dict()
-        teacher_email = teacher_data.get('email')
-        teacher_name = f"{teacher_data.get('firstName', '')} {teacher_data.get('lastName', '')}"
         
-        if not teacher_email:
-            logger.warning(f"No email for teacher {teacher_ref.id}")
-            return
-        
-        # Get all student data to include in notifications
-        student_refs = booking_data.get('studentID', [])
-        student_details = []
-        
-        for student_ref in student_refs:
-            try:
-                if not student_ref or not isinstance(student_ref, firestore.DocumentReference):
-                    continue
-                    
-                student_doc = db.collection('user').document(student_ref.id).get()
-                if not student_doc.exists:
-                    continue
-                    
-                student_data = student_doc.to_dict()
-                student_name = f"{student_data.get('firstName', '')} {student_data.get('lastName', '')}"
-                student_email = student_data.get('email')
-                
-                if student_email:
-                    student_details.append({
-                        'id': student_ref.id,
-                        'name': student_name,
-                        'email': student_email,
-                        'year_section': student_data.get('year_section', 'Unknown'),
-                        'program': student_data.get('program', 'Unknown')
-                    })
-            except Exception as e:
-                logger.warning(f"Error fetching details for student {student_ref.id}: {str(e)}")
-        
-        # Get additional booking context if available
-        subject = booking_data.get('subject', '')
-        description = booking_data.get('description', '')
-        date_str = ""
+        student_ids = [ref.id for ref in booking_data.get('studentID', [])
+                       if ref and isinstance(ref, firestore.DocumentReference)]
         venue = booking_data.get('venue', 'Not specified')
-        schedule_str = booking_data.get('schedule', '')
-        
-        # Format the date more readably if possible
-        try:
-            parsed_time = parse_booking_time(schedule_str)
-            if parsed_time:
-                date_str = parsed_time.strftime("%A, %B %d, %Y at %I:%M %p")
-        except Exception:
-            date_str = schedule_str
-            
-        # Format student names for display
-        student_names = [s['name'] for s in student_details if s.get('name')]
-        formatted_student_names = ", ".join(student_names) if student_names else "No students"
-        
-        # Create a richer message
         message = f"Reminder: Appointment in {reminder_type.replace('reminder_', '')} at {venue}"
-        if subject:
-            message += f" regarding {subject}"
-            
-        # Summary text for notification
-        summary = f"Appointment with {teacher_name} and {len(student_names)} student(s)"
-        if date_str:
-            summary += f" on {date_str}"
-            
-        logger.info(f"Sending {reminder_type} to teacher {teacher_name} <{teacher_email}>")
         
-        # Send notification to teacher with all student details
-        teacher_notification = {
-            'action': reminder_type,
-            'bookingID': booking_id,
-            'targetEmail': teacher_email,
-            'targetTeacherId': teacher_ref.id,
-            'teacherName': teacher_name,
-            'schedule': schedule_str,
+        common = {
+            'teacherID': teacher_ref.id,
+            'studentIDs': student_ids,
+            'schedule': booking_data.get('schedule', ''),
             'venue': venue,
-            'timestamp': datetime.datetime.now(pytz.UTC).isoformat(),
             'message': message,
-            'summary': summary,
-            'students': student_details,       # Include full student data 
-            'studentNames': formatted_student_names,  # Formatted list of names
-            'subject': subject,
-            'description': description
         }
-        send_notification(teacher_notification)
         
-        # Send notifications to each student with teacher details
-        for student in student_details:
-            try:
-                logger.info(f"Sending {reminder_type} to student {student['id']} <{student['email']}>")
-                
-                # Customize message with student's name
-                student_message = f"Hi {student['name'].split()[0]}, reminder for your appointment in {reminder_type.replace('reminder_', '')} with {teacher_name} at {venue}"
-                
-                student_notification = {
-                    'action': reminder_type,
-                    'bookingID': booking_id,
-                    'targetEmail': student['email'],
-                    'targetStudentId': student['id'],
-                    'teacherName': teacher_name,
-                    'schedule': schedule_str,
-                    'schedulePretty': date_str,  # Add formatted date
-                    'venue': venue,
-                    'timestamp': datetime.datetime.now(pytz.UTC).isoformat(),
-                    'message': student_message,
-                    'summary': summary,
-                    'subject': subject,
-                    'description': description,
-                    'teacher': {                  # Include teacher info
-                        'id': teacher_ref.id,
-                        'name': teacher_name,
-                        'email': teacher_email,
-                        'department': teacher_data.get('department', 'Unknown')
-                    },
-                    'otherStudents': [s['name'] for s in student_details if s['id'] != student['id']]  # List other students
-                }
-                send_notification(student_notification)
-                
-            except Exception as e:
-                logger.error(f"Error sending notification to student {student['id']}: {str(e)}")
+        if send_notification(compact_notification(reminder_type, booking_id,
+                                                  targetTeacherId=teacher_ref.id, **common)):
+            sent += 1
+        
+        for student_id in student_ids:
+            if send_notification(compact_notification(reminder_type, booking_id,
+                                                      targetStudentId=student_id, **common)):
+                sent += 1
                 
     except Exception as e:
         logger.error(f"Error processing booking reminder for {booking_id}: {str(e)}", exc_info=True)
+
+    return sent
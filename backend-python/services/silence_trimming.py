@@ -0,0 +1,122 @@
+import os
+import wave
+import bisect
+import logging
+from services.audio_conversion_service import detect_silences
+from services import metrics_service
+
+logger = logging.getLogger(__name__)
+
+# Long silences (waiting, writing, setup) are cut from the audio sent for
+# transcription. The archived recording keeps them; transcript timestamps
+# are translated back to positions in it.
+SILENCE_TRIM_ENABLED = os.getenv("SILENCE_TRIM_ENABLED", "true").lower() in ("1", "true", "yes")
+# Level below which audio counts as silence, and the shortest silence cut
+SILENCE_THRESHOLD_DB = float(os.getenv("SILENCE_THRESHOLD_DB", "-35"))
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "1.5"))
+# Audio kept on each side of speech, so words are not clipped and turns stay
+# apart
+SILENCE_PADDING_SECONDS = float(os.getenv("SILENCE_PADDING_SECONDS", "0.3"))
+# Below this share of the recording, trimming is not worth a second file
+SILENCE_TRIM_MIN_SAVING = float(os.getenv("SILENCE_TRIM_MIN_SAVING", "0.05"))
+
+# Frames copied per read when writing the trimmed file
+COPY_CHUNK_FRAMES = 64 * 1024
+
+metrics_service.describe("silence_trimmed_ratio", "Share of each recording cut as silence before transcription")
+
+def speech_regions(silences, duration, padding=SILENCE_PADDING_SECONDS):
+    """
+    The parts of a recording outside its silences, padded and merged
+
+    Args:
+        silences (list): (start, end) pairs in seconds from detect_silences
+        duration (float): Length of the recording in seconds
+        padding (float): Seconds of silence kept next to speech
+
+    Returns:
+        list: (start, end) pairs in seconds, in order and not overlapping
+    """
+    regions = []
+    position = 0.0
+    for start, end in silences:
+        regions.append((position, start))
+        position = duration if end is None else end
+    regions.append((position, duration))
+
+    merged = []
+    for start, end in regions:
+        if end <= start:
+            continue
+        start, end = max(start - padding, 0.0), min(end + padding, duration)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def trim_silence(wav_path):
+    """
+    Write a copy of a converted recording without its long silences
+
+    Returns:
+        tuple: (path, time_map). path is wav_path itself when trimming is
+            disabled or would save too little; otherwise a new file the
+            caller removes. time_map holds (trimmed_start_ms,
+            original_start_ms, length_ms) segments for to_original_ms, or
+            None when the audio was not trimmed.
+    """
+    if not SILENCE_TRIM_ENABLED:
+        return wav_path, None
+
+    with wave.open(wav_path, 'rb') as source:
+        rate = source.getframerate()
+        total_frames = source.getnframes()
+    duration = total_frames / rate if rate else 0.0
+    if not duration:
+        return wav_path, None
+
+    regions = speech_regions(detect_silences(wav_path, SILENCE_THRESHOLD_DB, SILENCE_MIN_SECONDS), duration)
+    kept = sum(end - start for start, end in regions)
+    saving = 1 - kept / duration
+    metrics_service.observe("silence_trimmed_ratio", max(saving, 0.0))
+    if not regions or saving < SILENCE_TRIM_MIN_SAVING:
+        return wav_path, None
+
+    trimmed_path = os.path.splitext(wav_path)[0] + "_trimmed.wav"
+    time_map = []
+    written = 0
+    with wave.open(wav_path, 'rb') as source, wave.open(trimmed_path, 'wb') as target:
+        target.setparams(source.getparams())
+        frame_size = source.getsampwidth() * source.getnchannels()
+        for start, end in regions:
+            first, last = int(start * rate), min(int(end * rate), total_frames)
+            time_map.append((written * 1000 // rate, first * 1000 // rate, (last - first) * 1000 // rate))
+            source.setpos(first)
+            remaining = last - first
+            while remaining > 0:
+                frames = source.readframes(min(COPY_CHUNK_FRAMES, remaining))
+                if not frames:
+                    break
+                target.writeframes(frames)
+                remaining -= len(frames) // frame_size
+            written += last - first
+
+    logger.info(f"Trimmed {saving:.0%} silence from {wav_path} ({duration:.0f}s -> {kept:.0f}s)")
+    return trimmed_path, time_map
+
+def to_original_ms(time_map, trimmed_ms):
+    """Translate a position in the trimmed audio to one in the original recording."""
+    if not time_map or trimmed_ms is None:
+        return trimmed_ms
+    index = max(bisect.bisect_right([segment[0] for segment in time_map], trimmed_ms) - 1, 0)
+    trimmed_start, original_start, length = time_map[index]
+    return original_start + min(max(trimmed_ms - trimmed_start, 0), length)
+
+def restore_timestamps(transcription_data, time_map):
+    """Rewrite the sentiment start/end times of transcription results to original positions."""
+    if time_map:
+        for result in transcription_data.get("raw_sentiment_analysis", []):
+            result["start"] = to_original_ms(time_map, result.get("start"))
+            result["end"] = to_original_ms(time_map, result.get("end"))
+    return transcription_data
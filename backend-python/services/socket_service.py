@@ -1,16 +1,112 @@
-from flask_socketio import SocketIO
+import os
+import logging
+import secrets
+from flask import request
+from flask_socketio import SocketIO, join_room
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 
-socketio = SocketIO(cors_allowed_origins="*")
+logger = logging.getLogger(__name__)
+
+# Optional message queue (e.g. redis://localhost:6379/0) shared by every web worker
+# and the scheduler process, so an emit from any of them reaches clients connected
+# to any worker. Without it, emits only reach clients of the current process.
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "polycon-socketio")
+
+# Packet serializer: "default" (JSON) or "msgpack" (binary, needs the msgpack
+# package here and socket.io-msgpack-parser on every client)
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "default").lower()
+
+socketio = SocketIO(cors_allowed_origins="*",
+                    message_queue=SOCKETIO_MESSAGE_QUEUE,
+                    channel=SOCKETIO_CHANNEL,
+                    serializer=SOCKETIO_SERIALIZER)
+
+# Secret used to sign socket tokens issued at login. Set it explicitly so tokens
+# survive restarts and are accepted by every worker.
+SOCKET_AUTH_SECRET = os.getenv("SOCKET_AUTH_SECRET")
+if not SOCKET_AUTH_SECRET:
+    logger.warning("SOCKET_AUTH_SECRET not set; using a random secret (socket tokens reset on restart)")
+    SOCKET_AUTH_SECRET = secrets.token_hex(32)
+
+SOCKET_TOKEN_MAX_AGE = int(os.getenv("SOCKET_TOKEN_MAX_AGE", str(7 * 24 * 3600)))
+
+_token_serializer = URLSafeTimedSerializer(SOCKET_AUTH_SECRET, salt="polycon-socket")
+
+# sid -> {'user_id', 'role'} for every authenticated connection
+connected_users = {}
+
+def issue_socket_token(user_id, role):
+    """Create a signed token the client presents when opening its socket."""
+    return _token_serializer.dumps({"uid": user_id, "role": role})
+
+def verify_socket_token(token):
+    """
+    Verify a socket token
+
+    Returns:
+        dict: {'user_id', 'role'} or None if the token is missing, forged or expired
+    """
+    if not token:
+        return None
+    try:
+        data = _token_serializer.loads(token, max_age=SOCKET_TOKEN_MAX_AGE)
+    except BadSignature:
+        return None
+    return {"user_id": data.get("uid"), "role": data.get("role")}
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+def role_room(role):
+    return f"role:{role}"
+
+def booking_rooms(teacher_id, student_ids):
+    """Rooms that should see changes to a booking: its participants and the admins."""
+    rooms = [user_room(student_id) for student_id in student_ids or [] if student_id]
+    if teacher_id:
+        rooms.append(user_room(teacher_id))
+    rooms.append(role_room("admin"))
+    return rooms
 
 def init_socket(app):
-    socketio.init_app(app)
-    
+    socketio.init_app(app, message_queue=SOCKETIO_MESSAGE_QUEUE, channel=SOCKETIO_CHANNEL,
+                      serializer=SOCKETIO_SERIALIZER)
+    if SOCKETIO_SERIALIZER != "default":
+        logger.info(f"Socket.IO using the {SOCKETIO_SERIALIZER} packet serializer")
+    if SOCKETIO_MESSAGE_QUEUE:
+        logger.info(f"Socket.IO using message queue {SOCKETIO_MESSAGE_QUEUE} (channel {SOCKETIO_CHANNEL})")
+
     @socketio.on('connect')
-    def handle_connect():
-        print('Client connected')
+    def handle_connect(auth=None):
+        token = (auth or {}).get('token') or request.args.get('token')
+        user = verify_socket_token(token)
+        if not user or not user.get('user_id'):
+            logger.info('Rejected unauthenticated socket connection')
+            raise ConnectionRefusedError('unauthorized')
+
+        join_room(user_room(user['user_id']))
+        if user.get('role'):
+            join_room(role_room(user['role']))
+        connected_users[request.sid] = user
+        logger.info(f"Client connected: user={user['user_id']} role={user.get('role')}")
 
     @socketio.on('disconnect')
-    def handle_disconnect():
-        print('Client disconnected')
+    def handle_disconnect(*args):
+        user = connected_users.pop(request.sid, None)
+        logger.info(f"Client disconnected: user={user['user_id'] if user else 'unknown'}")
+        # Nobody else can stop this connection's live sessions
+        from services.live_transcription import discard_client_sessions
+        discard_client_sessions(request.sid)
+
+    # Imported here because the notification service itself emits through this module
+    from services.notification_service import handle_replay_request
+    socketio.on_event('replay_notifications', handle_replay_request)
+
+    from services.live_transcription import handle_live_start, handle_live_chunk, handle_live_stop, handle_live_abort
+    socketio.on_event('live_transcription_start', handle_live_start)
+    socketio.on_event('live_transcription_chunk', handle_live_chunk)
+    socketio.on_event('live_transcription_stop', handle_live_stop)
+    socketio.on_event('live_transcription_abort', handle_live_abort)
 
     return socketio
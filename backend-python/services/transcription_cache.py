@@ -0,0 +1,59 @@
+import os
+import wave
+import hashlib
+import logging
+from services import metrics_service
+from utils.disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Provider results (AssemblyAI transcript and sentiment, Gemini roles, audio
+# URL) keyed by a hash of the normalized audio, so a retried or re-submitted
+# recording skips every provider call.
+TRANSCRIPTION_CACHE_PATH = os.getenv("TRANSCRIPTION_CACHE_PATH", "cache/transcriptions.sqlite3")
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "500"))
+TRANSCRIPTION_CACHE_TTL = int(os.getenv("TRANSCRIPTION_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Audio frames hashed per read
+HASH_CHUNK_FRAMES = 64 * 1024
+
+metrics_service.describe("transcription_cache_total", "Transcription cache lookups, by result")
+
+_cache = DiskCache(TRANSCRIPTION_CACHE_PATH, TRANSCRIPTION_CACHE_MAX_ENTRIES, TRANSCRIPTION_CACHE_TTL)
+
+def cache_key(wav_path, speaker_count):
+    """
+    Key for a converted recording: SHA-256 of its PCM frames (the WAV header is
+    ignored) plus the diarization setting. None if the file cannot be read as WAV.
+    """
+    digest = hashlib.sha256()
+    try:
+        with wave.open(wav_path, 'rb') as wav:
+            digest.update(f"{wav.getframerate()}:{wav.getnchannels()}:{wav.getsampwidth()}:".encode())
+            while True:
+                frames = wav.readframes(HASH_CHUNK_FRAMES)
+                if not frames:
+                    break
+                digest.update(frames)
+    except (wave.Error, EOFError) as e:
+        logger.warning(f"Not caching {wav_path}: {str(e)}")
+        return None
+    return f"{digest.hexdigest()}:{speaker_count}"
+
+def get(key):
+    """
+    Cached provider results for a key
+
+    Returns:
+        dict: Stored value, or None on a miss (or an expired entry)
+    """
+    if not key:
+        return None
+    value = _cache.get(key)
+    metrics_service.inc("transcription_cache_total", result='hit' if value is not None else 'miss')
+    return value
+
+def put(key, value):
+    """Store provider results, then evict expired and least recently used entries."""
+    if key:
+        _cache.set(key, value)
@@ -0,0 +1,391 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from google.cloud import firestore
+from services.firebase_service import db
+from services.socket_service import socketio, user_room
+from services.google_storage import upload_audio
+from services.google_gemini import identify_roles_in_transcription, generate_summary, analyze_consultation
+from services.role_classifier import identify_roles, label_locally
+from services.audio_conversion_service import convert_audio, encode_archive
+from services.assemblyai_service import transcribe_audio_with_assemblyai
+from services.consultation_quality_service import calculate_consultation_quality
+from services.silence_trimming import trim_silence, restore_timestamps
+from services import metrics_service, transcription_cache
+
+logger = logging.getLogger(__name__)
+
+# Transcription jobs run on this many worker threads per process
+TRANSCRIPTION_WORKERS = max(int(os.getenv("TRANSCRIPTION_WORKERS", "2")), 1)
+
+# A process holds a lease on every job it has accepted and renews it while the
+# job is queued or running. Unfinished jobs whose lease has run out (their
+# process died) are picked up again by recover_jobs(), which every process
+# runs at startup and then once per lease period.
+TRANSCRIPTION_JOB_LEASE = int(os.getenv("TRANSCRIPTION_JOB_LEASE", "60"))
+
+# A job's audio (raw_path) is a file on the host that accepted it, so only
+# processes on that host can resume it. A job whose audio is not on this host
+# is left to its own host, and is marked failed once its lease has been expired
+# for this many seconds (that host is not coming back).
+TRANSCRIPTION_JOB_ORPHAN_AFTER = int(os.getenv("TRANSCRIPTION_JOB_ORPHAN_AFTER", "3600"))
+
+JOBS_COLLECTION = 'transcription_jobs'
+ACTIVE_STATUSES = ['queued', 'running']
+
+metrics_service.describe("transcription_jobs_total", "Finished transcription jobs, by status")
+metrics_service.describe("transcription_job_seconds", "Wall time of finished transcription jobs")
+metrics_service.describe("transcription_stage_seconds", "Time spent in each transcription pipeline stage")
+
+_executor = ThreadPoolExecutor(max_workers=TRANSCRIPTION_WORKERS, thread_name_prefix="transcription")
+# Side stages (GCS upload, role labelling) that run alongside a job's main
+# thread; each job has at most two of them in flight
+_stage_executor = ThreadPoolExecutor(max_workers=2 * TRANSCRIPTION_WORKERS, thread_name_prefix="transcription-stage")
+_instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Jobs accepted by this process, whose leases the heartbeat renews
+_owned = set()
+_owned_lock = threading.Lock()
+_heartbeat_started = False
+
+def create_job(raw_path, speaker_count, duration=None, user_id=None, converted=False, notes=None,
+               transcription_data=None):
+    """
+    Persist a transcription job and queue it on the worker pool
+
+    Args:
+        raw_path (str): Saved upload; removed when the job finishes
+        speaker_count (int): Expected number of speakers
+        duration (float): Session duration in seconds, if known
+        user_id (str): User to push progress events to
+        converted (bool): raw_path is already a 16kHz mono WAV (convert_stream)
+        notes (str): Session notes; when given the job also writes the summary
+        transcription_data (dict): Transcript already produced during the
+            session (live transcription); the job then skips transcription
+
+    Returns:
+        str: Job ID
+    """
+    job_ref = db.collection(JOBS_COLLECTION).document()
+    job_ref.set({
+        'status': 'queued',
+        'stage': 'queued',
+        'progress': 0,
+        'raw_path': raw_path,
+        'speaker_count': speaker_count,
+        'duration': duration,
+        'user_id': user_id,
+        'converted': converted,
+        'notes': notes,
+        'transcription_data': transcription_data,
+        'instance': _instance_id,
+        'lease_until': time.time() + TRANSCRIPTION_JOB_LEASE,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    _accept(job_ref.id)
+    return job_ref.id
+
+def get_job(job_id):
+    """
+    Public view of a job
+
+    Returns:
+        dict: {'job_id', 'status', 'stage', 'progress', 'result', 'error'} or None
+    """
+    doc = db.collection(JOBS_COLLECTION).document(job_id).get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+    return {
+        'job_id': doc.id,
+        'status': job.get('status'),
+        'stage': job.get('stage'),
+        'progress': job.get('progress', 0),
+        'result': job.get('result'),
+        'error': job.get('error'),
+    }
+
+def recover_jobs():
+    """
+    Take over unfinished jobs whose owning process stopped renewing their lease
+
+    Only jobs whose audio is on this host can be resumed (see
+    TRANSCRIPTION_JOB_ORPHAN_AFTER); the others are eventually marked failed.
+    Also starts the heartbeat, which repeats this every lease period.
+    """
+    _ensure_heartbeat()
+    try:
+        docs = db.collection(JOBS_COLLECTION).where('status', 'in', ACTIVE_STATUSES).stream()
+        for doc in docs:
+            job = doc.to_dict()
+            lease_until = job.get('lease_until', 0)
+            if lease_until >= time.time():
+                continue
+            raw_path = job.get('raw_path')
+            if raw_path and os.path.exists(raw_path):
+                if _claim(db.transaction(), doc.reference):
+                    logger.info(f"Recovered transcription job {doc.id}")
+                    _accept(doc.id)
+            elif lease_until < time.time() - TRANSCRIPTION_JOB_ORPHAN_AFTER:
+                # Claimed first so only one process reports the failure
+                if _claim(db.transaction(), doc.reference):
+                    logger.warning(f"Transcription job {doc.id} lost its audio with its host")
+                    metrics_service.inc("transcription_jobs_total", status='failed')
+                    _update(doc.id, job.get('user_id'), status='failed',
+                            error="The server processing this recording stopped; please upload it again")
+    except Exception as e:
+        logger.error(f"Error recovering transcription jobs: {str(e)}")
+
+@firestore.transactional
+def _claim(transaction, job_ref):
+    snapshot = job_ref.get(transaction=transaction)
+    job = snapshot.to_dict() or {}
+    if job.get('status') not in ACTIVE_STATUSES or job.get('lease_until', 0) >= time.time():
+        return False
+    transaction.update(job_ref, {
+        'status': 'queued',
+        'instance': _instance_id,
+        'lease_until': time.time() + TRANSCRIPTION_JOB_LEASE,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    return True
+
+def _accept(job_id):
+    with _owned_lock:
+        _owned.add(job_id)
+    _ensure_heartbeat()
+    _executor.submit(_run_job, job_id)
+
+def _ensure_heartbeat():
+    global _heartbeat_started
+    with _owned_lock:
+        if _heartbeat_started:
+            return
+        _heartbeat_started = True
+    threading.Thread(target=_heartbeat_loop, name="transcription-heartbeat", daemon=True).start()
+
+def _heartbeat_loop():
+    last_recovery = time.monotonic()
+    while True:
+        time.sleep(TRANSCRIPTION_JOB_LEASE / 3)
+        if time.monotonic() - last_recovery >= TRANSCRIPTION_JOB_LEASE:
+            # Leases of a process that died while this one keeps running
+            last_recovery = time.monotonic()
+            recover_jobs()
+        with _owned_lock:
+            job_ids = list(_owned)
+        for job_id in job_ids:
+            try:
+                db.collection(JOBS_COLLECTION).document(job_id).update(
+                    {'lease_until': time.time() + TRANSCRIPTION_JOB_LEASE})
+            except Exception as e:
+                logger.warning(f"Could not renew lease of transcription job {job_id}: {str(e)}")
+
+def _update(job_id, user_id, **fields):
+    """Persist job progress and push it to the requesting user."""
+    fields['updated_at'] = firestore.SERVER_TIMESTAMP
+    db.collection(JOBS_COLLECTION).document(job_id).update(fields)
+    if user_id:
+        event = {'job_id': job_id}
+        event.update({k: fields[k] for k in ('status', 'stage', 'progress', 'error') if k in fields})
+        # Job workers are background threads already, so emit directly
+        socketio.emit('transcription_job', event, to=user_room(user_id))
+
+def _run_job(job_id):
+    started = time.monotonic()
+    job_ref = db.collection(JOBS_COLLECTION).document(job_id)
+    job = job_ref.get().to_dict() or {}
+    user_id = job.get('user_id')
+    raw_path = job.get('raw_path')
+    try:
+        if not raw_path or not os.path.exists(raw_path):
+            raise FileNotFoundError("Uploaded audio is no longer available")
+
+        def progress(stage, percent):
+            _update(job_id, user_id, status='running', stage=stage, progress=percent)
+
+        result = run_transcription_pipeline(raw_path, job.get('speaker_count', 1),
+                                            job.get('duration'), progress,
+                                            converted=job.get('converted', False),
+                                            notes=job.get('notes'),
+                                            transcription_data=job.get('transcription_data'))
+        _update(job_id, user_id, status='done', stage='done', progress=100, result=result)
+        metrics_service.inc("transcription_jobs_total", status='done')
+    except Exception as e:
+        logger.error(f"Transcription job {job_id} failed: {str(e)}", exc_info=True)
+        metrics_service.inc("transcription_jobs_total", status='failed')
+        try:
+            _update(job_id, user_id, status='failed', error=str(e))
+        except Exception as update_error:
+            logger.error(f"Could not record failure of transcription job {job_id}: {str(update_error)}")
+    finally:
+        metrics_service.observe("transcription_job_seconds", time.monotonic() - started)
+        with _owned_lock:
+            _owned.discard(job_id)
+        if raw_path and os.path.exists(raw_path):
+            os.remove(raw_path)
+
+def run_transcription_pipeline(raw_path, speaker_count, duration=None, progress=None, converted=False, notes=None,
+                               transcription_data=None):
+    """
+    Convert, store, transcribe, score and role-label one recording
+
+    Long silences are cut from the audio sent for transcription (the archive
+    keeps them). The archival encode and GCS upload run alongside transcription, and quality scoring runs
+    alongside role labelling as soon as the sentiment data is in, so the
+    total is set by the slowest branch rather than the sum of the stages.
+    Recordings seen before are served from the transcription cache without
+    calling any provider.
+
+    Args:
+        raw_path (str): Uploaded audio file
+        speaker_count (int): Expected number of speakers
+        duration (float): Session duration in seconds, if known
+        progress (callable): progress(stage, percent), called as stages start
+        converted (bool): raw_path is already a 16kHz mono WAV; skip conversion
+        notes (str): Session notes; when given, roles and summary come from
+            one combined Gemini request (see _roles_and_summary)
+        transcription_data (dict): transcription_text and raw_sentiment_analysis
+            gathered during the session; skips AssemblyAI and the cache
+
+    Returns:
+        dict: audioUrl, transcription, summary (None without notes),
+            quality_score, quality_metrics, raw_sentiment_analysis, timings
+            (seconds per stage and total) and cached (True when served from
+            the transcription cache)
+    """
+    progress = progress or (lambda stage, percent: None)
+    timings = {}
+    started = time.monotonic()
+
+    if converted:
+        converted_path = raw_path
+    else:
+        progress('converting', 5)
+        converted_path = _timed(timings, 'convert', convert_audio, raw_path, False)
+
+    cache_key = cached = None
+    if transcription_data is None:
+        cache_key = _timed(timings, 'fingerprint', transcription_cache.cache_key, converted_path, speaker_count)
+        cached = transcription_cache.get(cache_key)
+    if cached:
+        # Same audio was processed before: reuse every provider result
+        os.remove(converted_path)
+        audio_url = cached["audioUrl"]
+        transcription_data = cached["transcription_data"]
+        processed_transcription = cached["transcription"]
+        progress('analyzing', 80)
+        summary_future = _stage_executor.submit(_timed, timings, 'summarize', generate_summary,
+                                                f"{processed_transcription} {notes}") if notes else None
+        quality_score, quality_metrics = _timed(
+            timings, 'quality', calculate_consultation_quality,
+            transcription_data["raw_sentiment_analysis"],
+            transcription_data["transcription_text"],
+            duration
+        )
+        summary = summary_future.result() if summary_future else None
+    else:
+        progress('transcribing', 20)
+        upload_future = _stage_executor.submit(_archive_and_upload, converted_path, timings)
+        try:
+            if transcription_data is None:
+                transcription_data = _transcribe_trimmed(converted_path, speaker_count, timings)
+        finally:
+            # Both branches read the converted file
+            wait([upload_future])
+            os.remove(converted_path)
+
+        progress('analyzing', 80)
+        roles_future = _stage_executor.submit(_timed, timings, 'identify_roles',
+                                              _roles_and_summary, transcription_data["transcription_text"], notes)
+        quality_score, quality_metrics = _timed(
+            timings, 'quality', calculate_consultation_quality,
+            transcription_data["raw_sentiment_analysis"],
+            transcription_data["transcription_text"],
+            duration
+        )
+        audio_url, _ = upload_future.result()
+        processed_transcription, summary = roles_future.result()
+
+        # identify_roles reports failures as text; don't keep those
+        if not processed_transcription.startswith("Error identifying roles"):
+            transcription_cache.put(cache_key, {
+                "audioUrl": audio_url,
+                "transcription_data": transcription_data,
+                "transcription": processed_transcription,
+            })
+
+    timings['total'] = round(time.monotonic() - started, 3)
+    return {
+        "audioUrl": audio_url,
+        "transcription": processed_transcription,
+        "summary": summary,
+        "quality_score": quality_score,
+        "quality_metrics": quality_metrics,
+        "raw_sentiment_analysis": transcription_data["raw_sentiment_analysis"],
+        "timings": timings,
+        "cached": bool(cached)
+    }
+
+def _roles_and_summary(transcription, notes):
+    """
+    Role-labelled transcript and, when there are notes, the session summary
+
+    Without notes this is identify_roles. With notes, a confident local
+    labelling is followed by a summary request; otherwise roles, summary and
+    sentiment come from a single analyze_consultation request, which also
+    fills the caches behind /identify_roles and /summarize.
+
+    Returns:
+        tuple: (role-labelled transcript, summary or None)
+    """
+    if not notes:
+        return identify_roles(transcription), None
+    annotated = label_locally(transcription)
+    if annotated is None:
+        try:
+            analysis = analyze_consultation(transcription, notes)
+            return analysis["role_identified_transcription"], analysis["summary"]
+        except Exception as e:
+            logger.warning(f"Combined analysis failed, using separate requests: {str(e)}")
+            annotated = identify_roles_in_transcription(transcription)
+    return annotated, generate_summary(f"{annotated} {notes}")
+
+def _transcribe_trimmed(wav_path, speaker_count, timings):
+    """Transcribe a recording with its long silences cut, timestamps restored to the original."""
+    try:
+        trimmed_path, time_map = _timed(timings, 'trim_silence', trim_silence, wav_path)
+    except Exception as e:
+        # Trimming only saves provider time; transcribe the full recording instead
+        logger.warning(f"Silence trimming failed for {wav_path}, transcribing untrimmed audio: {str(e)}")
+        trimmed_path, time_map = wav_path, None
+    try:
+        transcription_data = _timed(timings, 'transcribe', transcribe_audio_with_assemblyai,
+                                    trimmed_path, speaker_count)
+    finally:
+        if trimmed_path != wav_path:
+            os.remove(trimmed_path)
+    return restore_timestamps(transcription_data, time_map)
+
+def _archive_and_upload(wav_path, timings):
+    """Encode the archival copy (AUDIO_ARCHIVE_FORMAT) and store it in GCS."""
+    archive_path, content_type = _timed(timings, 'encode_archive', encode_archive, wav_path)
+    try:
+        return _timed(timings, 'upload', upload_audio, archive_path, content_type)
+    finally:
+        if archive_path != wav_path:
+            os.remove(archive_path)
+
+def _timed(timings, stage, func, *args):
+    """Run one pipeline stage, recording its duration under timings[stage]."""
+    started = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        timings[stage] = round(time.monotonic() - started, 3)
+        metrics_service.observe("transcription_stage_seconds", timings[stage], stage=stage)
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value cache with age (TTL) and size (LRU) eviction.
+
+    Values are stored as JSON. Errors are logged and treated as misses, so a
+    broken cache file never fails the caller.
+    """
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS entries (
+                            key TEXT PRIMARY KEY,
+                            value TEXT NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL
+                        )""")
+                    conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def get(self, key):
+        """Return the stored value, or None on a miss or an expired entry."""
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key):
+        """
+        Return (value, created_at) for a stored entry, so callers keeping
+        their own copy can expire it with the original age; None on a miss
+        or an expired entry.
+        """
+        try:
+            conn = self._connect()
+            try:
+                now = time.time()
+                row = conn.execute("SELECT value, created_at FROM entries WHERE key = ? AND created_at >= ?",
+                                   (key, now - self.ttl)).fetchone()
+                if row:
+                    conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                    conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Cache lookup in {self.path} failed: {str(e)}")
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key, value):
+        """Store a value, then evict expired and least recently used entries."""
+        try:
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute("INSERT OR REPLACE INTO entries (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(value), now, now))
+                conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+                conn.execute("""
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_entries,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Cache store in {self.path} failed: {str(e)}")
@@ -0,0 +1,76 @@
+import datetime
+from functools import lru_cache
+
+try:
+    from dateutil import parser as dateutil_parser
+except ImportError:  # dateutil is optional; only the fast path and fromisoformat are used then
+    dateutil_parser = None
+
+UTC = datetime.timezone.utc
+
+# Canonical booking schedule format written by the booking routes,
+# e.g. "2025-03-10T06:00:00Z" or "2025-03-10T06:00:00.123456Z".
+_CANONICAL_LENGTHS = (20, 27)
+
+
+def _fast_parse(value):
+    """Parse the canonical UTC format with a shape check and the C fromisoformat."""
+    if len(value) not in _CANONICAL_LENGTHS or value[-1] != "Z" or value[10] != "T":
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value[:-1] + "+00:00")
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _fallback_parse(value, naive_as_local):
+    """Generic parsing for non-canonical strings, memoized per (value, naive policy)."""
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        if dateutil_parser is None:
+            return None
+        try:
+            parsed = dateutil_parser.parse(value)
+        except (ValueError, OverflowError):
+            return None
+
+    if parsed.tzinfo is None:
+        # Naive values are either treated as server-local time or as UTC
+        parsed = parsed.astimezone() if naive_as_local else parsed.replace(tzinfo=UTC)
+    return parsed.astimezone(UTC)
+
+
+def parse_schedule(value, naive_as_local=False):
+    """
+    Parse a booking schedule string into a timezone-aware UTC datetime.
+
+    Args:
+        value (str): Schedule string, ideally in the canonical "...Z" format
+        naive_as_local (bool): Interpret values without an offset as server-local
+            time instead of UTC
+
+    Returns:
+        datetime: Aware UTC datetime, or None if the value cannot be parsed
+    """
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    return _fast_parse(value) or _fallback_parse(value, naive_as_local)
+
+
+def format_schedule(dt):
+    """Format an aware datetime in the canonical UTC schedule format."""
+    return dt.astimezone(UTC).isoformat().replace("+00:00", "Z")
+
+
+def normalize_schedule(value, naive_as_local=False):
+    """Return the canonical form of a schedule string, or None if it cannot be parsed."""
+    parsed = parse_schedule(value, naive_as_local)
+    return format_schedule(parsed) if parsed else None
+
+
+def cache_info():
+    """Expose the fallback cache statistics (hits, misses, size)."""
+    return _fallback_parse.cache_info()
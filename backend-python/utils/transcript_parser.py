@@ -0,0 +1,87 @@
+import re
+
+# Diarized lines as written by the AssemblyAI service, e.g. "Speaker A: Hello"
+_TURN_RE = re.compile(r"^Speaker ([A-Za-z0-9]+): ?(.*)$")
+
+
+def split_turns(text):
+    """
+    Split a diarized transcript into speaker turns.
+
+    Lines that do not start a turn are kept with the turn before them; any
+    text ahead of the first turn is returned separately.
+
+    Args:
+        text (str): Transcript with "Speaker X: ..." lines
+
+    Returns:
+        tuple: (preamble, turns) where turns is a list of (speaker, text)
+    """
+    preamble = []
+    turns = []
+    for line in text.splitlines():
+        match = _TURN_RE.match(line)
+        if match:
+            turns.append([match.group(1), match.group(2)])
+        elif turns:
+            turns[-1][1] += "\n" + line
+        else:
+            preamble.append(line)
+    return "\n".join(preamble), [tuple(turn) for turn in turns]
+
+
+def format_turns(turns, labels=None):
+    """
+    Render turns back into "Label: text" lines.
+
+    Args:
+        turns (list): (speaker, text) pairs from split_turns
+        labels (dict): speaker -> label; speakers without one keep "Speaker X"
+    """
+    labels = labels or {}
+    return "\n".join(f"{labels.get(speaker, f'Speaker {speaker}')}: {text}" for speaker, text in turns)
+
+
+def chunk_turns(turns, max_chars, overlap_turns=0):
+    """
+    Group consecutive turns into chunks of at most max_chars characters.
+
+    Each chunk after the first repeats the last overlap_turns turns of the
+    one before it, so every chunk has some context. A turn longer than
+    max_chars makes up a chunk on its own.
+
+    Returns:
+        list: Lists of (speaker, text) pairs
+    """
+    chunks = []
+    start = 0
+    while start < len(turns):
+        end = start
+        size = 0
+        while end < len(turns) and (end == start or size + len(turns[end][1]) <= max_chars):
+            size += len(turns[end][1])
+            end += 1
+        chunks.append(turns[start:end])
+        if end == len(turns):
+            break
+        # Step back for overlap, but always make progress
+        start = max(end - overlap_turns, start + 1)
+    return chunks
+
+
+def role_labels(turns, teacher):
+    """
+    Labels for every speaker once the teacher is known.
+
+    The other speakers are students: "Student" when there is one, otherwise
+    "Student 1", "Student 2", ... in order of first appearance.
+
+    Returns:
+        dict: speaker -> label
+    """
+    speakers = list(dict.fromkeys(speaker for speaker, _ in turns))
+    students = [speaker for speaker in speakers if speaker != teacher]
+    labels = {teacher: "Teacher"}
+    for number, speaker in enumerate(students, start=1):
+        labels[speaker] = "Student" if len(students) == 1 else f"Student {number}"
+    return labels
@@ -2,6 +2,7 @@ import React, { useContext, useEffect, useState, useRef, useCallback } from 'rea
 import { NotificationContext } from '../context/NotificationContext';
 import { markAllNotificationsAsRead, debugNotificationContext, getStoredNotifications } from '../utils/notificationHelpers';
 import io from 'socket.io-client';
+import { socketAuth } from '../utils/authUtils';
 
 const NotificationTray = ({ isVisible, onClose, position }) => {
   const notificationContext = useContext(NotificationContext);
@@ -16,6 +17,7 @@ const NotificationTray = ({ isVisible, onClose, position }) => {
     
     if (!socketRef.current) {
       socketRef.current = io(SOCKET_SERVER_URL, {
+        auth: socketAuth,
         reconnection: true,
         reconnectionDelay: 1000,
         reconnectionAttempts: 5,
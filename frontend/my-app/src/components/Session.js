@@ -6,6 +6,115 @@ import { ReactComponent as MicrophoneIcon } from "./icons/microphone.svg";
 import { ReactComponent as MicrophoneSlashIcon } from "./icons/microphoneSlash.svg";
 import AnimatedBackground from "./AnimatedBackground";
 import AssessmentModal from "./AssessmentModal";
+import { useSocket } from "../hooks/useSocket";
+
+// How often to check on a queued transcription job
+const TRANSCRIPTION_POLL_MS = 2000;
+
+const UPLOADS_URL = "http://localhost:5001/consultation/uploads";
+const UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024;
+const UPLOAD_CHUNK_RETRIES = 3;
+const UPLOAD_BUSY_RETRIES = 30;
+
+// While recording, audio is sent over the socket in pieces of this length so
+// the server can transcribe it as the session runs
+const LIVE_CHUNK_MS = 1000;
+const LIVE_STOP_TIMEOUT_MS = 120000;
+
+// Same text for the transcription job and /summarize, so the server can
+// answer one from the other's cached result
+const formatSessionNotes = (notes) =>
+  `Concern: ${notes.concern}\nAction Taken: ${notes.actionTaken}\nOutcome: ${
+    notes.outcome
+  }\nRemarks: ${notes.remarks || "No remarks"}`;
+
+// Reads a /summarize/stream response, calling onText with the summary so far
+// as server-sent events arrive, and returns the final summary.
+const readSummaryStream = async (response, onText) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      throw new Error("Summary stream ended early");
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = (message.match(/^event: (.*)$/m) || [])[1];
+      const data = JSON.parse((message.match(/^data: (.*)$/m) || [])[1] || "{}");
+      if (event === "delta") {
+        text += data.text;
+        onText(text);
+      } else if (event === "done") {
+        onText(data.summary);
+        return data.summary;
+      } else if (event === "error") {
+        throw new Error(data.error || "Summary generation failed");
+      }
+    }
+  }
+};
+
+// Sends a recording with the chunked upload protocol and returns the transcription job ID.
+// A failed chunk is retried from wherever the server says the upload stands.
+const uploadInChunks = async (blob, params) => {
+  const initResponse = await fetch(UPLOADS_URL, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(params),
+  });
+  if (!initResponse.ok) {
+    throw new Error("Audio upload and transcription failed");
+  }
+  const { upload_id: uploadId, max_chunk_bytes: maxChunkBytes } = await initResponse.json();
+  const chunkBytes = Math.min(UPLOAD_CHUNK_BYTES, maxChunkBytes || UPLOAD_CHUNK_BYTES);
+  const totalChunks = Math.ceil(blob.size / chunkBytes);
+
+  let index = 0;
+  let failures = 0;
+  while (index < totalChunks) {
+    try {
+      const response = await fetch(`${UPLOADS_URL}/${uploadId}/chunks/${index}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream" },
+        body: blob.slice(index * chunkBytes, (index + 1) * chunkBytes),
+      });
+      if (!response.ok && response.status !== 409) {
+        throw new Error(`Chunk ${index} failed with status ${response.status}`);
+      }
+      // 200 and 409 both report the chunk the server expects next
+      index = (await response.json()).next_chunk;
+      failures = 0;
+    } catch (error) {
+      failures += 1;
+      if (failures > UPLOAD_CHUNK_RETRIES) throw error;
+      console.warn(`Retrying upload from the server's position (attempt ${failures}):`, error);
+      await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+      const statusResponse = await fetch(`${UPLOADS_URL}/${uploadId}`).catch(() => null);
+      if (statusResponse && statusResponse.ok) {
+        index = (await statusResponse.json()).next_chunk;
+      }
+    }
+  }
+
+  // The server answers 429 + Retry-After while its audio converters are saturated
+  let finalizeResponse = await fetch(`${UPLOADS_URL}/${uploadId}/finalize`, { method: "POST" });
+  for (let attempt = 0; finalizeResponse.status === 429 && attempt < UPLOAD_BUSY_RETRIES; attempt++) {
+    const retryAfter = parseInt(finalizeResponse.headers.get("Retry-After"), 10) || 10;
+    console.warn(`Server busy converting audio; retrying in ${retryAfter}s`);
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+    finalizeResponse = await fetch(`${UPLOADS_URL}/${uploadId}/finalize`, { method: "POST" });
+  }
+  if (!finalizeResponse.ok) {
+    throw new Error("Audio upload and transcription failed");
+  }
+  return (await finalizeResponse.json()).job_id;
+};
 
 const Session = () => {
   const [teacherId, setTeacherId] = useState("");
@@ -30,6 +139,10 @@ const Session = () => {
 
   const audioRef = useRef(null);
   const mediaRecorderRef = useRef(null);
+  // { sessionId, seq, chain, failed } while the recording is transcribed live
+  const liveRef = useRef(null);
+  const { isConnected: socketConnected, request: socketRequest, emit: socketEmit } =
+    useSocket("http://localhost:5001");
   const audioChunksRef = useRef([]);
   const timerIntervalRef = useRef(null);
   const navigate = useNavigate();
@@ -141,9 +254,11 @@ const Session = () => {
         });
         mediaRecorderRef.current = new MediaRecorder(stream);
         audioChunksRef.current = [];
+        await startLiveTranscription();
 
         mediaRecorderRef.current.ondataavailable = (event) => {
           audioChunksRef.current.push(event.data);
+          sendLiveChunk(event.data);
         };
 
         mediaRecorderRef.current.onstop = () => {
@@ -154,7 +269,7 @@ const Session = () => {
           }
         };
 
-        mediaRecorderRef.current.start();
+        mediaRecorderRef.current.start(LIVE_CHUNK_MS);
       }
       setRecording(true);
       startTimer();
@@ -183,6 +298,89 @@ const Session = () => {
     stopTimer();
   };
 
+  // Live transcription: the server transcribes the recording while it is
+  // made. Any failure falls back to uploading the whole recording at the end.
+  const startLiveTranscription = async () => {
+    abortLiveTranscription();
+    if (!socketConnected) {
+      return;
+    }
+    try {
+      const ack = await socketRequest("live_transcription_start", {
+        speaker_count: 1 + studentIds.split(",").filter((id) => id.trim() !== "").length,
+      });
+      if (ack && ack.session_id) {
+        liveRef.current = { sessionId: ack.session_id, seq: 0, chain: Promise.resolve(), failed: false };
+      } else {
+        console.log("Live transcription unavailable:", ack && ack.error);
+      }
+    } catch (error) {
+      console.log("Live transcription unavailable:", error);
+    }
+  };
+
+  const sendLiveChunk = (data) => {
+    const live = liveRef.current;
+    if (!live || live.failed) {
+      return;
+    }
+    const seq = live.seq++;
+    // Chunks must reach the server in order, so each waits for the previous ack
+    live.chain = live.chain
+      .then(async () => {
+        if (live.failed) {
+          return;
+        }
+        const ack = await socketRequest("live_transcription_chunk", {
+          session_id: live.sessionId,
+          seq,
+          audio: await data.arrayBuffer(),
+        });
+        if (ack.error) {
+          throw new Error(ack.error);
+        }
+      })
+      .catch((error) => {
+        console.error("Live transcription failed, will upload instead:", error);
+        live.failed = true;
+      });
+  };
+
+  const abortLiveTranscription = () => {
+    if (liveRef.current) {
+      socketEmit("live_transcription_abort", { session_id: liveRef.current.sessionId });
+      liveRef.current = null;
+    }
+  };
+
+  // Returns the transcription job ID for a live session, or null if it failed
+  const finishLiveTranscription = async (notes) => {
+    const live = liveRef.current;
+    if (!live) {
+      return null;
+    }
+    await live.chain;
+    if (live.failed) {
+      abortLiveTranscription();
+      return null;
+    }
+    liveRef.current = null;
+    try {
+      const ack = await socketRequest(
+        "live_transcription_stop",
+        { session_id: live.sessionId, notes: notes ? formatSessionNotes(notes) : undefined },
+        LIVE_STOP_TIMEOUT_MS
+      );
+      if (ack.job_id) {
+        return ack.job_id;
+      }
+      console.error("Live transcription failed, uploading instead:", ack.error);
+    } catch (error) {
+      console.error("Live transcription failed, uploading instead:", error);
+    }
+    return null;
+  };
+
   const toggleMicrophone = () => {
     // Only allow toggling microphone when not recording
     if (!recording) {
@@ -191,10 +389,7 @@ const Session = () => {
   };
 
   // Audio upload function - modify to save quality metrics
-  const uploadAudio = async (audioBlob) => {
-    const formData = new FormData();
-    formData.append("audio", audioBlob, "session-audio.webm");
-
+  const uploadAudio = async (audioBlob, notes) => {
     // Calculate speaker count dynamically based on participants.
     const teacherIdElement = teacherId.trim();
     const studentIdsElement = studentIds.trim();
@@ -203,30 +398,45 @@ const Session = () => {
       .filter((id) => id.trim() !== "");
 
     const expectedSpeakers = 1 + studentIdsArray.length; // Teacher + students
-    formData.append("speaker_count", expectedSpeakers);
 
     console.log(`Calculated speaker count: ${expectedSpeakers}`);
 
-    const response = await fetch(
-      "http://localhost:5001/consultation/transcribe",
-      {
-        method: "POST",
-        body: formData,
+    // Transcribed live while recording: only the tail is left to finish.
+    // Otherwise upload in resumable chunks; the server converts as they arrive.
+    const jobId =
+      (await finishLiveTranscription(notes)) ||
+      (await uploadInChunks(audioBlob, {
+        speaker_count: expectedSpeakers,
+        userID: localStorage.getItem("userId") || undefined,
+        // Lets the job write the summary in the same Gemini request as the roles
+        notes: notes ? formatSessionNotes(notes) : undefined,
+      }));
+    console.log(`Transcription job ${jobId} queued`);
+
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, TRANSCRIPTION_POLL_MS));
+      const statusResponse = await fetch(
+        `http://localhost:5001/consultation/transcribe/${jobId}`
+      );
+      if (!statusResponse.ok) {
+        throw new Error("Could not check transcription status");
       }
-    );
-
-    if (!response.ok) {
-      throw new Error("Audio upload and transcription failed");
+      const job = await statusResponse.json();
+      if (job.status === "done") {
+        console.log("Audio uploaded and transcription received:", job.result);
+        return job.result;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Audio upload and transcription failed");
+      }
+      console.log(`Transcription job ${jobId}: ${job.stage} (${job.progress}%)`);
     }
-
-    const data = await response.json();
-    console.log("Audio uploaded and transcription received:", data);
-    return data;
   };
 
   // Finish session creates the consultation record and then returns a sessionID.
   const finishSession = async () => {
     setProcessing(true);
+    setSummary("");
 
     // Add debug logging for required fields
     console.log("Checking required fields:", {
@@ -251,28 +461,41 @@ const Session = () => {
     let qualityScore = 0;
     let qualityMetrics = {};
     let rawSentimentAnalysis = [];
+    let jobSummary = null;
+    const sessionNotes = {
+      concern,
+      actionTaken: action_taken,
+      outcome,
+      remarks,
+    };
     
     if (audioBlob) {
       try {
-        const audioUploadResponse = await uploadAudio(audioBlob);
+        const audioUploadResponse = await uploadAudio(audioBlob, sessionNotes);
         transcriptionText = audioUploadResponse.transcription || "";
         audioUrl = audioUploadResponse.audioUrl || "";
         // Save quality data from transcription response
         qualityScore = audioUploadResponse.quality_score || 0;
         qualityMetrics = audioUploadResponse.quality_metrics || {};
         rawSentimentAnalysis = audioUploadResponse.raw_sentiment_analysis || [];
+        jobSummary = audioUploadResponse.summary || null;
       } catch (error) {
         console.error("Error uploading audio:", error);
         alert("Audio upload failed. Proceeding without transcription.");
       }
     }
 
-    const generatedSummary = await generateSummary(transcriptionText, {
-      concern,
-      actionTaken: action_taken,
-      outcome,
-      remarks,
-    });
+    let generatedSummary = jobSummary;
+    if (!generatedSummary) {
+      try {
+        generatedSummary = await generateSummary(transcriptionText, sessionNotes);
+      } catch (error) {
+        // Still store the consultation; the summary says what went wrong,
+        // as /summarize reports its own failures
+        console.error("Error generating summary:", error);
+        generatedSummary = `Error generating summary: ${error.message}`;
+      }
+    }
 
     setSummary(generatedSummary);
 
@@ -320,6 +543,7 @@ const Session = () => {
         const errorData = await response.json();
         console.error("Server validation error:", errorData); // Add this debug log
         alert(`Failed to store consultation: ${errorData.error}`);
+        setProcessing(false);
         return;
       }
 
@@ -344,20 +568,36 @@ const Session = () => {
     setProcessing(false);
   };
 
+  // Streams the summary into the processing overlay as Gemini writes it.
+  // If the stream fails, asks /summarize once for the whole summary.
   const generateSummary = async (transcription, notes) => {
+    const body = JSON.stringify({
+      transcription: transcription || "No transcription available.",
+      notes: formatSessionNotes(notes),
+    });
+    try {
+      const response = await fetch(
+        "http://localhost:5001/consultation/summarize/stream",
+        {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body,
+        }
+      );
+      if (!response.ok) {
+        throw new Error("Summary generation failed");
+      }
+      return await readSummaryStream(response, setSummary);
+    } catch (error) {
+      console.warn("Streamed summary failed, retrying without streaming:", error);
+      setSummary("");
+    }
     const response = await fetch(
       "http://localhost:5001/consultation/summarize",
       {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          transcription: transcription || "No transcription available.",
-          notes: `Concern: ${notes.concern}\nAction Taken: ${
-            notes.actionTaken
-          }\nOutcome: ${notes.outcome}\nRemarks: ${
-            notes.remarks || "No remarks"
-          }`,
-        }),
+        body,
       }
     );
     if (!response.ok) {
@@ -430,8 +670,15 @@ const Session = () => {
       <AnimatedBackground />
       {processing && (
         <div className="fixed top-0 left-0 w-full h-full bg-black bg-opacity-50 flex items-center justify-center z-50">
-          <div className="text-white text-xl sm:text-2xl">
-            Processing Consultation...
+          <div className="max-w-2xl px-4 text-center">
+            <div className="text-white text-xl sm:text-2xl">
+              Processing Consultation...
+            </div>
+            {summary && (
+              <p className="mt-4 text-white/90 text-sm sm:text-base whitespace-pre-line">
+                {summary}
+              </p>
+            )}
           </div>
         </div>
       )}
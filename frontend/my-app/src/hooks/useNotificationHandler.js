@@ -1,6 +1,7 @@
 import { useEffect, useCallback } from 'react';
 import { showNotification } from '../utils/notificationUtils';
 import { formatDistanceToNow, format } from 'date-fns';
+import { resolveNotification } from '../utils/notificationHelpers';
 
 /**
  * Custom hook to handle incoming notification data
@@ -12,8 +13,8 @@ const useNotificationHandler = (socket, addNotification) => {
   const handleNotification = useCallback((data) => {
     console.log("Received raw notification:", data);
     
-    // Deep clone the data to avoid mutations
-    const notificationData = JSON.parse(JSON.stringify(data));
+    // Deep clone the data to avoid mutations, filling names for compact payloads
+    const notificationData = resolveNotification(JSON.parse(JSON.stringify(data)));
     
     // Generate an ID for the notification if none exists
     const notificationWithId = { 
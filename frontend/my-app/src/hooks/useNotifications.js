@@ -1,8 +1,10 @@
 import { useState, useEffect, useRef, useCallback, useContext } from 'react';
 import io from 'socket.io-client';
+import { socketAuth } from '../utils/authUtils';
 import notificationSound from '../components/audio/notification.mp3';
 import { showNotification, areNotificationsEnabled, fixNotificationPreferences, playNotificationSound } from '../utils/notificationUtils';
 import { NotificationContext } from '../context/NotificationContext';
+import { resolveNotification } from '../utils/notificationHelpers';
 
 const SOCKET_SERVER_URL = "http://localhost:5001";
 
@@ -122,14 +124,31 @@ const useNotifications = () => {
   
     // Create a new socket with better connection options
     socketRef.current = io(SOCKET_SERVER_URL, {
+      auth: socketAuth,
       reconnection: true,
       reconnectionDelay: 1000,
       reconnectionAttempts: 5,
       timeout: 10000 // Increase timeout to 10 seconds
     });
   
+    // Highest notification sequence number seen, so a reconnect only replays the gap
+    const seqKey = `notificationSeq:${currentUserId || currentUserEmail}`;
+    const readLastSeq = () => {
+      const value = parseInt(localStorage.getItem(seqKey), 10);
+      return Number.isNaN(value) ? null : value;
+    };
+    const rememberSeq = (seq) => {
+      if (typeof seq !== 'number') return;
+      const lastSeq = readLastSeq();
+      if (lastSeq === null || seq > lastSeq) localStorage.setItem(seqKey, String(seq));
+    };
+    const seenSeqs = new Set();
+    let replayFrom = null;
+  
     socketRef.current.on('connect', () => {
       console.log('⚡ Socket connected for notifications');
+      replayFrom = readLastSeq();
+      socketRef.current.emit('replay_notifications', { lastSeq: replayFrom });
     });
   
     socketRef.current.on('disconnect', () => {
@@ -156,10 +175,56 @@ const useNotifications = () => {
       }
     }, 60000); // Check every minute
     
+    // Comprehensive identity check - the notification must explicitly target this user
+    const isForCurrentUser = (data) =>
+      // Check all possible targeting methods
+      (data.targetEmail && data.targetEmail === currentUserEmail) ||
+      (data.targetUserId && data.targetUserId === currentUserId) ||
+      (data.targetTeacherId && currentTeacherId && data.targetTeacherId === currentTeacherId) ||
+      (data.targetStudentId && currentStudentId && data.targetStudentId === currentStudentId) ||
+      // For backwards compatibility, check if notification includes required role
+      (data.targetRole && data.targetRole === currentRole);
+    
+    // Several events the server coalesced into one emit: each is checked on its
+    // own, and more than one targeted event is shown as a single summary
+    const handleBatch = (data) => {
+      data.events.forEach(event => {
+        if (typeof event.seq === 'number') seenSeqs.add(event.seq);
+      });
+      const targeted = data.events.filter(isForCurrentUser);
+      console.log(`Batch of ${data.events.length} notification(s), ${targeted.length} for current user`);
+      if (targeted.length === 1) {
+        processNotification(resolveNotification(targeted[0]), currentRole);
+      } else if (targeted.length > 1) {
+        const bookingIDs = [...new Set(targeted.map(event => event.bookingID).filter(Boolean))];
+        processNotification({
+          ...data,
+          events: targeted.map(resolveNotification),
+          count: targeted.length,
+          bookingIDs,
+          bookingID: bookingIDs.length === 1 ? bookingIDs[0] : undefined,
+          message: bookingIDs.length
+            ? `${bookingIDs.length} ${bookingIDs.length === 1 ? 'booking' : 'bookings'} changed`
+            : `${targeted.length} new notifications`
+        }, currentRole);
+      }
+    };
+    
     // Add notification handler code
-    socketRef.current.on('notification', (data) => {
+    const handleIncoming = (data) => {
       console.log('📬 Notification received:', data);
       
+      if (typeof data.seq === 'number') {
+        if (seenSeqs.has(data.seq)) return;
+        seenSeqs.add(data.seq);
+        rememberSeq(data.seq);
+      }
+      
+      if (data.action === 'batch' && Array.isArray(data.events)) {
+        handleBatch(data);
+        return;
+      }
+      
       // Rest of your notification handling code...
       // Generate a unique key for this notification based on content
       const notificationKey = `${data.action}_${data.bookingID || ''}_${data.teacherId || data.teacherID || ''}_${data.targetStudentId || ''}`;
@@ -180,15 +245,7 @@ const useNotifications = () => {
         [notificationKey]: Date.now()
       }));
       
-      // Comprehensive identity check - the notification must explicitly target this user
-      const isTargetedNotification = 
-        // Check all possible targeting methods
-        (data.targetEmail && data.targetEmail === currentUserEmail) ||
-        (data.targetUserId && data.targetUserId === currentUserId) ||
-        (data.targetTeacherId && currentTeacherId && data.targetTeacherId === currentTeacherId) ||
-        (data.targetStudentId && currentStudentId && data.targetStudentId === currentStudentId) ||
-        // For backwards compatibility, check if notification includes required role
-        (data.targetRole && data.targetRole === currentRole);
+      const isTargetedNotification = isForCurrentUser(data);
 
       // Log targeting information
       console.log('Notification targeting check:', {
@@ -207,7 +264,21 @@ const useNotifications = () => {
       }
       
       // Process notification and show it...
-      processNotification(data, currentRole);
+      processNotification(resolveNotification(data), currentRole);
+    };
+    
+    socketRef.current.on('notification', handleIncoming);
+    
+    // Notifications sent while this client was disconnected, oldest first
+    socketRef.current.on('notification_replay', ({ events = [], seq, truncated }) => {
+      console.log(`Replaying ${events.length} missed notification(s)`);
+      if (truncated) {
+        console.warn('More notifications were missed than the server replays; only the latest are shown');
+      }
+      events
+        .filter(event => replayFrom === null || event.seq > replayFrom)
+        .forEach(handleIncoming);
+      rememberSeq(seq);
     });
   
     // Cleanup on unmount
@@ -217,6 +288,7 @@ const useNotifications = () => {
       
       if (socketRef.current) {
         socketRef.current.off('notification');
+        socketRef.current.off('notification_replay');
         socketRef.current.disconnect();
       }
     };
@@ -342,6 +414,12 @@ const useNotifications = () => {
           (data.venue ? ` in ${data.venue}` : "") + ".";
       }
     }
+    else if (data.action === 'batch') {
+      notificationTitle = data.bookingIDs && data.bookingIDs.length
+        ? "Appointment Updates"
+        : `${data.count} New Notifications`;
+      composedMessage = data.message || `${data.count} new notifications`;
+    }
     else {
       notificationTitle = "New Notification";
       composedMessage = data.message || "New notification";
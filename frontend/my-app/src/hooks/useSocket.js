@@ -1,5 +1,6 @@
 import { useEffect, useRef, useState, useCallback } from 'react';
 import io from 'socket.io-client';
+import { socketAuth } from '../utils/authUtils';
 import { queryClient } from '../utils/queryConfig';
 
 // Singleton socket instance
@@ -17,6 +18,7 @@ export function useSocket(url) {
     if (!socketInstance && url) {
       console.log('🔌 Creating new socket connection');
       socketInstance = io(url, {
+        auth: socketAuth,
         transports: ['websocket'],
         reconnection: true,
         // Reduce unnecessary ping/pong traffic
@@ -135,6 +137,22 @@ export function useSocket(url) {
         socketRef.current.emit(event, data);
       }
     }, []),
+    // Emit and wait for the server's acknowledgement
+    request: useCallback((event, data, timeoutMs = 10000) => {
+      return new Promise((resolve, reject) => {
+        if (!socketRef.current || !socketRef.current.connected) {
+          reject(new Error('Socket not connected'));
+          return;
+        }
+        socketRef.current.timeout(timeoutMs).emit(event, data, (err, response) => {
+          if (err) {
+            reject(err);
+          } else {
+            resolve(response);
+          }
+        });
+      });
+    }, []),
     updateQueryData
   };
 }
@@ -57,6 +57,9 @@ export const storeUserAuth = (userData, role) => {
     localStorage.setItem("adminId", primaryId);
   }
   
+  // Token the socket presents on connect to join this user's notification rooms
+  if (userData.socketToken) localStorage.setItem("socketToken", userData.socketToken);
+
   // Store additional data
   if (userData.firstName) localStorage.setItem("firstName", userData.firstName);
   if (userData.lastName) localStorage.setItem("lastName", userData.lastName);
@@ -96,6 +99,14 @@ export const clearUserAuth = () => {
   });
 };
 
+/**
+ * Socket.IO `auth` option; evaluated on every (re)connect so it picks up a fresh token
+ * @param {Function} cb - Socket.IO auth callback
+ */
+export const socketAuth = (cb) => {
+  cb({ token: localStorage.getItem("socketToken") });
+};
+
 /**
  * Checks if the user is authenticated
  * @returns {boolean} Authentication status
@@ -5,6 +5,7 @@
 
 import { showNotification } from './notificationUtils';
 import io from 'socket.io-client';
+import { socketAuth } from './authUtils';
 
 const SOCKET_SERVER_URL = "http://localhost:5001";
 
@@ -58,7 +59,7 @@ export const runNotificationDiagnostic = async () => {
   // Step 3: Test socket connection
   try {
     console.log('🔌 Testing Socket.IO connection...');
-    const socket = io(SOCKET_SERVER_URL, { timeout: 5000 });
+    const socket = io(SOCKET_SERVER_URL, { auth: socketAuth, timeout: 5000 });
     
     await new Promise((resolve, reject) => {
       const timeout = setTimeout(() => {
@@ -2,6 +2,36 @@
  * Utility functions for managing notifications outside of the context
  * These provide fallbacks in case context functions are unavailable
  */
+import { queryClient } from './queryConfig';
+
+/**
+ * Fills display fields of a compact (v2) notification from the cached bookings.
+ * Compact payloads only carry IDs; names come from the ['bookings'] queries.
+ * @param {Object} data - Notification payload as received from the socket
+ * @returns {Object} Payload with teacherName / studentNames when they could be resolved
+ */
+export const resolveNotification = (data) => {
+  if (!data || !(data.v >= 2) || !data.bookingID) return data;
+
+  try {
+    for (const [, bookings] of queryClient.getQueriesData('bookings')) {
+      const booking = Array.isArray(bookings) && bookings.find(b => b.id === data.bookingID);
+      if (booking) {
+        const studentNames = Array.isArray(booking.studentNames)
+          ? booking.studentNames.join(", ")
+          : booking.studentNames;
+        return {
+          ...data,
+          teacherName: data.teacherName || booking.teacherName,
+          studentNames: data.studentNames || studentNames,
+        };
+      }
+    }
+  } catch (error) {
+    console.error("Error resolving notification from booking cache:", error);
+  }
+  return data;
+};
 
 /**
  * Marks all notifications as read in local storage